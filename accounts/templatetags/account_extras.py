@@ -9,8 +9,8 @@ def currency(value):
     if value is None:
         return "0.00"
     try:
-        return f"{float(value):.2f}"
-    except (ValueError, TypeError):
+        return f"{Decimal(str(value)):.2f}"
+    except (ArithmeticError, ValueError, TypeError):
         return "0.00"
 
 @register.filter
@@ -1,3 +1,45 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+
+from orders.loading import ORDER_QUERIES
+from orders.models import Order
+from orders.tests import make_order, make_products
+
+# order_detail on top of loading the order: the session, the user, and the
+# base template's cart badge and vendor menu
+ORDER_DETAIL_QUERIES = ORDER_QUERIES + 4
+# customer_profile: the session, the user, the summary figures, one page of
+# history, and the base template's queries
+PROFILE_QUERIES = 6
+
+
+class OrderPageQueryTests(TestCase):
+    """The account order pages cost the same queries however big the orders and history are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = make_products(100, price=Decimal('10.00'))
+        cls.customer = User.objects.create(username='account-customer', email='account@example.com')
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+
+    def test_order_detail(self):
+        for size in (1, 100):
+            order = make_order(self.products[:size], user=self.customer, status='processing')
+            with self.subTest(lines=size), self.assertNumQueries(ORDER_DETAIL_QUERIES):
+                response = self.client.get(reverse('accounts:order_detail', args=[order.id]))
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, self.products[size - 1].name)
 
-# Create your tests here.
+    def test_profile_order_history(self):
+        for count in (1, 20):
+            while Order.objects.filter(user=self.customer).count() < count:
+                make_order(self.products[:3], user=self.customer, paid=True, status='paid')
+            with self.subTest(orders=count), self.assertNumQueries(PROFILE_QUERIES):
+                response = self.client.get(reverse('accounts:profile'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['total_orders'], count)
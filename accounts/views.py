@@ -5,11 +5,20 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
 from django.db import transaction, models
 from django.http import Http404
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
 
 from .forms import UserRegisterForm, VendorRegisterForm, UserEditForm
+from orders import loading
+from orders.loading import load_order
 from orders.models import Order
+from orders.reservations import release
+from shop.pagination import CursorPaginator
+
+ORDERS_PER_PAGE = 20
 
 
 @transaction.atomic
@@ -98,23 +107,22 @@ def logout_view(request):
 
 @login_required
 def customer_profile(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user)
     
-    total_orders = orders.count()
-    completed_orders = orders.filter(paid=True).count()
-    pending_orders = orders.filter(paid=False).count()
+    # Every summary figure in one pass; total_spent stays a Decimal
+    stats = orders.aggregate(
+        total_orders=Count('id'),
+        completed_orders=Count('id', filter=Q(paid=True)),
+        pending_orders=Count('id', filter=Q(paid=False)),
+        total_spent=Coalesce(Sum('total_paid', filter=Q(paid=True)), Value(Decimal('0')),
+                             output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
     
-    # Calculate total spent from paid orders only
-    total_spent = 0
-    for order in orders.filter(paid=True):
-        total_spent += float(order.total_paid)
+    paginator = CursorPaginator(loading.history(request.user), loading.HISTORY_ORDERING, per_page=ORDERS_PER_PAGE)
     
     context = {
-        'orders': orders,
-        'total_orders': total_orders,
-        'completed_orders': completed_orders,
-        'pending_orders': pending_orders,
-        'total_spent': total_spent,
+        'orders': paginator.page(request.GET.get('after')),
+        **stats,
     }
     return render(request, 'accounts/profile.html', context)
 
@@ -136,7 +144,7 @@ def edit_profile(request):
 @login_required
 def order_detail(request, order_id):
     try:
-        order = Order.objects.get(id=order_id, user=request.user)
+        order = load_order(id=order_id, user=request.user)
     except Order.DoesNotExist:
         raise Http404("Order not found")
         
@@ -159,11 +167,9 @@ def delete_order(request, order_id):
     if request.method == 'POST':
         order_id_copy = str(order.id)
         
-        for item in order.items.all():
-            item.product.stock_quantity += item.quantity
-            item.product.save()
-        
-        order.delete()
+        with transaction.atomic():
+            release(order)
+            order.delete()
         messages.success(request, f"Order #{order_id_copy[:8]} has been successfully cancelled and stock has been restored.")
         return redirect('accounts:profile')
     
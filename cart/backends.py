@@ -0,0 +1,161 @@
+"""
+Cart storage backends, selected with settings.CART_BACKEND.
+
+A backend stores cart lines as {product_id (str): {'quantity': int,
+'price': str}} for the current request's visitor. Cart keeps its own copy
+and hands the backend only the lines that changed. A line saved with a
+quantity below one is deleted rather than stored.
+"""
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from shop.models import Product
+
+from .models import CartItem
+
+CART_TOKEN_SESSION_KEY = 'cart_token'
+
+
+def get_backend(request):
+    return import_string(settings.CART_BACKEND)(request)
+
+
+class SessionCartBackend:
+    """The whole cart as one dict in the session"""
+    def __init__(self, request):
+        self.session = request.session
+
+    def load(self):
+        return dict(self.session.get(settings.CART_SESSION_ID) or {})
+
+    def save_lines(self, lines):
+        cart = self.session.get(settings.CART_SESSION_ID) or {}
+        for product_id, line in lines.items():
+            if line['quantity'] < 1:
+                cart.pop(product_id, None)
+            else:
+                cart[product_id] = line
+        self.session[settings.CART_SESSION_ID] = cart
+
+    def delete_lines(self, product_ids):
+        cart = self.session.get(settings.CART_SESSION_ID) or {}
+        for product_id in product_ids:
+            cart.pop(product_id, None)
+        self.session[settings.CART_SESSION_ID] = cart
+
+    def clear(self):
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+
+    def merge_anonymous_cart(self, user):
+        # The session, and the cart with it, already survives login
+        pass
+
+
+class DatabaseCartBackend:
+    """
+    One CartItem row per line, owned by the user or, for anonymous visitors,
+    by a random token kept in the session. Each change touches only the lines
+    involved, and logged-in carts outlive the session.
+    """
+    def __init__(self, request):
+        self.session = request.session
+        self.user = getattr(request, 'user', None)
+
+    def _owner(self, create=False):
+        if self.user is not None and self.user.is_authenticated:
+            return {'user': self.user}
+        token = self.session.get(CART_TOKEN_SESSION_KEY)
+        if token is None and create:
+            token = self.session[CART_TOKEN_SESSION_KEY] = uuid.uuid4().hex
+        return {'token': token} if token else None
+
+    def _stored(self):
+        owner = self._owner()
+        if owner is None:
+            return {}
+        return {
+            str(product_id): {'quantity': quantity, 'price': str(price)}
+            for product_id, quantity, price in
+            CartItem.objects.filter(**owner).values_list('product_id', 'quantity', 'price')
+        }
+
+    def _add_lines(self, lines):
+        """Save lines on top of the stored cart, adding up quantities of products already in it"""
+        if not lines:
+            return
+        existing = self._stored()
+        for product_id, line in lines.items():
+            if product_id in existing:
+                line['quantity'] += existing[product_id]['quantity']
+        self.save_lines(lines)
+
+    def _import_session_cart(self):
+        """
+        Move a cart SessionCartBackend left in the session into CartItem
+        rows, so switching backends doesn't empty carts already in progress.
+        Lines for products that no longer exist are dropped.
+        """
+        legacy = self.session.pop(settings.CART_SESSION_ID, None)
+        if not legacy:
+            return
+        lines = {}
+        for product_id, line in legacy.items():
+            try:
+                product_id, quantity = int(product_id), int(line['quantity'])
+                price = str(Decimal(line['price']))
+            except (KeyError, TypeError, ValueError, ArithmeticError):
+                continue
+            if quantity >= 1:
+                lines[str(product_id)] = {'quantity': quantity, 'price': price}
+        if lines:
+            existing = set(Product.objects.filter(id__in=[int(pk) for pk in lines]).values_list('id', flat=True))
+            self._add_lines({pk: line for pk, line in lines.items() if int(pk) in existing})
+
+    def load(self):
+        self._import_session_cart()
+        return self._stored()
+
+    def save_lines(self, lines):
+        # CartItem.quantity can't go below one; such lines are removed instead
+        self.delete_lines([pk for pk, line in lines.items() if line['quantity'] < 1])
+        lines = {pk: line for pk, line in lines.items() if line['quantity'] >= 1}
+        if not lines:
+            return
+        owner = self._owner(create=True)
+        CartItem.objects.bulk_create(
+            [
+                CartItem(product_id=int(product_id), quantity=line['quantity'],
+                         price=Decimal(line['price']), **owner)
+                for product_id, line in lines.items()
+            ],
+            update_conflicts=True,
+            unique_fields=[*owner, 'product'],
+            update_fields=['quantity', 'price', 'updated_at'],
+        )
+
+    def delete_lines(self, product_ids):
+        owner = self._owner()
+        if owner is not None and product_ids:
+            CartItem.objects.filter(product_id__in=[int(pk) for pk in product_ids], **owner).delete()
+
+    def clear(self):
+        owner = self._owner()
+        if owner is not None:
+            CartItem.objects.filter(**owner).delete()
+
+    def merge_anonymous_cart(self, user):
+        """Move the visitor's anonymous lines into user's cart, adding up quantities"""
+        token = self.session.pop(CART_TOKEN_SESSION_KEY, None)
+        if token is None:
+            return
+        self.user = user
+        anonymous = CartItem.objects.filter(token=token)
+        self._add_lines({
+            str(product_id): {'quantity': quantity, 'price': str(price)}
+            for product_id, quantity, price in anonymous.values_list('product_id', 'quantity', 'price')
+        })
+        anonymous.delete()
@@ -1,61 +1,112 @@
 from decimal import Decimal
-from django.conf import settings
 from shop.models import Product
+from .backends import get_backend
+
+# Columns the cart and checkout templates read from each product
+PRODUCT_FIELDS = ('name', 'slug', 'image', 'price', 'stock_quantity', 'vendor__shop_name')
+# Number of units in the cart, kept in the session for the cart badge
+CART_COUNT_SESSION_KEY = 'cart_count'
 
 class Cart:
     def __init__(self, request):
+        # Nothing is stored until something is added, so browsing without
+        # a cart never writes to the session or the database
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.backend = get_backend(request)
+        self.cart = self.backend.load()
+        self._length = None
+        self._lines = None
+        self._remember_count()
 
     def add(self, product, quantity=1, override_quantity=False):
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {'quantity': 0, 'price': str(product.price)}
-        
-        if override_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity
-        self.save()
-
-    def save(self):
-        self.session.modified = True
+        self.add_many([(product, quantity)], override_quantity)
+
+    def add_many(self, items, override_quantity=False):
+        """Add (product, quantity) pairs, or set their quantities with override_quantity"""
+        changed = {}
+        for product, quantity in items:
+            product_id = str(product.id)
+            line = self.cart.setdefault(product_id, {'quantity': 0, 'price': str(product.price)})
+            if override_quantity:
+                line['quantity'] = quantity
+            else:
+                line['quantity'] += quantity
+            changed[product_id] = line
+            if line['quantity'] < 1:
+                # The backend drops lines that fall below one unit
+                del self.cart[product_id]
+        self.backend.save_lines(changed)
+        self._changed()
 
     def remove(self, product):
-        product_id = str(product.id)
-        if product_id in self.cart:
+        self.remove_many([product])
+
+    def remove_many(self, products):
+        product_ids = [str(product.id) for product in products if str(product.id) in self.cart]
+        for product_id in product_ids:
             del self.cart[product_id]
-            self.save()
+        if product_ids:
+            self.backend.delete_lines(product_ids)
+            self._changed()
+
+    def _changed(self):
+        self._length = None
+        self._lines = None
+        self._remember_count()
+
+    def _remember_count(self):
+        """
+        Mirror len(self) into the session, so the page cache can key on the
+        badge count without loading the cart. An empty cart that was never
+        counted is left out of the session.
+        """
+        stored = self.session.get(CART_COUNT_SESSION_KEY)
+        if stored != len(self) and (stored is not None or len(self)):
+            self.session[CART_COUNT_SESSION_KEY] = len(self)
+
+    def lines(self):
+        """
+        Cart lines with their products, loaded with a single query the
+        first time they are needed and reused until the cart changes.
+        """
+        if self._lines is None:
+            products = (
+                Product.objects.select_related('vendor')
+                .only(*PRODUCT_FIELDS)
+                .filter(id__in=self.cart.keys())
+            )
+            product_map = {str(p.id): p for p in products}
+            self._lines = []
+            for product_id, item_data in self.cart.items():
+                product = product_map.get(product_id)
+                if product:
+                    # Lines are always priced from the catalog, not from the
+                    # price stored when the product was added
+                    price = product.price
+                    self._lines.append({
+                        'quantity': item_data['quantity'],
+                        'price': price,
+                        'product': product,
+                        'total_price': price * item_data['quantity'],
+                    })
+        return self._lines
 
     def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        product_map = {str(p.id): p for p in products}
-
-        for product_id, item_data in self.cart.items():
-            product = product_map.get(product_id)
-            if product:
-                yield {
-                    'quantity': item_data['quantity'],
-                    'price': Decimal(item_data['price']),
-                    'product': product,
-                    'total_price': Decimal(item_data['price']) * item_data['quantity']
-                }
+        return iter(self.lines())
 
     def __len__(self):
-        return sum(item['quantity'] for item in self.cart.values())
+        if self._length is None:
+            self._length = sum(item['quantity'] for item in self.cart.values())
+        return self._length
 
     def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return sum((line['total_price'] for line in self.lines()), Decimal('0'))
 
     def get_item_quantity(self, product_id):
         product_id = str(product_id)
         return self.cart.get(product_id, {}).get('quantity', 0)
 
     def clear(self):
-        if settings.CART_SESSION_ID in self.session:
-            del self.session[settings.CART_SESSION_ID]
-            self.save()
\ No newline at end of file
+        self.backend.clear()
+        self.cart = {}
+        self._changed()
\ No newline at end of file
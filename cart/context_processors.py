@@ -1,4 +1,6 @@
+from django.utils.functional import SimpleLazyObject
 from .cart import Cart
 
 def cart(request):
-    return {'cart': Cart(request)}
\ No newline at end of file
+    # Only built when a template actually touches the cart
+    return {'cart': SimpleLazyObject(lambda: Cart(request))}
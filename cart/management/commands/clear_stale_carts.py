@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from cart.models import CartItem
+
+class Command(BaseCommand):
+    help = 'Delete anonymous cart lines that have not changed for a number of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Age in days after which anonymous cart lines are deleted',
+            default=30
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = CartItem.objects.filter(user__isnull=True, updated_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {deleted} stale cart lines'))
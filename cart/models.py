@@ -1,3 +1,25 @@
 from django.db import models
+from django.contrib.auth.models import User
+from shop.models import Product
 
-# Create your models here.
+class CartItem(models.Model):
+    """One cart line, owned by a user or by an anonymous visitor's cart token"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='cart_items')
+    token = models.CharField(max_length=32, null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cartitem_user_product_uniq'),
+            models.UniqueConstraint(fields=['token', 'product'], name='cartitem_token_product_uniq'),
+        ]
+        indexes = [
+            # Stale anonymous carts are purged by age
+            models.Index(fields=['updated_at'], name='cartitem_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id}"
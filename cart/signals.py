@@ -0,0 +1,8 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .backends import get_backend
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None:
+        get_backend(request).merge_anonymous_cart(user)
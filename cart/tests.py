@@ -1,3 +1,208 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from shop.models import Category, Product, Vendor
+from shop.tests import make_catalog
+
+from .cart import Cart
+from .models import CartItem
+
+
+@override_settings(CART_BACKEND='cart.backends.DatabaseCartBackend')
+class DatabaseCartTests(TestCase):
+    def setUp(self):
+        vendor = Vendor.objects.create(user=User.objects.create(username='cart-vendor'), shop_name='Cart Store')
+        category = Category.objects.create(name='Cart Category')
+        self.product, self.other = [
+            Product.objects.create(vendor=vendor, category=category, name=f'Cart Product {i}', description='-',
+                                   price=Decimal('25.00'), stock_quantity=10, image='product_images/test.jpg')
+            for i in range(2)
+        ]
+
+    def add(self, product, quantity, **extra):
+        return self.client.post(reverse('cart:add_to_cart', args=[product.id]), {'quantity': quantity}, **extra)
+
+    def test_add_rejects_quantities_below_one(self):
+        for quantity in (0, -3):
+            with self.subTest(quantity=quantity):
+                response = self.add(self.product, quantity, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.json()['message'], 'Invalid quantity specified.')
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_add_and_update(self):
+        self.add(self.product, 2)
+        self.add(self.product, 3)
+        self.assertEqual(CartItem.objects.get(product=self.product).quantity, 5)
+
+        self.client.post(reverse('cart:update_cart', args=[self.product.id]), {'quantity': 0})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_save_lines_deletes_lines_below_one(self):
+        from .backends import DatabaseCartBackend
+
+        self.add(self.product, 2)
+        request = self.client.get(reverse('cart:cart_detail')).wsgi_request
+        DatabaseCartBackend(request).save_lines({str(self.product.id): {'quantity': 0, 'price': '25.00'}})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_session_cart_is_imported_on_first_access(self):
+        session = self.client.session
+        session[settings.CART_SESSION_ID] = {
+            str(self.product.id): {'quantity': 2, 'price': '25.00'},
+            str(self.other.id): {'quantity': 0, 'price': '25.00'},
+            '999999': {'quantity': 1, 'price': '10.00'},
+        }
+        session.save()
+
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(len(response.context['cart']), 2)
+        self.assertEqual(list(CartItem.objects.values_list('product_id', 'quantity')), [(self.product.id, 2)])
+        self.assertNotIn(settings.CART_SESSION_ID, self.client.session)
+
+        # Imported once: later requests read the rows and add to them
+        self.add(self.product, 1)
+        self.assertEqual(CartItem.objects.get(product=self.product).quantity, 3)
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        user = User.objects.create(username='cart-shopper')
+        CartItem.objects.create(user=user, product=self.product, quantity=1, price=self.product.price)
+        self.add(self.product, 2)
+        self.add(self.other, 1)
+        self.assertEqual(CartItem.objects.filter(user__isnull=True).count(), 2)
+
+        # force_login builds a request without request.user; the merge takes the user from the signal
+        self.client.force_login(user)
+        self.assertFalse(CartItem.objects.filter(user__isnull=True).exists())
+        self.assertEqual(
+            dict(CartItem.objects.filter(user=user).values_list('product_id', 'quantity')),
+            {self.product.id: 3, self.other.id: 1},
+        )
+
+
+class CartProductQueryTests(TestCase):
+    """The cart's products are read once per request, however often the cart is iterated or totalled"""
+
+    def setUp(self):
+        vendor = Vendor.objects.create(user=User.objects.create(username='query-vendor'), shop_name='Query Store')
+        category = Category.objects.create(name='Query Category')
+        self.products = [
+            Product.objects.create(vendor=vendor, category=category, name=f'Query Product {i}', description='-',
+                                   price=Decimal('10.00'), stock_quantity=10, image='product_images/test.jpg')
+            for i in range(20)
+        ]
+
+    def fill(self, count):
+        CartItem.objects.all().delete()
+        for product in self.products[:count]:
+            self.client.post(reverse('cart:add_to_cart', args=[product.id]), {'quantity': 2})
+
+    def test_iteration_total_and_length_share_one_query(self):
+        self.fill(5)
+        cart = Cart(self.client.get(reverse('cart:cart_badge')).wsgi_request)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(cart)), 5)
+            self.assertEqual(cart.get_total_price(), Decimal('100.00'))
+            self.assertEqual(len(cart), 10)
+            list(cart)
+            cart.get_total_price()
+
+    def test_cart_page_reads_products_once(self):
+        product_table = f'FROM "{Product._meta.db_table}"'
+        for count in (1, 20):
+            self.fill(count)
+            with self.subTest(lines=count), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('cart:cart_detail'))
+            self.assertEqual(len(response.context['cart']), count * 2)
+            self.assertEqual(sum(product_table in query['sql'] for query in queries.captured_queries), 1)
+
+
+class AnonymousBrowsingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product, = make_catalog(1, 'Browsing')
+
+    def browse(self, url):
+        self.client.cookies.clear()
+        return self.client.get(url)
+
+    def test_browsing_without_a_cart_creates_no_session(self):
+        pages = [reverse('index'), reverse('shop:shop_view'), reverse('shop:product_detail', args=[self.product.slug]),
+                 reverse('cart:cart_detail'), reverse('cart:cart_badge'), reverse('about')]
+        for url in pages * 2:  # the second pass is served by the page cache where there is one
+            with self.subTest(url=url):
+                response = self.browse(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_pages_without_forms_set_no_cookies(self):
+        for url in [reverse('cart:cart_detail'), reverse('cart:cart_badge'), reverse('about'), reverse('faq')]:
+            with self.subTest(url=url):
+                self.assertEqual(dict(self.browse(url).cookies), {})
+        # Pages with add-to-cart forms only need the CSRF cookie
+        self.assertEqual(list(self.browse(reverse('shop:shop_view')).cookies), [settings.CSRF_COOKIE_NAME])
+
+
+class CartJsonTests(TestCase):
+    def setUp(self):
+        self.product, = make_catalog(1, 'Json')  # 10.00 each, 5 in stock
+
+    def post(self, name, quantity=None, **headers):
+        data = {} if quantity is None else {'quantity': quantity}
+        headers = headers or {'HTTP_ACCEPT': 'application/json'}
+        return self.client.post(reverse(f'cart:{name}', args=[self.product.id]), data, **headers)
+
+    def assertState(self, response, status, count, total, quantity=None, level=None):
+        self.assertEqual(response.status_code, status)
+        data = response.json()
+        self.assertEqual(data['success'], status == 200)
+        self.assertEqual((data['count'], data['total']), (count, total))
+        self.assertEqual(data['line'] and data['line']['quantity'], quantity)
+        if level:
+            self.assertEqual(data['level'], level)
+        self.assertEqual(data['badge'].strip() != '', count > 0)
+        return data
+
+    def test_add(self):
+        data = self.assertState(self.post('add_to_cart', 2), 200, 2, '20.00', quantity=2, level='success')
+        self.assertEqual(data['line']['total_price'], '20.00')
+        self.assertIn('>2</span>', data['badge'])
+        # The X-Requested-With header asks for JSON too
+        self.assertState(self.post('add_to_cart', 1, HTTP_X_REQUESTED_WITH='XMLHttpRequest'), 200, 3, '30.00', quantity=3)
+        self.assertRedirects(self.post('add_to_cart', 1, HTTP_ACCEPT='text/html'), reverse('cart:cart_detail'))
+
+    def test_add_rejects_bad_quantities(self):
+        for quantity in ('abc', '0', '-2'):
+            with self.subTest(quantity=quantity):
+                self.assertState(self.post('add_to_cart', quantity), 409, 0, '0', level='error')
+        self.post('add_to_cart', 4)
+        data = self.assertState(self.post('add_to_cart', 3), 409, 4, '40.00', quantity=4, level='warning')
+        self.assertIn('Only 1 more', data['message'])
+
+    def test_update(self):
+        self.post('add_to_cart', 1)
+        self.assertState(self.post('update_cart', 3), 200, 3, '30.00', quantity=3, level='success')
+        for quantity in ('abc', None, '6'):
+            with self.subTest(quantity=quantity):
+                self.assertState(self.post('update_cart', quantity), 409, 3, '30.00', quantity=3, level='error')
+        self.assertState(self.post('update_cart', 0), 200, 0, '0', level='info')
+
+    def test_remove(self):
+        self.post('add_to_cart', 2)
+        self.assertState(self.post('remove_from_cart'), 200, 0, '0', level='info')
+        # Removing a product that isn't in the cart is harmless
+        self.assertState(self.post('remove_from_cart'), 200, 0, '0')
+
+    def test_badge(self):
+        self.assertEqual(self.client.get(reverse('cart:cart_badge')).content.strip(), b'')
+        self.post('add_to_cart', 3)
+        self.assertContains(self.client.get(reverse('cart:cart_badge')), '>3</span>')
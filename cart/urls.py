@@ -8,4 +8,5 @@ urlpatterns = [
     path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('update/<int:product_id>/', views.update_cart, name='update_cart'),
+    path('badge/', views.cart_badge, name='cart_badge'),
 ]
\ No newline at end of file
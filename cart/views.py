@@ -1,19 +1,61 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
+from django.contrib import messages
 from shop.models import Product
+from orders import recommendations
 from .cart import Cart
 
+def wants_json(request):
+    return (request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            or request.headers.get('Accept', '').startswith('application/json'))
+
+def cart_state(request, cart, product_id=None):
+    """Count, total and badge HTML of cart, plus the line for product_id"""
+    state = {
+        'count': len(cart),
+        'total': str(cart.get_total_price()),
+        'badge': render_to_string('cart/badge.html', {'count': len(cart)}, request=request),
+    }
+    if product_id is not None:
+        line = next((line for line in cart if line['product'].id == product_id), None)
+        state['line'] = line and {
+            'product_id': product_id,
+            'quantity': line['quantity'],
+            'price': str(line['price']),
+            'total_price': str(line['total_price']),
+        }
+    return state
+
+def cart_response(request, cart, product, level, message, redirect_to):
+    """
+    JSON for AJAX callers, otherwise a flash message and a redirect.
+    level is a django.contrib.messages level name.
+    """
+    if wants_json(request):
+        data = {'success': level in ('success', 'info'), 'level': level, 'message': message}
+        data.update(cart_state(request, cart, product.id))
+        return JsonResponse(data, status=200 if data['success'] else 409)
+    if message:
+        getattr(messages, level)(request, message)
+    return redirect(*redirect_to)
+
 @require_POST
 def add_to_cart(request, product_id):
-    from django.contrib import messages
-    
     cart = Cart(request)
     product = get_object_or_404(Product, id=product_id)
-    quantity = int(request.POST.get('quantity', 1))
-    
+    product_page = ('shop:product_detail', product.slug)
+    try:
+        quantity = int(request.POST.get('quantity', 1))
+    except (ValueError, TypeError):
+        return cart_response(request, cart, product, 'error', 'Invalid quantity specified.', product_page)
+    if quantity < 1:
+        return cart_response(request, cart, product, 'error', 'Invalid quantity specified.', product_page)
+
     if product.stock_quantity <= 0:
-        messages.error(request, f'Sorry, "{product.name}" is currently out of stock.')
-        return redirect('shop:product_detail', slug=product.slug)
+        return cart_response(request, cart, product, 'error',
+                             f'Sorry, "{product.name}" is currently out of stock.', product_page)
     
     current_cart_quantity = cart.get_item_quantity(product.id)
     total_requested = current_cart_quantity + quantity
@@ -21,43 +63,49 @@ def add_to_cart(request, product_id):
     if total_requested > product.stock_quantity:
         available = product.stock_quantity - current_cart_quantity
         if available > 0:
-            messages.warning(request, f'Only {available} more units of "{product.name}" can be added to your cart.')
-        else:
-            messages.error(request, f'You already have the maximum available quantity of "{product.name}" in your cart.')
-        return redirect('shop:product_detail', slug=product.slug)
+            return cart_response(request, cart, product, 'warning',
+                                 f'Only {available} more units of "{product.name}" can be added to your cart.', product_page)
+        return cart_response(request, cart, product, 'error',
+                             f'You already have the maximum available quantity of "{product.name}" in your cart.', product_page)
 
     cart.add(product=product, quantity=quantity, override_quantity=False)
-    messages.success(request, f'"{product.name}" has been added to your cart.')
-    return redirect('cart:cart_detail')
+    return cart_response(request, cart, product, 'success',
+                         f'"{product.name}" has been added to your cart.', ('cart:cart_detail',))
 
 @require_POST
 def remove_from_cart(request, product_id):
     cart = Cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
-    return redirect('cart:cart_detail')
+    return cart_response(request, cart, product, 'info', '', ('cart:cart_detail',))
+
+def cart_badge(request):
+    """Just the cart badge, for refreshing it without reloading the page"""
+    return render(request, 'cart/badge.html', {'count': len(Cart(request))})
 
 def cart_detail(request):
     cart = Cart(request)
-    return render(request, 'cart/cart_detail.html', {'cart': cart})
+    also_bought = recommendations.for_products(int(product_id) for product_id in cart.cart)
+    return render(request, 'cart/cart_detail.html', {'cart': cart, 'also_bought': also_bought})
 
 
 @require_POST
 def update_cart(request, product_id):
     cart = Cart(request)
     product = get_object_or_404(Product, id=product_id)
+    cart_page = ('cart:cart_detail',)
     
     try:
         quantity = int(request.POST.get('quantity'))
-        if quantity <= 0:
-            cart.remove(product)
-            messages.info(request, f'"{product.name}" was removed from your cart.')
-        elif quantity > product.stock_quantity:
-            messages.error(request, f'Sorry, only {product.stock_quantity} units of "{product.name}" are available.')
-        else:
-            cart.add(product=product, quantity=quantity, override_quantity=True)
-            messages.success(request, f'Cart updated successfully.')
     except (ValueError, TypeError):
-        messages.error(request, 'Invalid quantity specified.')
-        
-    return redirect('cart:cart_detail')
\ No newline at end of file
+        return cart_response(request, cart, product, 'error', 'Invalid quantity specified.', cart_page)
+
+    if quantity <= 0:
+        cart.remove(product)
+        return cart_response(request, cart, product, 'info',
+                             f'"{product.name}" was removed from your cart.', cart_page)
+    if quantity > product.stock_quantity:
+        return cart_response(request, cart, product, 'error',
+                             f'Sorry, only {product.stock_quantity} units of "{product.name}" are available.', cart_page)
+    cart.add(product=product, quantity=quantity, override_quantity=True)
+    return cart_response(request, cart, product, 'success', 'Cart updated successfully.', cart_page)
@@ -1,10 +1,14 @@
 
 import logging
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 
+from orders.loading import is_loaded, load_order
+
+from . import outbox
+
 logger = logging.getLogger(__name__)
 
 def send_template_email(subject, template_name, context, recipient_list, fail_silently=True):
@@ -30,41 +34,61 @@ def send_template_email(subject, template_name, context, recipient_list, fail_si
             raise
         return False
 
+def render_template_email(subject, template_name, context, recipient_list, connection=None):
+    """The templated email as a message, ready for outbox.send_messages_batched"""
+    html_message = render_to_string(template_name, context)
+    message = EmailMultiAlternatives(
+        subject, strip_tags(html_message), settings.DEFAULT_FROM_EMAIL, recipient_list, connection=connection
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+def queue_template_email(subject, template_name, context, recipient_list):
+    """Render now and leave the sending to run_mail_worker (see core.outbox)"""
+    html_message = render_to_string(template_name, context)
+    email = outbox.enqueue(subject, strip_tags(html_message), recipient_list, html_body=html_message)
+    logger.info(f"Email queued: '{subject}' to {recipient_list}")
+    return email
+
 def send_welcome_email(user, is_vendor=False):
     subject = f"Welcome to LinkUp Gadgets - Your {'Vendor ' if is_vendor else ''}Account is Ready!"
-    return send_template_email(
+    return queue_template_email(
         subject=subject,
         template_name='emails/welcome_email.html',
         context={'user': user, 'is_vendor': is_vendor},
         recipient_list=[user.email]
     )
 
+def _loaded(order):
+    # The templates list every line; load them all in a fixed number of queries
+    return order if is_loaded(order) else load_order(id=order.id)
+
 def send_order_confirmation_email(order):
+    order = _loaded(order)
     subject = f'Your LinkUp Gadgets Order Confirmation (#{str(order.id)[:8]})'
     
     recipient_list = [order.email]
     if order.user and order.user.email and order.user.email != order.email:
         recipient_list.append(order.user.email)
     
-    return send_template_email(
+    return queue_template_email(
         subject=subject,
         template_name='emails/order_confirmation_email.html',
         context={'order': order},
         recipient_list=recipient_list,
-        fail_silently=False
     )
 
 def send_order_status_email(order):
+    order = _loaded(order)
     subject = f'Order #{str(order.id)[:8]} Status Update - {order.get_status_display()}'
     
     recipient_list = [order.user.email]
     if order.email and order.email != order.user.email:
         recipient_list.append(order.email)
     
-    return send_template_email(
+    return queue_template_email(
         subject=subject,
         template_name='emails/order_status_update.html',
         context={'order': order, 'user': order.user},
         recipient_list=recipient_list,
-        fail_silently=False
     )
\ No newline at end of file
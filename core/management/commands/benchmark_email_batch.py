@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core.email_utils import render_template_email
+from core.outbox import send_messages_batched
+
+from ._smtp_stub import SMTPStub
+
+
+class Command(BaseCommand):
+    help = 'Compare sending emails one connection each with send_messages_batched, against a local SMTP stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200,
+                            help='Number of status-update style emails to send')
+        parser.add_argument('--handshake-delay', type=float, default=0.05,
+                            help='Seconds the stub spends on each new connection, standing in for TLS and login')
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        with SMTPStub(options['handshake_delay']) as stub, override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=stub.port,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+        ):
+            self.stdout.write(f'SMTP stub on port {stub.port}, {options["handshake_delay"] * 1000:.0f}ms per connection')
+            for label, send in [
+                ('One connection per message (send_mail)', lambda messages: [m.send() for m in messages]),
+                ('Batched over one connection', send_messages_batched),
+            ]:
+                messages = self.messages(count)
+                connections, received = stub.connections, stub.messages
+                started = time.perf_counter()
+                send(messages)
+                elapsed = time.perf_counter() - started
+                received = stub.messages - received
+                if received != count:
+                    raise CommandError(f'{label}: the stub received {received} of {count} messages')
+                self.stdout.write(
+                    f'  {label}: {elapsed:.2f}s, {count / elapsed:.0f} messages/s, '
+                    f'{stub.connections - connections} connections'
+                )
+
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            started = time.perf_counter()
+            send_messages_batched(self.messages(count))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  Rendered and batched to locmem: {elapsed:.2f}s, {count / elapsed:.0f} messages/s')
+        self.stdout.write(self.style.SUCCESS('✓ Email benchmark complete'))
+
+    def messages(self, count):
+        return [
+            render_template_email(
+                subject=f'Order #{i:08d} Status Update - Shipped',
+                template_name='emails/welcome_email.html',
+                context={'user': {'first_name': 'Customer', 'username': f'customer{i}'}, 'is_vendor': False},
+                recipient_list=[f'customer{i}@example.com'],
+            )
+            for i in range(count)
+        ]
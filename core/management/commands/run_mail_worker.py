@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox, retrying failures with exponential backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE,
+                            help='Number of emails to claim at a time')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait between polls when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Send what is due now and exit instead of polling')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, retrying, failed = outbox.drain(options['batch_size'])
+            if sent or retrying or failed or options['once']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ Sent {sent} emails, {retrying} to retry, {failed} given up'
+                ))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -47,7 +47,7 @@ class Command(BaseCommand):
             if user:
                 success = send_welcome_email(user, is_vendor=False)
                 if success:
-                    self.stdout.write(self.style.SUCCESS("✓ Welcome email test passed"))
+                    self.stdout.write(self.style.SUCCESS("✓ Welcome email queued; run_mail_worker --once sends it"))
                 else:
                     self.stdout.write(self.style.ERROR("✗ Welcome email test failed"))
             else:
@@ -62,7 +62,7 @@ class Command(BaseCommand):
                 from core.email_utils import send_order_confirmation_email
                 success = send_order_confirmation_email(order)
                 if success:
-                    self.stdout.write(self.style.SUCCESS("✓ Order confirmation email test passed"))
+                    self.stdout.write(self.style.SUCCESS("✓ Order confirmation email queued; run_mail_worker --once sends it"))
                 else:
                     self.stdout.write(self.style.ERROR("✗ Order confirmation email test failed"))
             else:
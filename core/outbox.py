@@ -0,0 +1,161 @@
+"""
+Email outbox.
+
+Request code never talks to the mail server. enqueue() inserts a rendered
+OutboxEmail in the caller's transaction, so the email is committed together
+with the change it reports, and is never sent if that change is rolled back.
+The run_mail_worker command then delivers due emails in batches.
+
+A worker claims a batch by pushing its next_attempt_at CLAIM_TIMEOUT into the
+future, under SELECT ... FOR UPDATE SKIP LOCKED where the database has it, so
+concurrent workers take different rows and a crashed worker's batch is
+picked up again once the claim runs out. A failed send is retried after
+RETRY_DELAY, doubling on each attempt up to MAX_RETRY_DELAY, and is given up
+on after MAX_ATTEMPTS.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+CLAIM_TIMEOUT = timedelta(minutes=10)
+RETRY_DELAY = timedelta(minutes=1)
+MAX_RETRY_DELAY = timedelta(hours=6)
+MAX_ATTEMPTS = 8
+
+
+def enqueue(subject, body, recipient_list, html_body='', from_email=None):
+    """
+    Queue an email for the worker. Takes effect when the current transaction
+    commits. Returns None if there is nobody to send it to.
+    """
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        return None
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=recipients,
+    )
+
+
+def retry_delay(attempts):
+    """How long to wait after the attempts-th failed send"""
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def claim(batch_size=BATCH_SIZE, now=None):
+    """Take up to batch_size due emails for this worker, oldest due first"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboxEmail.objects.filter(id__in=ids).update(next_attempt_at=now + CLAIM_TIMEOUT)
+    return list(OutboxEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def to_message(email):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def send_messages_batched(messages):
+    """
+    Send messages over one connection per backend, rather than connecting,
+    negotiating TLS and logging in again for every message as send_mail does.
+    Messages without a connection of their own share get_connection().
+    Returns, for each message in order, None if it was sent or the error
+    that stopped it; one bad message doesn't stop the rest.
+    """
+    messages = list(messages)
+    errors = [None] * len(messages)
+    groups = defaultdict(list)
+    for index, message in enumerate(messages):
+        groups[message.connection].append(index)
+
+    for connection, indexes in groups.items():
+        connection = connection or get_connection()
+        pending = list(indexes)
+        try:
+            connection.open()
+            while pending:
+                index = pending.pop(0)
+                try:
+                    connection.send_messages([messages[index]])
+                except Exception as e:
+                    errors[index] = e
+                    # The session may be left half way through a message; start a clean one
+                    connection.close()
+                    connection.open()
+        except Exception as e:
+            # Couldn't (re)connect: nothing else in this group can go out
+            for index in pending:
+                errors[index] = e
+        finally:
+            connection.close()
+    return errors
+
+
+def _record_failure(email, error, now):
+    attempts = email.attempts + 1
+    if attempts >= MAX_ATTEMPTS:
+        changes = {'status': OutboxEmail.FAILED}
+        logger.error(f"Giving up on email {email.id} '{email.subject}' after {attempts} attempts: {error}")
+    else:
+        changes = {'next_attempt_at': now + retry_delay(attempts)}
+        logger.warning(f"Email {email.id} '{email.subject}' failed (attempt {attempts}), will retry: {error}")
+    OutboxEmail.objects.filter(id=email.id).update(attempts=attempts, last_error=str(error), **changes)
+    return changes.get('status') == OutboxEmail.FAILED
+
+
+def deliver(emails):
+    """
+    Send claimed emails over a single connection and record the outcome.
+    Returns (sent, retrying, failed)
+    """
+    sent_ids = []
+    retrying = failed = 0
+    errors = send_messages_batched([to_message(email) for email in emails])
+    for email, error in zip(emails, errors):
+        if error is None:
+            sent_ids.append(email.id)
+        elif _record_failure(email, error, timezone.now()):
+            failed += 1
+        else:
+            retrying += 1
+    if sent_ids:
+        OutboxEmail.objects.filter(id__in=sent_ids).update(
+            status=OutboxEmail.SENT, sent_at=timezone.now(), last_error=''
+        )
+    return len(sent_ids), retrying, failed
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Deliver every email that is due now. Returns (sent, retrying, failed)"""
+    totals = [0, 0, 0]
+    started = timezone.now()
+    while True:
+        emails = claim(batch_size, now=started)
+        if not emails:
+            return tuple(totals)
+        for i, count in enumerate(deliver(emails)):
+            totals[i] += count
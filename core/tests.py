@@ -1,3 +1,145 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cart.cart import CART_COUNT_SESSION_KEY
+from cart.models import CartItem
+from shop.tests import make_catalog
+
+from . import outbox
+from .models import OutboxEmail
+
+
+class FlakyBackend(locmem.EmailBackend):
+    """The locmem backend, but messages to a failing@ address are refused"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(address.startswith('failing@') for address in message.to):
+                raise ConnectionError('Recipient refused')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='core.tests.FlakyBackend')
+class OutboxTests(TestCase):
+    def queue(self, to='customer@example.com', subject='Hello'):
+        return outbox.enqueue(subject, 'Body', [to], html_body='<p>Body</p>')
+
+    def test_enqueue_skips_empty_recipients(self):
+        self.assertIsNone(outbox.enqueue('Hello', 'Body', ['', None]))
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_claim_takes_due_emails_once(self):
+        first, second = self.queue(), self.queue()
+        later = self.queue()
+        now = timezone.now()
+        OutboxEmail.objects.filter(id=later.id).update(next_attempt_at=now + timedelta(hours=1))
+
+        claimed = outbox.claim(batch_size=10, now=now)
+        self.assertEqual([email.id for email in claimed], [first.id, second.id])
+        self.assertEqual({email.next_attempt_at for email in claimed}, {now + outbox.CLAIM_TIMEOUT})
+        # A second worker finds nothing until the claim runs out
+        self.assertEqual(outbox.claim(batch_size=10, now=now), [])
+        self.assertEqual(len(outbox.claim(batch_size=10, now=now + outbox.CLAIM_TIMEOUT)), 2)
+
+    def test_claim_respects_batch_size(self):
+        for _ in range(3):
+            self.queue()
+        self.assertEqual(len(outbox.claim(batch_size=2)), 2)
+        self.assertEqual(len(outbox.claim(batch_size=2)), 1)
+
+    def test_drain_sends_due_emails(self):
+        self.queue(subject='First')
+        self.queue(subject='Second')
+        self.assertEqual(outbox.drain(), (2, 0, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['First', 'Second'])
+        self.assertEqual(mail.outbox[0].alternatives[0][0], '<p>Body</p>')
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT, sent_at__isnull=False).count(), 2)
+        self.assertEqual(outbox.drain(), (0, 0, 0))
+
+    def test_failed_send_backs_off_without_stopping_the_batch(self):
+        failing = self.queue(to='failing@example.com')
+        self.queue()
+        started = timezone.now()
+        self.assertEqual(outbox.drain(), (1, 1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, OutboxEmail.PENDING)
+        self.assertEqual(failing.attempts, 1)
+        self.assertIn('Recipient refused', failing.last_error)
+        self.assertGreaterEqual(failing.next_attempt_at, started + outbox.RETRY_DELAY)
+        # Not due again until the delay has passed
+        self.assertEqual(outbox.drain(), (0, 0, 0))
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertEqual(outbox.retry_delay(1), outbox.RETRY_DELAY)
+        self.assertEqual(outbox.retry_delay(2), outbox.RETRY_DELAY * 2)
+        self.assertEqual(outbox.retry_delay(3), outbox.RETRY_DELAY * 4)
+        self.assertEqual(outbox.retry_delay(12), outbox.MAX_RETRY_DELAY)
+
+    def test_gives_up_after_max_attempts(self):
+        email = self.queue(to='failing@example.com')
+        for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+            OutboxEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+            retrying, failed = outbox.drain()[1:]
+            self.assertEqual((retrying, failed), (0, 1) if attempt == outbox.MAX_ATTEMPTS else (1, 0))
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.FAILED)
+        self.assertEqual(email.attempts, outbox.MAX_ATTEMPTS)
+        OutboxEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.claim(), [])
+        self.assertEqual(mail.outbox, [])
+
+
+@override_settings(CART_BACKEND='cart.backends.DatabaseCartBackend')
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product, = make_catalog(1, 'Cached')
+
+    def add(self, quantity):
+        # Follow the redirect so the flash message is shown and the next page can be cached
+        self.client.post(reverse('cart:add_to_cart', args=[self.product.id]), {'quantity': quantity}, follow=True)
+
+    def test_hit_without_a_session_runs_no_queries(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_hit_with_a_cart_reads_only_the_session(self):
+        self.add(3)
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        # Loading the session for the login check is the only query
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(CartItem._meta.db_table, queries[0]['sql'])
+        self.assertContains(response, '>3</span>')
+
+    def test_key_follows_the_cart_count(self):
+        self.add(3)
+        self.client.get(reverse('index'))
+        self.add(1)
+        self.assertEqual(self.client.session[CART_COUNT_SESSION_KEY], 4)
+        self.assertContains(self.client.get(reverse('index')), '>4</span>')
+        self.client.post(reverse('cart:remove_from_cart', args=[self.product.id]))
+        self.assertEqual(self.client.session[CART_COUNT_SESSION_KEY], 0)
+        self.assertNotContains(self.client.get(reverse('index')), '>4</span>')
+
+    def test_sessions_without_a_count_are_counted_once(self):
+        self.add(2)
+        session = self.client.session
+        del session[CART_COUNT_SESSION_KEY]
+        session.save()
+        self.assertContains(self.client.get(reverse('index')), '>2</span>')
+        self.assertEqual(self.client.session[CART_COUNT_SESSION_KEY], 2)
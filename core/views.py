@@ -1,12 +1,15 @@
 from django.shortcuts import render
-from shop.models import Product, Category
+from shop import queries
+from shop.models import Category
+from .page_cache import CATALOG_PAGE_CACHE_TIMEOUT, anonymous_cache_page
 
+@anonymous_cache_page(CATALOG_PAGE_CACHE_TIMEOUT, catalog=True)
 def index(request):
     # Fetch featured products (limit to 4 for the main section)
-    featured_products = Product.objects.filter(is_featured=True).order_by('-created_at')[:4]
+    featured_products = queries.featured_products()
     
     # Fetch new arrivals (latest 4 products)
-    new_arrivals = Product.objects.all().order_by('-created_at')[:4]
+    new_arrivals = queries.new_arrivals()
 
     # THE FIX: Fetch only the first 4 categories
     categories = Category.objects.all()[:4]
@@ -42,15 +45,19 @@ def index(request):
 # def terms(request):
 #     return render(request, 'core/terms.html')
 
+@anonymous_cache_page()
 def about_view(request):
     return render(request, 'core/about.html')
 
+@anonymous_cache_page()
 def terms_view(request):
     return render(request, 'core/terms.html')
 
+@anonymous_cache_page()
 def vendor_policies_view(request):
     return render(request, 'core/vendor_policies.html')
 
+@anonymous_cache_page()
 def faq_view(request):
     return render(request, 'core/faq.html')
 
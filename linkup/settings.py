@@ -11,6 +11,9 @@ ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='127.0.0.1,localhost', cast=Csv(
 PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY')
 PAYSTACK_PUBLIC_KEY = config('PAYSTACK_PUBLIC_KEY')
 PAYSTACK_CURRENCY = config('PAYSTACK_CURRENCY', default='GHS')
+PAYSTACK_BASE_URL = config('PAYSTACK_BASE_URL', default='https://api.paystack.co')
+# Seconds allowed for a verification call to Paystack, end to end
+PAYSTACK_TIMEOUT = config('PAYSTACK_TIMEOUT', default=5.0, cast=float)
 
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='localhost')
@@ -32,6 +35,7 @@ INSTALLED_APPS = [
     'accounts',
     'cart',
     'orders',
+    'payment',
     'tailwind',
     'theme',
     'widget_tweaks',
@@ -39,6 +43,9 @@ INSTALLED_APPS = [
 
 TAILWIND_APP_NAME = 'theme'
 CART_SESSION_ID = 'cart'
+# cart.backends.DatabaseCartBackend keeps one row per cart line;
+# cart.backends.SessionCartBackend keeps the whole cart in the session
+CART_BACKEND = config('CART_BACKEND', default='cart.backends.DatabaseCartBackend')
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -189,16 +196,20 @@ LOGGING = {
 logs_dir = BASE_DIR / 'logs'
 if not os.path.exists(logs_dir):
     os.makedirs(logs_dir)
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared cache (e.g. Redis) in
+# production so every worker sees the same fragments and counters
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default='unique-snowflake'),
         'TIMEOUT': 300,
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
-        }
     }
 }
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': 1000,
+    }
 
 if not DEBUG:
     DATABASES['default']['CONN_MAX_AGE'] = 60
@@ -0,0 +1,43 @@
+"""
+Loading an order together with everything its pages and emails show.
+
+order_detail and the order emails list each line's product and vendor. Going
+through order.items.all and item.product one at a time costs two queries
+per line, so they all load the order through load_order instead. That is a
+fixed ORDER_QUERIES queries however many lines the order has: the order
+joined to its user, then the items joined to their products and vendors.
+"""
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Order, OrderItem
+
+ORDER_QUERIES = 2
+# Newest first, the order of the profile page's order history
+HISTORY_ORDERING = ('-created_at', '-id')
+
+
+def with_lines(orders):
+    """orders with the user and every item's product and vendor loaded up front"""
+    items = OrderItem.objects.select_related('product__vendor').order_by('id')
+    return orders.select_related('user').prefetch_related(Prefetch('items', queryset=items))
+
+
+def load_order(**lookup):
+    """The order matching lookup, ready to render. Raises Order.DoesNotExist"""
+    return with_lines(Order.objects.all()).get(**lookup)
+
+
+def is_loaded(order):
+    return 'items' in getattr(order, '_prefetched_objects_cache', {})
+
+
+def history(user):
+    """user's orders, each with its number of lines, for the profile page"""
+    # A correlated count is only evaluated for the rows on the page, where a
+    # JOIN + GROUP BY would aggregate every order before paginating
+    item_count = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .order_by().values('order').annotate(count=Count('id')).values('count')
+    )
+    return Order.objects.filter(user=user).annotate(item_count=Coalesce(Subquery(item_count), 0))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from orders import sales
+
+class Command(BaseCommand):
+    help = 'Add paid orders that are missing from the vendor daily sales rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Drop the rollup and count every paid order again'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of orders to count per pass',
+            default=sales.ORDER_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write('Rebuilding the daily sales rollup from all paid orders...')
+        else:
+            self.stdout.write('Adding paid orders missing from the daily sales rollup...')
+        orders = sales.backfill(batch_size=options['batch_size'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Counted {orders} orders'))
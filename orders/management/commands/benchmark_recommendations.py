@@ -0,0 +1,89 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders import recommendations
+from orders.models import CoPurchase, Order, OrderItem, Recommendation
+from shop.management.commands._seed import seed_products
+from shop.models import Category, Vendor
+
+
+class Command(BaseCommand):
+    help = 'Time a full recommendations build and an incremental update on seeded orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000000,
+                            help='Order items to seed for the full build')
+        parser.add_argument('--products', type=int, default=20000,
+                            help='Catalog size')
+        parser.add_argument('--max-items-per-order', type=int, default=5,
+                            help='Each order gets between 1 and this many distinct products')
+        parser.add_argument('--incremental-items', type=int, default=10000,
+                            help='Order items paid after the full build')
+        parser.add_argument('--batch-size', type=int, default=recommendations.ORDER_BATCH_SIZE,
+                            help='Number of orders to count per batch')
+
+    def handle(self, *args, **options):
+        # Everything is seeded inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        rng = random.Random(42)
+        user = User.objects.create(username='recommendations-benchmark')
+        vendor = Vendor.objects.create(user=user, shop_name='Recommendations Benchmark Store')
+        category = Category.objects.create(name='Recommendations Benchmark')
+        product_ids = seed_products([vendor], [category], rng, 0, options['products'])
+        # A few products sell far more than the rest, as in a real catalog
+        weights = [1.0 / (rank + 1) for rank in range(len(product_ids))]
+
+        started = time.perf_counter()
+        orders = self.seed_orders(rng, product_ids, weights, options['items'], options['max_items_per_order'])
+        self.stdout.write(f'Seeded {orders} paid orders in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        orders, products = recommendations.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Full build: {orders} orders, {CoPurchase.objects.count()} matrix cells, '
+            f'{products} products rescored in {elapsed:.1f}s'
+        )
+
+        self.seed_orders(rng, product_ids, weights, options['incremental_items'], options['max_items_per_order'])
+        started = time.perf_counter()
+        orders, products = recommendations.update(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Incremental update: {orders} orders, {products} products rescored in {elapsed:.1f}s'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {Recommendation.objects.count()} recommendations stored'
+        ))
+
+    def seed_orders(self, rng, product_ids, weights, items, max_per_order, batch_size=5000):
+        seeded_items = 0
+        seeded_orders = 0
+        while seeded_items < items:
+            baskets = []
+            while seeded_items < items and len(baskets) < batch_size:
+                size = min(rng.randint(1, max_per_order), items - seeded_items)
+                basket = set(rng.choices(product_ids, weights, k=size))
+                baskets.append(basket)
+                seeded_items += len(basket)
+            orders = Order.objects.bulk_create([
+                Order(full_name='Benchmark', email='benchmark@example.com', phone='0', address='-',
+                      city='-', total_paid=Decimal('0'), paid=True, status='paid')
+                for _ in baskets
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=product_id, price=Decimal('1'))
+                for order, basket in zip(orders, baskets)
+                for product_id in basket
+            ], batch_size=batch_size)
+            seeded_orders += len(orders)
+        return seeded_orders
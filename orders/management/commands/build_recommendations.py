@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from orders import recommendations
+
+class Command(BaseCommand):
+    help = 'Update "customers also bought" recommendations from newly paid orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Drop the co-purchase counts and recount every paid order'
+        )
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            help='Number of recommendations to keep per product',
+            default=recommendations.TOP_N
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of orders to count per batch',
+            default=recommendations.ORDER_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            self.stdout.write('Rebuilding recommendations from all paid orders...')
+            run = recommendations.rebuild
+        else:
+            self.stdout.write('Updating recommendations from newly paid orders...')
+            run = recommendations.update
+        orders, products = run(top_n=options['top_n'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Counted {orders} orders and rescored {products} products'
+        ))
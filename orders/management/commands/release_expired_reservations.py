@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from orders import reservations
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired checkout holds to the catalog'
+
+    def handle(self, *args, **options):
+        released = reservations.release_expired()
+        self.stdout.write(self.style.SUCCESS(f'✓ Released {released} expired stock holds'))
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_indexes'),
+        ('shop', '0007_relatedproduct'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'ordering': ('product', '-score'),
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='co_purchase_counted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['paid', 'co_purchase_counted'], name='order_paid_copurchase_idx'),
+        ),
+        migrations.AddField(
+            model_name='copurchase',
+            name='product_a',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product'),
+        ),
+        migrations.AddField(
+            model_name='copurchase',
+            name='product_b',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product'),
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='shop.product'),
+        ),
+        migrations.AddField(
+            model_name='recommendation',
+            name='recommended',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='copurchase',
+            unique_together={('product_a', 'product_b')},
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['product', '-score'], name='recommendation_product_idx'),
+        ),
+    ]
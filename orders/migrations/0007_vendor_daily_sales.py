@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_reference_idx'),
+        ('shop', '0007_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='sales_counted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='VendorDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.product')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.vendor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vendor', 'day'], name='dailysales_vendor_day_idx')],
+                'unique_together': {('vendor', 'product', 'day')},
+            },
+        ),
+    ]
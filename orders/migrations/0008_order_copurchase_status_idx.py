@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_vendor_daily_sales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['co_purchase_counted', 'status'], name='order_copurchase_status_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def record_counted_orders(apps, schema_editor):
+    """
+    Record what each counted order added to the rollup, from its items as
+    they are now, and rebuild the rollup from those records so the two agree
+    """
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    OrderSales = apps.get_model('orders', 'OrderSales')
+    VendorDailySales = apps.get_model('orders', 'VendorDailySales')
+
+    rows = (
+        OrderItem.objects.filter(order__in=Order.objects.filter(sales_counted=True))
+        .annotate(day=TruncDate('order__created_at'))
+        .values('order_id', 'product__vendor_id', 'product_id', 'day')
+        .annotate(units=Sum('quantity'),
+                  revenue=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)))
+        .order_by()
+    )
+    OrderSales.objects.bulk_create((
+        OrderSales(order_id=row['order_id'], vendor_id=row['product__vendor_id'], product_id=row['product_id'],
+                   day=row['day'], units=row['units'], revenue=row['revenue'])
+        for row in rows.iterator(chunk_size=2000)
+    ), batch_size=2000)
+
+    VendorDailySales.objects.all().delete()
+    totals = (
+        OrderSales.objects.values('vendor_id', 'product_id', 'day')
+        .annotate(total_units=Sum('units'), total_revenue=Sum('revenue')).order_by()
+    )
+    VendorDailySales.objects.bulk_create((
+        VendorDailySales(vendor_id=row['vendor_id'], product_id=row['product_id'], day=row['day'],
+                         units=row['total_units'], revenue=row['total_revenue'])
+        for row in totals.iterator(chunk_size=2000)
+    ), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_copurchase_status_idx'),
+        ('shop', '0008_product_vendor_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counted_sales', to='orders.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.vendor')),
+            ],
+        ),
+        migrations.RunPython(record_counted_orders, migrations.RunPython.noop),
+    ]
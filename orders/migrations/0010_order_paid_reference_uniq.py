@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_sales'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('paid', True), models.Q(('paystack_reference', ''), _negated=True)), fields=('paystack_reference',), name='order_paid_reference_uniq'),
+        ),
+    ]
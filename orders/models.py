@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 from shop.models import Product
 
@@ -13,6 +14,10 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
         ('refunded', 'Refunded'),
     ]
+    # Paid orders in these statuses no longer count as sales
+    REVERSED_STATUSES = ('refunded', 'cancelled')
+    # Bookkeeping flags only ever changed by queryset updates; save() leaves them alone
+    COUNTER_FLAGS = ('co_purchase_counted', 'sales_counted')
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='orders')
@@ -31,8 +36,38 @@ class Order(models.Model):
     
     paystack_reference = models.CharField(max_length=100, blank=True)
 
+    # Set once the order's items are added to the co-purchase counts
+    co_purchase_counted = models.BooleanField(default=False, editable=False)
+    # Set while the order's items are included in VendorDailySales
+    sales_counted = models.BooleanField(default=False, editable=False)
+
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+            models.Index(fields=['paid', 'created_at'], name='order_paid_created_idx'),
+            models.Index(fields=['paid', 'co_purchase_counted'], name='order_paid_copurchase_idx'),
+            models.Index(fields=['co_purchase_counted', 'status'], name='order_copurchase_status_idx'),
+            # Webhooks and reconciliation find orders by their Paystack reference
+            models.Index(fields=['paystack_reference'], name='order_reference_idx'),
+        ]
+        constraints = [
+            # One Paystack charge can pay for one order only
+            models.UniqueConstraint(
+                fields=['paystack_reference'], condition=Q(paid=True) & ~Q(paystack_reference=''),
+                name='order_paid_reference_uniq',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # An instance loaded before a counting run still holds the old flag
+        # values, so an update writes every field except them
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FLAGS
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Order {self.id} by {self.full_name}"
@@ -43,8 +78,118 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            # Vendor sales lookups go product -> order items -> order
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
     def __str__(self):
         return str(self.id)
 
     def get_total_price(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class CoPurchase(models.Model):
+    """
+    One cell of the sparse co-purchase matrix: the number of paid orders
+    containing both products. Only product_a <= product_b is stored; the
+    diagonal holds the number of paid orders containing the product at all.
+    """
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product_a', 'product_b')
+
+    def __str__(self):
+        return f"{self.product_a_id} x {self.product_b_id}: {self.orders}"
+
+
+class Recommendation(models.Model):
+    """Top co-purchased products for a product, scored by cosine similarity"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ('product', '-score')
+        indexes = [
+            models.Index(fields=['product', '-score'], name='recommendation_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.score:.3f})"
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for an unpaid order. Taking a hold moves units out of
+    Product.stock_quantity; releasing it puts them back, converting it
+    turns it into a sale. See orders.reservations.
+    """
+    HELD = 'held'
+    CONVERTED = 'converted'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONVERTED, 'Converted'),
+        (RELEASED, 'Released'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The expiry sweep looks for held rows past their deadline
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+            models.Index(fields=['product', 'status', 'expires_at'], name='reservation_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.order_id} ({self.status})"
+
+
+class VendorDailySales(models.Model):
+    """
+    Units and revenue of a product on one day, from the paid orders placed
+    that day. Kept up to date incrementally by orders.sales as orders are
+    paid, refunded or cancelled, so vendor charts never read OrderItem.
+    """
+    vendor = models.ForeignKey('shop.Vendor', on_delete=models.CASCADE, related_name='daily_sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('vendor', 'product', 'day')
+        indexes = [
+            models.Index(fields=['vendor', 'day'], name='dailysales_vendor_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units} units, {self.revenue}"
+
+
+class OrderSales(models.Model):
+    """
+    What orders.sales added to VendorDailySales for one order, per product.
+    Taking an order back out subtracts these rows rather than its items as
+    they are now, so editing the items of a counted order can't skew the rollup.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='counted_sales')
+    vendor = models.ForeignKey('shop.Vendor', on_delete=models.CASCADE, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    units = models.IntegerField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.product_id} in order {self.order_id}: {self.units} units, {self.revenue}"
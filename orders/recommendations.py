@@ -0,0 +1,206 @@
+"""
+"Customers also bought" recommendations.
+
+Paid orders are folded into CoPurchase, a sparse upper-triangular matrix of
+how many orders contain each pair of products. The pair counts for a batch
+of orders come from one grouped self-join of OrderItem that the database
+adds straight onto the stored counts, so Python never touches the cells. Each
+product then keeps its top neighbours by cosine similarity,
+
+    score(a, b) = orders(a, b) / sqrt(orders(a) * orders(b))
+
+in Recommendation. Orders are flagged once counted, so an update only has
+to look at orders paid since the last run and rescore the products they touched.
+Counted orders that have since been refunded or cancelled are taken back
+out with a matching UPDATE.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from shop.models import Product
+
+from .models import CoPurchase, Order, OrderItem, Recommendation
+
+TOP_N = 10
+DISPLAY_LIMIT = 4
+ORDER_BATCH_SIZE = 2000
+PRODUCT_BATCH_SIZE = 500
+COUNTED = Q(paid=True) & ~Q(status__in=Order.REVERSED_STATUSES)
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _pair_counts(order_ids):
+    """(a, b, orders) rows for every product pair (a <= b) bought together in order_ids"""
+    return (
+        OrderItem.objects.filter(order_id__in=order_ids, product_id__lte=F('order__items__product_id'))
+        .annotate(a=F('product_id'), b=F('order__items__product_id'))
+        .values_list('a', 'b')
+        .annotate(orders=Count('order_id', distinct=True))
+        .order_by()
+    )
+
+
+def _add_pair_counts(order_ids):
+    """
+    Add the pair counts of order_ids onto the stored matrix with a single
+    INSERT ... SELECT ... ON CONFLICT, so no cell makes a round trip
+    through Python. Both SQLite and PostgreSQL support the upsert syntax.
+    """
+    sql, params = _pair_counts(order_ids).query.sql_with_params()
+    table = CoPurchase._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (product_a_id, product_b_id, orders)
+            {sql}
+            ON CONFLICT (product_a_id, product_b_id)
+            DO UPDATE SET orders = {table}.orders + excluded.orders
+            """,
+            params,
+        )
+
+
+def _subtract_pair_counts(order_ids):
+    """
+    Take the pair counts of order_ids back off the stored matrix with an
+    UPDATE ... FROM. A negative upsert can't do it: its insert row fails
+    the orders >= 0 check before ON CONFLICT is considered.
+    """
+    sql, params = _pair_counts(order_ids).query.sql_with_params()
+    table = CoPurchase._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} SET orders = {table}.orders - counts.orders
+            FROM ({sql}) AS counts
+            WHERE {table}.product_a_id = counts.a AND {table}.product_b_id = counts.b
+            """,
+            params,
+        )
+
+
+def _fold(pending, apply, counted, batch_size):
+    touched = set()
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Locked, so an overlapping run skips this batch instead of counting it twice
+            order_ids = list(
+                pending.select_for_update(skip_locked=True).order_by().values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            apply(order_ids)
+            Order.objects.filter(id__in=order_ids).update(co_purchase_counted=counted)
+            touched.update(
+                OrderItem.objects.filter(order_id__in=order_ids).values_list('product_id', flat=True)
+            )
+        total += len(order_ids)
+    return total, touched
+
+
+def count_new_orders(batch_size=ORDER_BATCH_SIZE):
+    """
+    Fold paid orders that haven't been counted yet into the matrix, and take
+    counted orders that were refunded or cancelled since back out.
+    Returns (number of orders, ids of products whose counts changed).
+    """
+    added, touched = _fold(
+        Order.objects.filter(COUNTED, co_purchase_counted=False), _add_pair_counts, True, batch_size
+    )
+    removed, untouched = _fold(
+        Order.objects.filter(co_purchase_counted=True).exclude(COUNTED), _subtract_pair_counts, False, batch_size
+    )
+    return added + removed, touched | untouched
+
+
+def rescore(product_ids, top_n=TOP_N, batch_size=PRODUCT_BATCH_SIZE):
+    """Recompute the stored neighbours of product_ids from the matrix"""
+    for chunk in _chunks(product_ids, batch_size):
+        chunk_set = set(chunk)
+        neighbours = defaultdict(dict)
+        diagonal = {}
+        cells = CoPurchase.objects.filter(
+            Q(product_a_id__in=chunk) | Q(product_b_id__in=chunk)
+        ).values_list('product_a_id', 'product_b_id', 'orders')
+        for a, b, count in cells:
+            if a == b:
+                diagonal[a] = count
+                continue
+            if a in chunk_set:
+                neighbours[a][b] = count
+            if b in chunk_set:
+                neighbours[b][a] = count
+
+        missing = {pk for row in neighbours.values() for pk in row} - diagonal.keys()
+        for ids in _chunks(missing, batch_size):
+            diagonal.update(
+                CoPurchase.objects.filter(product_a_id__in=ids, product_b_id=F('product_a_id'))
+                .values_list('product_a_id', 'orders')
+            )
+
+        entries = []
+        for product_id, row in neighbours.items():
+            own = diagonal.get(product_id)
+            if not own:
+                continue
+            scored = (
+                (count / math.sqrt(own * diagonal[other]), other)
+                for other, count in row.items() if count > 0 and diagonal.get(other)
+            )
+            entries += [
+                Recommendation(product_id=product_id, recommended_id=other, score=score)
+                for score, other in heapq.nlargest(top_n, scored)
+            ]
+        with transaction.atomic():
+            Recommendation.objects.filter(product_id__in=chunk).delete()
+            Recommendation.objects.bulk_create(entries, batch_size=1000)
+
+
+def update(top_n=TOP_N, batch_size=ORDER_BATCH_SIZE):
+    """Incremental run: count newly paid orders and rescore what they touched"""
+    orders, touched = count_new_orders(batch_size)
+    rescore(sorted(touched), top_n)
+    return orders, len(touched)
+
+
+def rebuild(top_n=TOP_N, batch_size=ORDER_BATCH_SIZE):
+    """Drop the matrix and recount every paid order"""
+    Recommendation.objects.all().delete()
+    CoPurchase.objects.all().delete()
+    Order.objects.filter(co_purchase_counted=True).update(co_purchase_counted=False)
+    return update(top_n, batch_size)
+
+
+def for_product(product, limit=DISPLAY_LIMIT):
+    entries = (
+        Recommendation.objects.filter(product=product)
+        .select_related('recommended__vendor', 'recommended__category')[:limit]
+    )
+    return [entry.recommended for entry in entries]
+
+
+def for_products(product_ids, limit=DISPLAY_LIMIT):
+    """Neighbours of a set of products (e.g. a cart), best combined score first"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    ranked = list(
+        Recommendation.objects.filter(product_id__in=product_ids)
+        .exclude(recommended_id__in=product_ids)
+        .values('recommended_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'recommended_id')
+        .values_list('recommended_id', flat=True)[:limit]
+    )
+    products = Product.objects.select_related('vendor', 'category').in_bulk(ranked)
+    return [products[pk] for pk in ranked if pk in products]
@@ -0,0 +1,183 @@
+"""
+Stock reservations for checkout.
+
+Placing an order holds its stock for RESERVATION_TTL. Every stock change is a
+conditional UPDATE, such as "stock_quantity = stock_quantity - n WHERE
+stock_quantity >= n", so concurrent checkouts can never take the same units
+twice. Every status change is also conditional ("status = released WHERE
+status = held"), so each hold is released or converted exactly once, whichever
+process gets there first.
+
+Expired holds are released lazily when a reservation would otherwise fail,
+and in bulk by the release_expired_reservations command.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from shop.models import Product
+
+from .models import Order, StockReservation
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL = timedelta(minutes=30)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f'Not enough stock of product {product_id} for {requested} units')
+
+
+def _take(product_id, quantity):
+    return Product.objects.filter(id=product_id, stock_quantity__gte=quantity).update(
+        stock_quantity=F('stock_quantity') - quantity
+    ) == 1
+
+
+def _give_back(product_id, quantity):
+    Product.objects.filter(id=product_id).update(stock_quantity=F('stock_quantity') + quantity)
+
+
+def _set_status(reservation_id, old, new):
+    return StockReservation.objects.filter(id=reservation_id, status=old).update(status=new) == 1
+
+
+class _Short(Exception):
+    pass
+
+
+def _take_many(wanted):
+    """
+    Take wanted {product_id: quantity} with one conditional UPDATE. All or
+    nothing: if any product is short, the savepoint undoes the others.
+
+    The rows are locked first, in id order. An UPDATE locks rows in whatever
+    order the plan visits them, so two checkouts sharing products could each
+    hold a row the other is waiting for; locking in one order rules that out.
+    """
+    product_ids = sorted(wanted)
+    quantity = Case(
+        *[When(id=product_id, then=Value(amount)) for product_id, amount in wanted.items()],
+        output_field=PositiveIntegerField(),
+    )
+    try:
+        with transaction.atomic():
+            locked = Product.objects.select_for_update().filter(id__in=product_ids).order_by('id')
+            list(locked.values_list('id', flat=True))
+            updated = Product.objects.filter(id__in=product_ids, stock_quantity__gte=quantity).update(
+                stock_quantity=F('stock_quantity') - quantity
+            )
+            if updated != len(wanted):
+                raise _Short
+    except _Short:
+        return False
+    return True
+
+
+def reserve(order, wanted=None, ttl=RESERVATION_TTL):
+    """
+    Hold stock for order. wanted maps product ids to quantities and defaults
+    to the order's items. Raises InsufficientStock if any product runs short.
+    Call inside transaction.atomic() so the order is rolled back with it.
+
+    Costs a constant number of queries however many lines the order has:
+    one SELECT ... FOR UPDATE and one UPDATE for all products, and one INSERT
+    for the holds. Expired holds are only swept, with a couple more queries,
+    when that UPDATE comes up short.
+    """
+    if wanted is None:
+        wanted = defaultdict(int)
+        for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+            wanted[product_id] += quantity
+    if not wanted:
+        return []
+
+    if not _take_many(wanted):
+        release_expired(product_ids=list(wanted))
+        if not _take_many(wanted):
+            stock = dict(Product.objects.filter(id__in=list(wanted)).values_list('id', 'stock_quantity'))
+            for product_id in sorted(wanted):
+                if stock.get(product_id, 0) < wanted[product_id]:
+                    raise InsufficientStock(product_id, wanted[product_id])
+            raise InsufficientStock(min(wanted), wanted[min(wanted)])
+
+    expires_at = timezone.now() + ttl
+    holds = [
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in sorted(wanted.items())
+    ]
+    StockReservation.objects.bulk_create(holds)
+    return holds
+
+
+def _release(reservations):
+    released = 0
+    for reservation_id, product_id, quantity in reservations.values_list('id', 'product_id', 'quantity'):
+        with transaction.atomic():
+            if _set_status(reservation_id, StockReservation.HELD, StockReservation.RELEASED):
+                _give_back(product_id, quantity)
+                released += 1
+    return released
+
+
+def release(order):
+    """Give back the stock still held for order, e.g. when it is cancelled"""
+    return _release(order.reservations.filter(status=StockReservation.HELD))
+
+
+def release_many(order_ids):
+    """release() for many orders at once, e.g. abandoned ones being cancelled"""
+    return _release(StockReservation.objects.filter(order_id__in=order_ids, status=StockReservation.HELD))
+
+
+def release_expired(product_ids=None, now=None):
+    expired = StockReservation.objects.filter(
+        status=StockReservation.HELD, expires_at__lte=now or timezone.now()
+    )
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+    return _release(expired)
+
+
+def convert(order):
+    """
+    Turn order's holds into sales once it is paid. A hold that has already
+    expired is re-taken if the stock is still there. Returns the ids of
+    products that could not be covered.
+    """
+    short = []
+    with transaction.atomic():
+        for reservation in order.reservations.exclude(status=StockReservation.CONVERTED):
+            if _set_status(reservation.id, StockReservation.HELD, StockReservation.CONVERTED):
+                continue
+            if _take(reservation.product_id, reservation.quantity):
+                _set_status(reservation.id, StockReservation.RELEASED, StockReservation.CONVERTED)
+            else:
+                short.append(reservation.product_id)
+    if short:
+        logger.warning(f"Order {order.id} was paid after its stock hold expired; short on products {short}")
+    return short
+
+
+def convert_many(order_ids):
+    """
+    convert() for many paid orders: live holds are converted with a single
+    UPDATE, and only orders with a released hold go through convert() one by one.
+    """
+    with transaction.atomic():
+        StockReservation.objects.filter(order_id__in=order_ids, status=StockReservation.HELD).update(
+            status=StockReservation.CONVERTED
+        )
+        lapsed = (
+            Order.objects.filter(id__in=order_ids, reservations__status=StockReservation.RELEASED)
+            .distinct()
+        )
+        for order in lapsed:
+            convert(order)
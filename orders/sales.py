@@ -0,0 +1,187 @@
+"""
+Vendor sales over time, from the VendorDailySales rollup.
+
+An order counts towards the rollup while it is paid and not refunded or
+cancelled. sync() is called whenever an order may have changed either way
+(orders.signals on save, payment.confirmation on the bulk paths). It adds the
+order's items on the day the order was placed, or takes them back out, and
+flips Order.sales_counted so each order is counted exactly once. Every order
+counted is recorded per product in OrderSales, and taking it out subtracts
+those rows, so items edited after counting can't leave the rollup off. Each
+change is a grouped INSERT ... SELECT ... ON CONFLICT that adds onto the
+stored totals, the same upsert orders.recommendations uses.
+
+Charts and rankings read at most one row per product per day of the period,
+however long the vendor's sales history is.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from shop.models import Product
+
+from .models import Order, OrderItem, OrderSales, VendorDailySales
+
+ORDER_BATCH_SIZE = 2000
+CHART_PERIODS = (30, 90, 365)
+COUNTED = Q(paid=True) & ~Q(status__in=Order.REVERSED_STATUSES)
+
+
+def _order_totals(order_ids):
+    """(order, vendor, product, day, units, revenue) rows for the items of order_ids as they are now"""
+    return (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .annotate(day=TruncDate('order__created_at'))
+        .values_list('order_id', 'product__vendor_id', 'product_id', 'day')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+        .order_by()
+    )
+
+
+def _daily_totals(order_ids, sign):
+    """(vendor, product, day, units, revenue) rows recorded for order_ids, times sign"""
+    return (
+        OrderSales.objects.filter(order_id__in=order_ids)
+        .values_list('vendor_id', 'product_id', 'day')
+        .annotate(
+            units=Sum(F('units') * Value(sign)),
+            revenue=Sum(F('revenue') * Value(sign), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+        .order_by()
+    )
+
+
+def _apply(order_ids, sign):
+    """Add order_ids' items to the rollup (sign 1), or take back what was added for them (sign -1)"""
+    if not order_ids:
+        return
+    table = VendorDailySales._meta.db_table
+    with connection.cursor() as cursor:
+        if sign > 0:
+            sql, params = _order_totals(order_ids).query.sql_with_params()
+            cursor.execute(
+                f"""
+                INSERT INTO {OrderSales._meta.db_table} (order_id, vendor_id, product_id, day, units, revenue)
+                {sql}
+                """,
+                params,
+            )
+        sql, params = _daily_totals(order_ids, sign).query.sql_with_params()
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (vendor_id, product_id, day, units, revenue)
+            {sql}
+            ON CONFLICT (vendor_id, product_id, day)
+            DO UPDATE SET units = {table}.units + excluded.units,
+                          revenue = {table}.revenue + excluded.revenue
+            """,
+            params,
+        )
+    if sign < 0:
+        OrderSales.objects.filter(order_id__in=order_ids).delete()
+
+
+def sync(order_ids):
+    """Bring the rollup in line with the current paid and status state of order_ids"""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    with transaction.atomic():
+        orders = Order.objects.select_for_update().filter(id__in=order_ids)
+        added = list(orders.filter(COUNTED, sales_counted=False).values_list('id', flat=True))
+        removed = list(orders.filter(sales_counted=True).exclude(COUNTED).values_list('id', flat=True))
+        _apply(added, 1)
+        _apply(removed, -1)
+        if added:
+            Order.objects.filter(id__in=added).update(sales_counted=True)
+        if removed:
+            Order.objects.filter(id__in=removed).update(sales_counted=False)
+
+
+def forget(order):
+    """Take a counted order out of the rollup before it is deleted"""
+    if Order.objects.filter(id=order.id, sales_counted=True).update(sales_counted=False):
+        _apply([order.id], -1)
+
+
+def backfill(batch_size=ORDER_BATCH_SIZE, rebuild=False):
+    """
+    Count every paid order that isn't in the rollup yet, batch_size orders
+    per pass. rebuild drops the rollup and counts everything again.
+    Returns the number of orders counted.
+    """
+    if rebuild:
+        with transaction.atomic():
+            VendorDailySales.objects.all().delete()
+            OrderSales.objects.all().delete()
+            Order.objects.filter(sales_counted=True).update(sales_counted=False)
+    pending = Order.objects.filter(COUNTED, sales_counted=False)
+    total = 0
+    while True:
+        with transaction.atomic():
+            order_ids = list(pending.order_by().values_list('id', flat=True)[:batch_size])
+            if not order_ids:
+                break
+            _apply(order_ids, 1)
+            Order.objects.filter(id__in=order_ids).update(sales_counted=True)
+        total += len(order_ids)
+    return total
+
+
+def _period(days, today):
+    today = today or timezone.localdate()
+    return today - timedelta(days=days - 1), today
+
+
+def chart(vendor, days, today=None):
+    """
+    Revenue and units per day for the last days days, or per week for
+    periods longer than 90 days. Each bar has a height in percent of the best one.
+    """
+    start, end = _period(days, today)
+    totals = {
+        row['day']: row for row in
+        VendorDailySales.objects.filter(vendor=vendor, day__range=(start, end))
+        .values('day').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by()
+    }
+    step = 1 if days <= 90 else 7
+    bars = []
+    for offset in range(0, days, step):
+        first = start + timedelta(days=offset)
+        span = [first + timedelta(days=i) for i in range(min(step, days - offset))]
+        rows = [totals[day] for day in span if day in totals]
+        bars.append({
+            'start': first,
+            'end': span[-1],
+            'units': sum(row['units'] for row in rows),
+            'revenue': sum((row['revenue'] for row in rows), 0),
+        })
+    best = max((bar['revenue'] for bar in bars), default=0)
+    for bar in bars:
+        bar['height'] = int(bar['revenue'] * 100 / best) if best > 0 else 0
+    return bars
+
+
+def top_products(vendor, days, limit=5, today=None):
+    """The vendor's best sellers by units over the last days days, with total_sold and period_revenue set"""
+    start, end = _period(days, today)
+    ranked = list(
+        VendorDailySales.objects.filter(vendor=vendor, day__range=(start, end))
+        .values('product_id').annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .filter(units__gt=0).order_by('-units', '-revenue', 'product_id')[:limit]
+    )
+    products = Product.objects.select_related('category').in_bulk([row['product_id'] for row in ranked])
+    ranking = []
+    for row in ranked:
+        product = products.get(row['product_id'])
+        if product is not None:
+            product.total_sold = row['units']
+            product.period_revenue = row['revenue']
+            ranking.append(product)
+    return ranking
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
@@ -11,4 +11,17 @@ def order_status_changed(sender, instance, created, **kwargs):
     if not created and instance.user and instance.user.email:
         if instance.status in ['processing', 'shipped', 'delivered', 'cancelled']:
             from core.email_utils import send_order_status_email
-            send_order_status_email(instance)
\ No newline at end of file
+            send_order_status_email(instance)
+
+@receiver(post_save, sender=Order)
+def order_sales_changed(sender, instance, **kwargs):
+    # Orders that were never paid have nothing in the sales rollup to change.
+    # save() doesn't write sales_counted, and sync() reads it again under lock
+    if instance.paid or instance.sales_counted:
+        from .sales import sync
+        sync([instance.id])
+
+@receiver(pre_delete, sender=Order)
+def order_sales_deleted(sender, instance, **kwargs):
+    from .sales import forget
+    forget(instance)
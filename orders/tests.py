@@ -1,3 +1,371 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cart.models import CartItem
+from core.email_utils import send_order_confirmation_email, send_order_status_email
+from shop.models import Category, Product, Vendor
+
+from . import recommendations, sales
+from .loading import ORDER_QUERIES, load_order, with_lines
+from .models import CoPurchase, Order, OrderItem, OrderSales, Recommendation, StockReservation, VendorDailySales
+from .reservations import InsufficientStock, convert, release, release_expired, reserve
+
+# order_create: the six checkout queries listed in its docstring, plus the
+# session read and write, the user, the cart rows and six savepoint statements
+CHECKOUT_QUERIES = 16
+
+
+def make_products(count, stock=10, price=Decimal('20.00'), prefix='Product'):
+    user = User.objects.create(username=f'{prefix.lower()}-vendor')
+    vendor = Vendor.objects.create(user=user, shop_name=f'{prefix} Store')
+    category = Category.objects.create(name=f'{prefix} Category')
+    return [
+        Product.objects.create(
+            vendor=vendor, category=category, name=f'{prefix} {i}', description='-',
+            price=price, stock_quantity=stock, image='product_images/test.jpg',
+        )
+        for i in range(count)
+    ]
+
+
+def make_order(products, quantity=1, **fields):
+    order = Order.objects.create(
+        full_name='Test Customer', email='customer@example.com', phone='0200000000',
+        address='1 Test St', city='Accra', total_paid=sum(p.price * quantity for p in products), **fields,
+    )
+    for product in products:
+        OrderItem.objects.create(order=order, product=product, price=product.price, quantity=quantity)
+    return order
+
+
+class RecommendationCountTests(TestCase):
+    def setUp(self):
+        self.a, self.b = make_products(2)
+
+    def pair(self):
+        return CoPurchase.objects.filter(product_a=self.a, product_b=self.b).values_list('orders', flat=True).first()
+
+    def test_stale_instance_save_does_not_recount_order(self):
+        order = make_order([self.a, self.b], paid=True, status='paid')
+        stale = Order.objects.get(id=order.id)
+        self.assertEqual(recommendations.update(), (1, 2))
+
+        stale.status = 'shipped'
+        stale.save()
+        self.assertTrue(Order.objects.get(id=order.id).co_purchase_counted)
+        self.assertEqual(recommendations.update(), (0, 0))
+        self.assertEqual(self.pair(), 1)
+
+    def test_refunded_and_cancelled_orders_are_subtracted(self):
+        refunded = make_order([self.a, self.b], paid=True, status='paid')
+        cancelled = make_order([self.a, self.b], paid=True, status='paid')
+        recommendations.update()
+        self.assertEqual(self.pair(), 2)
+        self.assertTrue(Recommendation.objects.filter(product=self.a, recommended=self.b).exists())
+
+        Order.objects.filter(id=refunded.id).update(status='refunded')
+        Order.objects.filter(id=cancelled.id).update(status='cancelled')
+        self.assertEqual(recommendations.update(), (2, 2))
+        self.assertEqual(self.pair(), 0)
+        self.assertFalse(Recommendation.objects.filter(product=self.a).exists())
+        self.assertFalse(Order.objects.filter(co_purchase_counted=True).exists())
+
+    def test_rebuild_matches_incremental_counts(self):
+        make_order([self.a, self.b], paid=True, status='paid')
+        make_order([self.a], paid=True, status='paid')
+        make_order([self.a, self.b], paid=True, status='refunded')
+        make_order([self.a, self.b])
+        recommendations.update()
+        incremental = sorted(CoPurchase.objects.values_list('product_a', 'product_b', 'orders'))
+        recommendations.rebuild()
+        self.assertEqual(sorted(CoPurchase.objects.values_list('product_a', 'product_b', 'orders')), incremental)
+
+
+def stock_of(product):
+    return Product.objects.values_list('stock_quantity', flat=True).get(id=product.id)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.a, self.b = make_products(2, stock=5)
+
+    def test_reserve_is_all_or_nothing(self):
+        order = make_order([self.a, self.b], quantity=3)
+        reserve(order)
+        self.assertEqual((stock_of(self.a), stock_of(self.b)), (2, 2))
+
+        short = make_order([self.a, self.b], quantity=1)
+        Product.objects.filter(id=self.b.id).update(stock_quantity=0)
+        with self.assertRaises(InsufficientStock) as raised:
+            with transaction.atomic():
+                reserve(short)
+        self.assertEqual(raised.exception.product_id, self.b.id)
+        self.assertEqual(stock_of(self.a), 2)
+        self.assertFalse(short.reservations.exists())
+
+    def test_reserve_locks_products_in_id_order_before_updating(self):
+        order = make_order([self.b, self.a])
+        product_table = Product._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            reserve(order)
+        product_queries = [q['sql'] for q in queries.captured_queries if f'"{product_table}"' in q['sql']]
+        self.assertEqual(len(product_queries), 2)
+        self.assertTrue(product_queries[0].startswith('SELECT'))
+        self.assertRegex(product_queries[0], r'ORDER BY (1|"\w+"\."id") ASC')
+        self.assertTrue(product_queries[1].startswith('UPDATE'))
+
+    def test_release_gives_stock_back_once(self):
+        order = make_order([self.a], quantity=4)
+        reserve(order)
+        self.assertEqual(release(order), 1)
+        self.assertEqual(release(order), 0)
+        self.assertEqual(stock_of(self.a), 5)
+
+    def test_expired_holds_are_swept_when_stock_runs_short(self):
+        stale = make_order([self.a], quantity=5)
+        reserve(stale, ttl=timedelta(minutes=-1))
+        fresh = make_order([self.a], quantity=5)
+        reserve(fresh)
+        self.assertEqual(stale.reservations.get().status, StockReservation.RELEASED)
+        self.assertEqual(stock_of(self.a), 0)
+
+    def test_convert_retakes_lapsed_hold_if_stock_remains(self):
+        order = make_order([self.a], quantity=2)
+        reserve(order, ttl=timedelta(minutes=-1))
+        release_expired(now=timezone.now())
+        self.assertEqual(stock_of(self.a), 5)
+        self.assertEqual(convert(order), [])
+        self.assertEqual(order.reservations.get().status, StockReservation.CONVERTED)
+        self.assertEqual(stock_of(self.a), 3)
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """Checkouts racing for one product from several threads, each with its own connection"""
+    threads = 8
+    orders_per_thread = 10
+    stock = 30
+
+    def checkout(self, product, attempts=200):
+        for attempt in range(attempts):
+            try:
+                with transaction.atomic():
+                    order = make_order([product])
+                    reserve(order)
+                return True
+            except InsufficientStock:
+                return False
+            except OperationalError:
+                # SQLite lets one writer in at a time; the in-memory test database
+                # reports a locked table at once instead of waiting for it
+                time.sleep(0.001 * min(attempt + 1, 20))
+        raise AssertionError('Checkout kept failing with database errors')
+
+    def test_stock_is_never_oversold(self):
+        product, = make_products(1, stock=self.stock, price=Decimal('10.00'))
+        results = []
+        errors = []
+        start = threading.Barrier(self.threads)
+
+        def buyer():
+            start.wait()
+            try:
+                for _ in range(self.orders_per_thread):
+                    results.append(self.checkout(product))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buyer) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        held = sum(StockReservation.objects.filter(product=product).values_list('quantity', flat=True))
+        self.assertEqual(results.count(True), self.stock)
+        self.assertEqual(held, self.stock)
+        self.assertEqual(stock_of(product), 0)
+
+
+class OrderLoadingQueryTests(TestCase):
+    """Loading an order, and the emails built from it, cost the same queries for one line or many"""
+    sizes = (1, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = make_products(max(cls.sizes))
+        cls.customer = User.objects.create(username='loading-customer', email='loading@example.com')
+        cls.orders = [make_order(cls.products[:size], user=cls.customer, status='processing') for size in cls.sizes]
+
+    def test_load_order_reads_lines_up_front(self):
+        for order in self.orders:
+            with self.subTest(lines=order.items.count()):
+                with self.assertNumQueries(ORDER_QUERIES):
+                    loaded = load_order(id=order.id)
+                    self.assertEqual(loaded.user, self.customer)
+                    for item in loaded.items.all():
+                        item.product.vendor.shop_name
+
+    def test_with_lines_loads_many_orders_at_once(self):
+        with self.assertNumQueries(ORDER_QUERIES):
+            orders = list(with_lines(Order.objects.filter(user=self.customer)))
+            self.assertEqual(sum(len(order.items.all()) for order in orders), sum(self.sizes))
+            for order in orders:
+                for item in order.items.all():
+                    item.product.vendor.shop_name
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_order_emails(self):
+        # The emails load the order, then add it to the outbox
+        for send in (send_order_confirmation_email, send_order_status_email):
+            for order in self.orders:
+                with self.subTest(send.__name__, lines=order.items.count()):
+                    # A bare instance, as the views and signals hand over
+                    order = Order.objects.get(id=order.id)
+                    with self.assertNumQueries(ORDER_QUERIES + 1):
+                        send(order)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.a, self.b = make_products(2, price=Decimal('20.00'))
+
+    def rollup(self):
+        totals = VendorDailySales.objects.aggregate(units=Sum('units'), revenue=Sum('revenue'))
+        return totals['units'] or 0, totals['revenue'] or 0
+
+    def pay(self, order):
+        order.paid, order.status = True, 'paid'
+        order.save()
+
+    def test_saving_an_order_costs_one_query(self):
+        order = make_order([self.a])
+        order.city = 'Kumasi'
+        with self.assertNumQueries(1):
+            order.save()
+
+    def test_paid_order_is_counted_once(self):
+        order = make_order([self.a, self.b], quantity=2)
+        self.assertEqual(self.rollup(), (0, 0))
+        self.pay(order)
+        self.assertEqual(self.rollup(), (4, Decimal('80.00')))
+        self.assertTrue(Order.objects.get(id=order.id).sales_counted)
+
+        order.status = 'processing'
+        order.save()
+        self.assertEqual(self.rollup(), (4, Decimal('80.00')))
+
+    def test_stale_instance_save_does_not_recount_order(self):
+        order = make_order([self.a])
+        stale = Order.objects.get(id=order.id)
+        self.pay(order)
+        stale.paid, stale.status = True, 'shipped'
+        stale.save()
+        self.assertEqual(self.rollup(), (1, Decimal('20.00')))
+
+    def test_refunded_and_cancelled_orders_are_taken_out(self):
+        for status in Order.REVERSED_STATUSES:
+            with self.subTest(status):
+                order = make_order([self.a])
+                self.pay(order)
+                self.assertEqual(self.rollup(), (1, Decimal('20.00')))
+                order.status = status
+                order.save()
+                self.assertEqual(self.rollup(), (0, 0))
+                self.assertFalse(Order.objects.get(id=order.id).sales_counted)
+                self.assertFalse(OrderSales.objects.exists())
+
+    def test_reinstated_order_is_counted_again(self):
+        order = make_order([self.a])
+        self.pay(order)
+        order.status = 'cancelled'
+        order.save()
+        order.status = 'paid'
+        order.save()
+        self.assertEqual(self.rollup(), (1, Decimal('20.00')))
+
+    def test_deleted_order_is_taken_out(self):
+        paid, unpaid = make_order([self.a, self.b]), make_order([self.a])
+        self.pay(paid)
+        paid.delete()
+        unpaid.delete()
+        self.assertEqual(self.rollup(), (0, 0))
+
+    def test_items_edited_after_counting_are_taken_out_as_counted(self):
+        order = make_order([self.a], quantity=2)
+        self.pay(order)
+        OrderItem.objects.filter(order=order).update(quantity=5, price=Decimal('15.00'))
+        OrderItem.objects.create(order=order, product=self.b, price=self.b.price, quantity=1)
+        order.status = 'refunded'
+        order.save()
+        self.assertEqual(self.rollup(), (0, 0))
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.pay(make_order([self.a, self.b], quantity=3))
+        self.pay(make_order([self.a]))
+        refunded = make_order([self.b])
+        self.pay(refunded)
+        refunded.status = 'refunded'
+        refunded.save()
+        incremental = sorted(VendorDailySales.objects.values_list('product', 'day', 'units', 'revenue'))
+        self.assertEqual(sales.backfill(rebuild=True), 2)
+        self.assertEqual(sorted(VendorDailySales.objects.values_list('product', 'day', 'units', 'revenue')), incremental)
+
+
+class CheckoutTests(TestCase):
+    form = {
+        'full_name': 'Test Customer', 'email': 'customer@example.com', 'phone': '0200000000',
+        'address': '1 Test St', 'city': 'Accra',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = make_products(100, stock=10)
+        cls.customer = User.objects.create(username='checkout-customer', email='checkout@example.com')
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+
+    def fill_cart(self, products, quantity=2):
+        CartItem.objects.all().delete()
+        for product in products:
+            self.client.post(reverse('cart:add_to_cart', args=[product.id]), {'quantity': quantity})
+
+    def checkout(self):
+        return self.client.post(reverse('orders:order_create'), self.form)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        for size in (1, 100):
+            self.fill_cart(self.products[:size])
+            with self.subTest(lines=size), self.assertNumQueries(CHECKOUT_QUERIES):
+                response = self.checkout()
+            self.assertRedirects(response, reverse('payment:process'), fetch_redirect_response=False)
+            order = Order.objects.get(id=self.client.session['order_id'])
+            self.assertEqual(order.items.count(), size)
+            self.assertEqual(order.total_paid, size * 2 * Decimal('20.00'))
+            self.assertEqual(order.reservations.count(), size)
+
+    def test_short_stock_rolls_the_whole_order_back(self):
+        first, short, last = self.products[:3]
+        self.fill_cart([first, short, last])
+        Product.objects.filter(id=short.id).update(stock_quantity=1)
+
+        response = self.checkout()
+        self.assertRedirects(response, reverse('cart:cart_detail'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual([stock_of(product) for product in (first, short, last)], [10, 1, 10])
+        self.assertEqual(CartItem.objects.count(), 3)
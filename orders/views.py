@@ -1,31 +1,68 @@
+from collections import defaultdict
 from django.shortcuts import render, redirect, get_object_or_404
 from django.conf import settings
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
+from django.db import transaction
 from .models import Order, OrderItem
 from .forms import OrderCreateForm
+from .reservations import InsufficientStock, reserve
 from cart.cart import Cart
 
 @login_required
 def order_create(request):
+    """
+    Checkout. Placing the order runs in one transaction with a fixed number of
+    queries, whatever the size of the cart:
+
+      1 SELECT  the cart's products (Cart.lines(), which also reprices every line)
+      1 INSERT  the order
+      1 INSERT  all order items (bulk_create)
+      1 SELECT  ... FOR UPDATE locking the products in id order (reservations.reserve)
+      1 UPDATE  stock for every product at once
+      1 INSERT  the stock holds
+
+    plus the session, user and cart lookups every request makes.
+    """
     cart = Cart(request)
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
         if form.is_valid():
-            order = form.save(commit=False)
-            order.user = request.user
-            order.total_paid = cart.get_total_price()
-            order.save()
+            lines = cart.lines()
+            if not lines:
+                messages.error(request, 'Your cart is empty.')
+                return redirect('cart:cart_detail')
+
+            wanted = defaultdict(int)
+            for line in lines:
+                wanted[line['product'].id] += line['quantity']
+            try:
+                with transaction.atomic():
+                    order = form.save(commit=False)
+                    order.user = request.user
+                    order.total_paid = cart.get_total_price()
+                    order.save()
+
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order,
+                                  product=line['product'],
+                                  price=line['price'],
+                                  quantity=line['quantity'])
+                        for line in lines
+                    ])
+
+                    # Hold the stock until the payment comes back
+                    reserve(order, wanted)
+            except InsufficientStock as error:
+                names = {line['product'].id: line['product'].name for line in lines}
+                name = names.get(error.product_id, 'an item in your cart')
+                messages.error(request, f'Sorry, there is not enough stock left of "{name}" to place this order.')
+                return redirect('cart:cart_detail')
 
-            for item in cart:
-                OrderItem.objects.create(order=order,
-                                         product=item['product'],
-                                         price=item['price'],
-                                         quantity=item['quantity'])
-            
             request.session['order_id'] = str(order.id)
             return redirect(reverse('payment:process'))
     else:
         form = OrderCreateForm()
     
-    return render(request, 'orders/order_create.html', {'cart': cart, 'form': form})
\ No newline at end of file
+    return render(request, 'orders/order_create.html', {'cart': cart, 'form': form})
@@ -0,0 +1,100 @@
+"""
+Marking orders paid once Paystack has confirmed the money.
+
+The paid flag flips with a conditional UPDATE (paid=False -> True), so when
+several paths confirm the same order at once, exactly one of them converts
+the stock holds and queues the confirmation email. A Paystack reference pays
+for one order at most: the UPDATE skips references a paid order already
+has, and a unique constraint on paid orders' references backs that up.
+
+The email is queued with transaction.on_commit, once the orders are paid and
+their row locks released, so loading and rendering it never holds them up.
+"""
+import logging
+import secrets
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists
+from django.utils import timezone
+
+from core.email_utils import send_order_confirmation_email
+from orders.loading import with_lines
+from orders.models import Order
+from orders.reservations import convert, convert_many
+from orders.sales import sync as sync_sales
+
+logger = logging.getLogger(__name__)
+
+
+def new_reference(order):
+    """A fresh, unguessable Paystack reference for a payment attempt on order"""
+    return f'{order.id.hex[:12]}-{secrets.token_hex(6)}'
+
+
+def _used(references):
+    """Paid orders that already used any of references"""
+    return Order.objects.filter(paid=True, paystack_reference__in=references)
+
+
+def confirm(order, verification):
+    """
+    Mark order paid if verification is a successful payment of its total.
+    Returns True if this call marked it paid. A reference that already paid
+    for an order never pays for another.
+    """
+    if not verification.covers(order):
+        if verification.successful:
+            logger.error(f"Payment {verification.reference} doesn't match order {order.id}: "
+                         f"{verification.amount} {verification.currency}")
+        return False
+    try:
+        with transaction.atomic():
+            marked = (
+                Order.objects.filter(id=order.id, paid=False, paystack_reference=verification.reference)
+                .exclude(Exists(_used([verification.reference])))
+                .update(paid=True, status='paid', updated_at=timezone.now())
+            ) == 1
+            if marked:
+                order.paid, order.status = True, 'paid'
+                convert(order)
+                sync_sales([order.id])
+                transaction.on_commit(lambda: send_order_confirmation_email(order))
+    except IntegrityError:
+        # Another order was confirmed with the same reference at the same moment
+        marked = False
+    if not marked and _used([verification.reference]).exclude(id=order.id).exists():
+        logger.error(f'Payment {verification.reference} already paid for another order, not for order {order.id}')
+    return marked
+
+
+def confirm_many(pairs):
+    """
+    confirm() for many (order, verification) pairs at once, with bulk
+    updates. Returns the ids of the orders this call marked paid.
+    """
+    covered = {}
+    for order, verification in pairs:
+        if verification.covers(order):
+            covered.setdefault(verification.reference, order.id)
+    if not covered:
+        return []
+
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(id__in=list(covered.values()), paid=False)
+            .exclude(paystack_reference__in=_used(list(covered)).values('paystack_reference'))
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            return []
+        Order.objects.filter(id__in=ids).update(paid=True, status='paid', updated_at=timezone.now())
+        convert_many(ids)
+        sync_sales(ids)
+        transaction.on_commit(lambda: _send_confirmations(ids))
+    return ids
+
+
+def _send_confirmations(order_ids):
+    for order in with_lines(Order.objects.filter(id__in=order_ids)):
+        send_order_confirmation_email(order)
@@ -0,0 +1,123 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core.models import OutboxEmail
+from orders.models import Order
+from payment import paystack
+from payment.confirmation import new_reference
+from payment.stub import PaystackStub
+
+
+class Command(BaseCommand):
+    help = 'Measure payment_callback latency under concurrent callbacks against a local Paystack stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--callbacks', type=int, default=200,
+                            help='Number of orders to pay, one callback each')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Callbacks in flight at once')
+        parser.add_argument('--latency', type=float, default=0.08,
+                            help='Seconds the stub takes to answer, standing in for the round trip to Paystack')
+
+    def handle(self, *args, **options):
+        with PaystackStub(options['latency']) as stub, override_settings(
+            PAYSTACK_BASE_URL=stub.base_url, ALLOWED_HOSTS=['testserver'],
+        ):
+            paystack.reset_client()
+            paystack.breaker.record_success()
+            user = User.objects.create(username=f'callback-benchmark-{uuid.uuid4().hex[:8]}')
+            first_email = OutboxEmail.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            try:
+                self.run(stub, user, options)
+            finally:
+                # Orders are deleted with the user's, since threads can't share a rolled-back transaction
+                OutboxEmail.objects.filter(id__gt=first_email).delete()
+                Order.objects.filter(user=user).delete()
+                user.delete()
+                paystack.reset_client()
+                paystack.breaker.record_success()
+
+    def run(self, stub, user, options):
+        callbacks = []
+        for _ in range(options['callbacks']):
+            order = Order.objects.create(
+                user=user, full_name='Benchmark', email='benchmark@example.com', phone='0200000000',
+                address='1 Benchmark St', city='Accra', total_paid=Decimal('125.50'),
+            )
+            reference = new_reference(order)
+            Order.objects.filter(id=order.id).update(paystack_reference=reference)
+            stub.add(reference, amount=12550, order_id=order.id)
+            client = Client()
+            client.force_login(user)
+            session = client.session
+            session['order_id'] = str(order.id)
+            session.save()
+            callbacks.append((client, reference))
+
+        url = reverse('payment:callback')
+        self.stdout.write(
+            f'{len(callbacks)} callbacks, {options["concurrency"]} at a time, '
+            f'stub answering in {options["latency"] * 1000:.0f}ms'
+        )
+
+        requests, connections = stub.requests, stub.connections
+        self.measure('First callbacks (verify and mark paid)', callbacks, url, options['concurrency'])
+        if Order.objects.filter(user=user, paid=False).exists():
+            raise CommandError('Some orders were not marked paid')
+        self.stdout.write(
+            f'    {stub.requests - requests} verify calls over {stub.connections - connections} connections'
+        )
+
+        requests = stub.requests
+        self.measure('Repeated callbacks (already paid)', callbacks, url, options['concurrency'])
+        self.stdout.write(f'    {stub.requests - requests} verify calls')
+
+        Order.objects.filter(user=user).update(paid=False, status='pending')
+        requests = stub.requests
+        self.measure('Callbacks after a lost update (cached verification)', callbacks, url, options['concurrency'])
+        self.stdout.write(f'    {stub.requests - requests} verify calls')
+
+        Order.objects.filter(user=user).update(paid=False, status='pending')
+        for client, reference in callbacks:
+            stub.transactions[reference + '-retry'] = stub.transactions[reference]
+        callbacks = [(client, reference + '-retry') for client, reference in callbacks]
+        stub.failing = True
+        requests = stub.requests
+        self.measure('Callbacks with Paystack down', callbacks, url, options['concurrency'])
+        self.stdout.write(
+            f'    {stub.requests - requests} verify calls before the circuit opened; '
+            f'the rest failed fast'
+        )
+        self.stdout.write(self.style.SUCCESS('✓ Callback benchmark complete'))
+
+    def measure(self, label, callbacks, url, concurrency):
+        def call(callback):
+            client, reference = callback
+            try:
+                started = time.perf_counter()
+                response = client.get(url, {'reference': reference})
+                return time.perf_counter() - started, response.status_code
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(call, callbacks))
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(duration * 1000 for duration, _ in results)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f'  {label}: {len(results) / elapsed:.0f}/s, p50 {statistics.median(timings):.1f}ms, '
+            f'p99 {p99:.1f}ms, statuses {sorted(set(status for _, status in results))}'
+        )
@@ -0,0 +1,137 @@
+import random
+import resource
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.models import OutboxEmail
+from orders.models import Order
+from payment import paystack, reconciliation
+from payment.models import ReconciliationCheckpoint
+from payment.stub import PaystackStub
+
+CHECKPOINT_NAME = 'benchmark_reconcile'
+
+
+class _Interrupt(Exception):
+    pass
+
+
+def _max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Reconcile seeded pending orders against a local Paystack stub, with an interruption and resume'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000,
+                            help='Pending orders to seed')
+        parser.add_argument('--latency', type=float, default=0.002,
+                            help='Seconds the stub takes to answer each verification')
+        parser.add_argument('--workers', type=int, default=reconciliation.WORKERS,
+                            help='Verification calls in flight at once')
+        parser.add_argument('--page-size', type=int, default=reconciliation.PAGE_SIZE,
+                            help='Pending orders per page')
+
+    def handle(self, *args, **options):
+        user = User.objects.create(username=f'reconcile-benchmark-{uuid.uuid4().hex[:8]}')
+        first_email = OutboxEmail.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        with PaystackStub(options['latency']) as stub, override_settings(PAYSTACK_BASE_URL=stub.base_url):
+            paystack.reset_client()
+            try:
+                self.run(stub, user, options)
+            finally:
+                # The run commits page by page, so clean up by hand
+                ReconciliationCheckpoint.objects.filter(name=CHECKPOINT_NAME).delete()
+                OutboxEmail.objects.filter(id__gt=first_email).delete()
+                Order.objects.filter(user=user).delete()
+                user.delete()
+                paystack.reset_client()
+
+    def run(self, stub, user, options):
+        expected = self.seed(stub, user, options['orders'])
+        self.stdout.write(
+            f'Seeded {options["orders"]} pending orders: {expected["paid"]} paid on Paystack, '
+            f'{expected["expired"]} abandoned past the threshold'
+        )
+        rss_before = _max_rss_mb()
+        interrupt_after = max(1, options['orders'] // options['page_size'] // 2)
+
+        def interrupt(report):
+            if report.pages == interrupt_after:
+                raise _Interrupt
+
+        run = dict(page_size=options['page_size'], workers=options['workers'], name=CHECKPOINT_NAME)
+        started = time.perf_counter()
+        try:
+            reconciliation.reconcile(progress=interrupt, **run)
+            raise CommandError('The run was not interrupted')
+        except _Interrupt:
+            pass
+        first = time.perf_counter() - started
+        checkpoint = ReconciliationCheckpoint.objects.get(name=CHECKPOINT_NAME)
+        self.stdout.write(f'  Interrupted after {interrupt_after} pages ({first:.1f}s), '
+                          f'checkpoint at {checkpoint.last_created_at:%Y-%m-%d %H:%M}')
+
+        requests = stub.requests
+        started = time.perf_counter()
+        report = reconciliation.reconcile(**run)
+        second = time.perf_counter() - started
+        self.stdout.write(
+            f'  Resumed: {report.pages} pages, {report.checked} orders, {stub.requests - requests} verify calls '
+            f'in {second:.1f}s'
+        )
+
+        total = first + second
+        paid = Order.objects.filter(user=user, paid=True).count()
+        expired = Order.objects.filter(user=user, status='cancelled').count()
+        self.stdout.write(
+            f'Reconciled {options["orders"]} orders in {total:.1f}s ({options["orders"] / total:.0f}/s): '
+            f'{paid} paid, {expired} cancelled; peak RSS grew {_max_rss_mb() - rss_before:.0f}MB'
+        )
+        if not report.complete or paid != expected['paid'] or expired != expected['expired']:
+            raise CommandError(f'Expected {expected["paid"]} paid and {expected["expired"]} cancelled')
+        self.stdout.write(self.style.SUCCESS('✓ Reconciliation benchmark complete'))
+
+    def seed(self, stub, user, count, batch_size=5000):
+        rng = random.Random(22)
+        now = timezone.now()
+        expected = {'paid': 0, 'expired': 0}
+        for start in range(0, count, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, count)):
+                order = Order(
+                    user=user, full_name='Benchmark', email='benchmark@example.com', phone='0200000000',
+                    address='1 Benchmark St', city='Accra', total_paid=Decimal('45.00'),
+                )
+                roll = rng.random()
+                if roll < 0.9:
+                    order.paystack_reference = f'{order.id.hex[:12]}-{i:06x}'
+                if roll < 0.1:
+                    stub.add(order.paystack_reference, amount=4500, order_id=order.id)
+                elif roll < 0.3:
+                    stub.add(order.paystack_reference, amount=4500, status='abandoned', order_id=order.id)
+                elif roll < 0.4:
+                    stub.add(order.paystack_reference, amount=4500, status='failed', order_id=order.id)
+                batch.append(order)
+            Order.objects.bulk_create(batch)
+            # created_at is set on insert; age half of each batch past the expiry threshold
+            ids = [order.id for order in batch]
+            old = ids[::2]
+            Order.objects.filter(id__in=old).update(created_at=now - timedelta(days=3))
+            Order.objects.filter(id__in=ids[1::2]).update(created_at=now - timedelta(hours=1))
+            old = set(old)
+            for order in batch:
+                if 'success' == stub.transactions.get(order.paystack_reference, {}).get('status'):
+                    expected['paid'] += 1
+                elif order.id in old:
+                    expected['expired'] += 1
+        return expected
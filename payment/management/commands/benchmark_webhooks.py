@@ -0,0 +1,103 @@
+import json
+import random
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core.models import OutboxEmail
+from orders.models import Order
+from payment import webhooks
+from payment.confirmation import new_reference
+from payment.models import WebhookEvent
+
+
+class Command(BaseCommand):
+    help = 'Post a burst of signed Paystack webhooks, replays included, and time the ack and the processing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000,
+                            help='Orders paid through a charge.success event each')
+        parser.add_argument('--replays', type=int, default=2,
+                            help='Extra deliveries of every event')
+
+    def handle(self, *args, **options):
+        user = User.objects.create(username=f'webhook-benchmark-{uuid.uuid4().hex[:8]}')
+        first_email = OutboxEmail.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        first_event = WebhookEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                self.run(user, options, first_email)
+        finally:
+            # The processor commits as it goes, so clean up by hand
+            OutboxEmail.objects.filter(id__gt=first_email).delete()
+            WebhookEvent.objects.filter(id__gt=first_event).delete()
+            Order.objects.filter(user=user).delete()
+            user.delete()
+
+    def run(self, user, options, first_email):
+        rng = random.Random(21)
+        bodies = []
+        for _ in range(options['orders']):
+            order = Order.objects.create(
+                user=user, full_name='Benchmark', email='benchmark@example.com', phone='0200000000',
+                address='1 Benchmark St', city='Accra', total_paid=Decimal('80.00'),
+            )
+            reference = new_reference(order)
+            Order.objects.filter(id=order.id).update(paystack_reference=reference)
+            bodies.append(json.dumps({'event': 'charge.success', 'data': {
+                'id': rng.randrange(10 ** 12), 'reference': reference, 'status': 'success',
+                'amount': 8000, 'currency': settings.PAYSTACK_CURRENCY, 'metadata': {'order_id': str(order.id)},
+            }}).encode('utf-8'))
+        deliveries = bodies * (options['replays'] + 1)
+        rng.shuffle(deliveries)
+
+        client = Client()
+        url = reverse('payment:webhook')
+        if client.post(url, bodies[0], content_type='application/json',
+                       HTTP_X_PAYSTACK_SIGNATURE='0' * 128).status_code != 400:
+            raise CommandError('A bad signature was accepted')
+
+        timings = []
+        started = time.perf_counter()
+        for body in deliveries:
+            sent = time.perf_counter()
+            response = client.post(url, body, content_type='application/json',
+                                   HTTP_X_PAYSTACK_SIGNATURE=webhooks.signature(body))
+            timings.append((time.perf_counter() - sent) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'Webhook answered {response.status_code}')
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        self.stdout.write(
+            f'Acked {len(deliveries)} deliveries ({len(bodies)} events) at {len(deliveries) / elapsed * 60:.0f}/min: '
+            f'p50 {statistics.median(timings):.2f}ms, p99 {timings[int(len(timings) * 0.99)]:.2f}ms'
+        )
+        stored = WebhookEvent.objects.filter(event_id__in=[
+            f"charge.success:{json.loads(body)['data']['id']}" for body in bodies
+        ]).count()
+        self.stdout.write(f'  {stored} events stored; replays dropped by the unique event id')
+
+        started = time.perf_counter()
+        counts = webhooks.drain()
+        self.stdout.write(f'Processed {counts} in {time.perf_counter() - started:.2f}s')
+
+        unpaid = Order.objects.filter(user=user, paid=False).count()
+        emails = OutboxEmail.objects.filter(id__gt=first_email).count()
+        if unpaid or stored != len(bodies):
+            raise CommandError(f'{unpaid} orders left unpaid, {stored} of {len(bodies)} events stored')
+        self.stdout.write(f'  Every order paid; {emails} confirmation emails queued')
+
+        for body in bodies:
+            client.post(url, body, content_type='application/json', HTTP_X_PAYSTACK_SIGNATURE=webhooks.signature(body))
+        counts = webhooks.drain()
+        if counts:
+            raise CommandError(f'Replays after processing were applied again: {counts}')
+        self.stdout.write(self.style.SUCCESS('✓ Replays after processing changed nothing'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payment import webhooks
+
+
+class Command(BaseCommand):
+    help = 'Apply stored Paystack webhook events, retrying failures with exponential backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=webhooks.BATCH_SIZE,
+                            help='Number of events to claim at a time')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to wait between polls when there is nothing to do')
+        parser.add_argument('--once', action='store_true',
+                            help='Process what is due now and exit instead of polling')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = webhooks.drain(options['batch_size'])
+            if counts or options['once']:
+                summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items())) or 'nothing to do'
+                self.stdout.write(self.style.SUCCESS(f'✓ Webhook events: {summary}'))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payment import reconciliation
+
+
+class Command(BaseCommand):
+    help = 'Verify pending orders against Paystack, confirm the paid ones and cancel abandoned ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=reconciliation.PAGE_SIZE,
+                            help='Number of pending orders to load and verify at a time')
+        parser.add_argument('--workers', type=int, default=reconciliation.WORKERS,
+                            help='Verification calls in flight at once')
+        parser.add_argument('--min-age', type=int, default=int(reconciliation.MIN_AGE.total_seconds() // 60),
+                            help='Skip orders younger than this many minutes')
+        parser.add_argument('--expire-after', type=int, default=int(reconciliation.EXPIRE_AFTER.total_seconds() // 3600),
+                            help='Cancel unpaid orders older than this many hours')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint of an interrupted run and start from the oldest order')
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write(f'  page {report.pages}: {report.checked} checked, '
+                              f'{report.paid} paid, {report.expired} expired')
+
+        report = reconciliation.reconcile(
+            page_size=options['page_size'],
+            workers=options['workers'],
+            min_age=timedelta(minutes=options['min_age']),
+            expire_after=timedelta(hours=options['expire_after']),
+            resume=not options['restart'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        summary = f'{report.checked} pending orders checked, {report.paid} paid, {report.expired} cancelled'
+        if report.complete:
+            self.stdout.write(self.style.SUCCESS(f'✓ {summary}'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'⚠ {summary}; stopped with Paystack unreachable for {report.unavailable} orders. '
+                f'The next run resumes from here.'
+            ))
@@ -1,3 +1,54 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class WebhookEvent(models.Model):
+    """
+    A Paystack webhook delivery, stored as it arrives and processed later by
+    process_webhook_events. event_id is unique, so a replayed delivery is
+    dropped by the database instead of being processed twice.
+    """
+    PENDING = 'pending'
+    PROCESSED = 'processed'
+    IGNORED = 'ignored'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSED, 'Processed'),
+        (IGNORED, 'Ignored'),
+        (FAILED, 'Failed'),
+    ]
+
+    # "<event>:<transaction id>", e.g. "charge.success:302961", or "<event>:<sha256 of
+    # the body>" for events that carry no id or reference
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} ({self.status})"
+
+
+class ReconciliationCheckpoint(models.Model):
+    """
+    How far an interrupted reconcile_payments run got, in its (created_at,
+    id) ordering of pending orders, so the next run can pick up from there.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_created_at = models.DateTimeField()
+    last_order_id = models.UUIDField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_created_at} / {self.last_order_id}"
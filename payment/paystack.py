@@ -0,0 +1,180 @@
+"""
+Server-side transaction verification against Paystack.
+
+Every process shares one httpx.Client, so verification calls reuse pooled
+keep-alive connections instead of paying a TCP and TLS handshake each. Calls
+are bounded by PAYSTACK_TIMEOUT, and a circuit breaker stops calling
+Paystack for a while after repeated failures, so an outage makes callbacks
+fail fast instead of tying up every worker.
+
+Final outcomes (success, failed, reversed) never change again and are cached
+per reference, so a repeated callback, the webhook and the reconciliation
+job don't verify the same transaction twice. An abandoned transaction isn't
+final: the customer can still go back and pay, so it is asked again each time.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import quote
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = {'success', 'failed', 'reversed'}
+RESULT_CACHE_TIMEOUT = 60 * 60 * 24
+NOT_FOUND_CACHE_TIMEOUT = 60
+MAX_CONNECTIONS = 20
+
+
+class PaystackUnavailable(Exception):
+    """Paystack couldn't be asked: timeout, connection or server error, or the circuit is open"""
+
+
+@dataclass(frozen=True)
+class Verification:
+    reference: str
+    status: str
+    amount: int = 0
+    currency: str = ''
+    # From the metadata the payment page attaches to the transaction
+    order_id: str = ''
+
+    @property
+    def successful(self):
+        return self.status == 'success'
+
+    def covers(self, order):
+        """
+        Whether this is a successful payment of order's full total, made for
+        order. The reference must be the one the server issued for order; the
+        order id in the metadata is set by the browser, so it can only rule a
+        payment out, never in.
+        """
+        for_order = (bool(self.reference) and self.reference == order.paystack_reference
+                     and self.order_id in ('', str(order.id)))
+        return (self.successful and for_order and self.amount == int(order.total_paid * 100)
+                and self.currency == settings.PAYSTACK_CURRENCY)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open, calls
+    fail at once; after reset_timeout seconds one trial call is let through
+    and closes the circuit again if it succeeds.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half open: let this call try, and hold the others back until it reports
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f'Paystack circuit opened after {self.failures} consecutive failures')
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                timeout = settings.PAYSTACK_TIMEOUT
+                _client = httpx.Client(
+                    base_url=settings.PAYSTACK_BASE_URL,
+                    headers={'Authorization': f'Bearer {settings.PAYSTACK_SECRET_KEY}'},
+                    timeout=httpx.Timeout(timeout, connect=min(2.0, timeout)),
+                    limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                        max_keepalive_connections=MAX_CONNECTIONS),
+                )
+    return _client
+
+
+def reset_client():
+    """Drop the shared client, e.g. after changing PAYSTACK_BASE_URL"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+def _cache_key(reference):
+    return f'paystack:verify:{reference}'
+
+
+def _fetch(reference):
+    if not breaker.allow():
+        raise PaystackUnavailable('Paystack circuit is open')
+    try:
+        response = get_client().get(f"/transaction/verify/{quote(reference, safe='')}")
+        if response.status_code >= 500 or response.status_code == 429:
+            raise PaystackUnavailable(f'Paystack answered {response.status_code}')
+        payload = response.json()
+        if not isinstance(payload, dict):
+            raise ValueError(f'Unexpected Paystack response: {payload!r:.100}')
+    except (httpx.HTTPError, ValueError) as e:
+        breaker.record_failure()
+        raise PaystackUnavailable(str(e)) from e
+    except PaystackUnavailable:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+
+    data = payload.get('data')
+    if response.status_code != 200 or not payload.get('status') or not isinstance(data, dict):
+        return Verification(reference, 'not_found')
+    return parse_transaction(data, reference)
+
+
+def parse_transaction(data, reference=''):
+    """A Verification from a Paystack transaction object"""
+    metadata = data.get('metadata')
+    order_id = str(metadata.get('order_id', '')) if isinstance(metadata, dict) else ''
+    return Verification(str(data.get('reference') or reference), str(data.get('status', '')),
+                        int(data.get('amount') or 0), str(data.get('currency', '')), order_id)
+
+
+def verify(reference):
+    """
+    What Paystack knows about the transaction reference. Raises
+    PaystackUnavailable when it can't be asked right now.
+    """
+    key = _cache_key(reference)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    result = _fetch(reference)
+    if result.status in FINAL_STATUSES:
+        cache.set(key, result, RESULT_CACHE_TIMEOUT)
+    elif result.status == 'not_found':
+        cache.set(key, result, NOT_FOUND_CACHE_TIMEOUT)
+    return result
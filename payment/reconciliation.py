@@ -0,0 +1,151 @@
+"""
+Reconciling pending orders with Paystack, for reconcile_payments.
+
+Pending orders are walked in (created_at, id) order a page at a time, with
+a keyset condition rather than an OFFSET, so each page costs the same and
+only one page is in memory. The references on a page are verified
+concurrently on a thread pool sharing payment.paystack's pooled client. The
+outcomes are then applied with bulk updates:
+- orders Paystack has been paid for are confirmed;
+- orders left pending past expire_after, with no successful payment, are
+  cancelled and their stock holds released. Only age decides: an abandoned
+  payment can still be completed, so younger orders are left alone whatever
+  Paystack says about them.
+
+After every page the position is saved in a ReconciliationCheckpoint, so an
+interrupted run resumes where it stopped. A page on which Paystack couldn't
+be reached is not checkpointed: the run stops there and the next one
+retries that page.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from orders.models import Order
+from orders.reservations import release_many
+
+from . import paystack
+from .confirmation import confirm_many
+from .models import ReconciliationCheckpoint
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'reconcile_payments'
+PAGE_SIZE = 500
+WORKERS = 16
+# Orders younger than this may still be in the middle of checkout
+MIN_AGE = timedelta(minutes=15)
+EXPIRE_AFTER = timedelta(days=2)
+# Outcomes that leave an order unpaid for now; acted on only once it is past expire_after
+UNPAID_STATUSES = {'failed', 'abandoned', 'reversed', 'not_found'}
+
+
+@dataclass
+class Report:
+    pages: int = 0
+    checked: int = 0
+    paid: int = 0
+    expired: int = 0
+    unavailable: int = 0
+    complete: bool = False
+
+
+def _page(before, after, size):
+    orders = Order.objects.filter(paid=False, status='pending', created_at__lte=before)
+    if after is not None:
+        created_at, order_id = after
+        orders = orders.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=order_id))
+    return list(
+        orders.order_by('created_at', 'id').only('id', 'created_at', 'total_paid', 'paystack_reference')[:size]
+    )
+
+
+def _verify(reference):
+    try:
+        return paystack.verify(reference)
+    except paystack.PaystackUnavailable:
+        return None
+
+
+def _expire(order_ids):
+    if not order_ids:
+        return 0
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids, paid=False, status='pending').values_list('id', flat=True)
+        )
+        Order.objects.filter(id__in=ids).update(status='cancelled', updated_at=timezone.now())
+        release_many(ids)
+    return len(ids)
+
+
+def _apply(orders, verifications, expire_before):
+    paid = []
+    expired = []
+    for order, verification in zip(orders, verifications):
+        if verification is not None and verification.covers(order):
+            paid.append((order, verification))
+        elif order.created_at > expire_before:
+            continue
+        elif not order.paystack_reference or (verification is not None and verification.status in UNPAID_STATUSES):
+            expired.append(order.id)
+        elif verification is not None and verification.successful:
+            logger.error(f"Order {order.id}: payment {verification.reference} doesn't match the order, "
+                         f"left pending for review")
+    return len(confirm_many(paid)), _expire(expired)
+
+
+def _save_checkpoint(name, order):
+    ReconciliationCheckpoint.objects.update_or_create(
+        name=name, defaults={'last_created_at': order.created_at, 'last_order_id': order.id}
+    )
+
+
+def reconcile(page_size=PAGE_SIZE, workers=WORKERS, min_age=MIN_AGE, expire_after=EXPIRE_AFTER,
+              resume=True, name=CHECKPOINT_NAME, progress=None):
+    """
+    Walk every pending order older than min_age once. progress, if given, is
+    called with the Report after each page.
+    """
+    now = timezone.now()
+    before = now - min_age
+    expire_before = now - expire_after
+    checkpoint = ReconciliationCheckpoint.objects.filter(name=name).first() if resume else None
+    after = (checkpoint.last_created_at, checkpoint.last_order_id) if checkpoint else None
+    report = Report()
+
+    with ThreadPoolExecutor(workers) as pool:
+        while True:
+            orders = _page(before, after, page_size)
+            if not orders:
+                report.complete = True
+                break
+            references = [order.paystack_reference for order in orders]
+            verifications = list(pool.map(
+                lambda reference: _verify(reference) if reference else None, references
+            ))
+            missing = sum(1 for reference, v in zip(references, verifications) if reference and v is None)
+            paid, expired = _apply(orders, verifications, expire_before)
+
+            report.pages += 1
+            report.checked += len(orders)
+            report.paid += paid
+            report.expired += expired
+            if missing:
+                report.unavailable += missing
+                logger.warning(f'Paystack unavailable for {missing} orders; stopping until the next run')
+                break
+            after = (orders[-1].created_at, orders[-1].id)
+            _save_checkpoint(name, orders[-1])
+            if progress:
+                progress(report)
+
+    if report.complete:
+        ReconciliationCheckpoint.objects.filter(name=name).delete()
+    return report
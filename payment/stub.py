@@ -0,0 +1,93 @@
+"""
+A local stand-in for the Paystack API, for the payment tests and benchmarks.
+
+It answers GET /transaction/verify/<reference> from the transactions it has
+been given with add(), after sleeping latency seconds to stand in for the
+round trip to Paystack. Setting failing makes every call answer 503.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from django.conf import settings
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, delayed ACKs
+    # add ~40ms to every response on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+        prefix = '/transaction/verify/'
+        if self.server.failing:
+            self.send_json(503, {'status': False, 'message': 'Service unavailable'})
+        elif not self.path.startswith(prefix):
+            self.send_json(404, {'status': False, 'message': 'Not found'})
+        else:
+            transaction = self.server.transactions.get(unquote(self.path[len(prefix):]))
+            if transaction is None:
+                self.send_json(400, {'status': False, 'message': 'Transaction reference not found'})
+            else:
+                self.send_json(200, {'status': True, 'message': 'Verification successful', 'data': transaction})
+
+
+class PaystackStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.failing = False
+        self.transactions = {}
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # A client that timed out hangs up before the answer is written
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def add(self, reference, amount, status='success', currency=None, order_id=''):
+        self.transactions[reference] = {
+            'reference': reference,
+            'status': status,
+            'amount': amount,
+            'currency': currency or settings.PAYSTACK_CURRENCY,
+            'metadata': {'order_id': str(order_id)} if order_id else '',
+        }
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
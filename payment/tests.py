@@ -1,3 +1,423 @@
-from django.test import TestCase
+import json
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import OutboxEmail
+from orders.models import Order, StockReservation
+from orders.reservations import reserve
+from orders.tests import make_order, make_products
+
+from . import paystack, reconciliation, webhooks
+from .confirmation import confirm, confirm_many
+from .models import ReconciliationCheckpoint, WebhookEvent
+from .stub import PaystackStub
+
+
+def charge_success(reference, order=None, amount=Decimal('20.00')):
+    data = {
+        'id': zlib.crc32(reference.encode()), 'reference': reference, 'status': 'success',
+        'amount': int(amount * 100), 'currency': settings.PAYSTACK_CURRENCY,
+        'metadata': {'order_id': str(order.id)} if order else {},
+    }
+    return {'event': 'charge.success', 'data': data}
+
+
+def payment_of(order, **changes):
+    """A successful Verification of order's full total, as Paystack would report it"""
+    fields = {
+        'reference': order.paystack_reference, 'status': 'success', 'amount': int(order.total_paid * 100),
+        'currency': settings.PAYSTACK_CURRENCY, 'order_id': str(order.id),
+    }
+    fields.update(changes)
+    return paystack.Verification(**fields)
+
+
+class VerificationCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_only_final_outcomes_are_cached(self):
+        for status, cached in (('success', True), ('failed', True), ('abandoned', False), ('ongoing', False)):
+            with self.subTest(status), mock.patch.object(
+                paystack, '_fetch', return_value=paystack.Verification(f'ref-{status}', status)
+            ) as fetch:
+                paystack.verify(f'ref-{status}')
+                paystack.verify(f'ref-{status}')
+                self.assertEqual(fetch.call_count, 1 if cached else 2)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ConfirmationTests(TestCase):
+    def setUp(self):
+        self.product, = make_products(1)
+        self.customer = User.objects.create(username='confirm-customer', email='confirm@example.com')
+        self.first, self.second = [
+            make_order([self.product], user=self.customer, paystack_reference=f'ref-{i}') for i in range(2)
+        ]
+
+    def test_covers_only_the_issued_reference_and_exact_total(self):
+        order = self.first
+        self.assertTrue(payment_of(order).covers(order))
+        self.assertTrue(payment_of(order, order_id='').covers(order))
+        for label, changes in [
+            ('wrong amount', {'amount': 100}),
+            ('wrong currency', {'currency': 'XYZ'}),
+            ('wrong reference', {'reference': 'ref-other'}),
+            ('no reference', {'reference': ''}),
+            ('another order in the metadata', {'order_id': str(self.second.id)}),
+            ('not successful', {'status': 'failed'}),
+        ]:
+            with self.subTest(label):
+                self.assertFalse(payment_of(order, **changes).covers(order))
+
+    def test_metadata_alone_does_not_tie_a_payment_to_an_order(self):
+        # A charge made for the first order, with the second order's id in its metadata
+        self.assertFalse(payment_of(self.first, order_id=str(self.second.id)).covers(self.second))
+
+    def test_confirm_is_idempotent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(confirm(self.first, payment_of(self.first)))
+            self.assertFalse(confirm(Order.objects.get(id=self.first.id), payment_of(self.first)))
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_one_reference_pays_for_one_order(self):
+        payment = payment_of(self.first, order_id='')
+        self.assertTrue(confirm(self.first, payment))
+        # Even if the second order somehow carries the same reference
+        Order.objects.filter(id=self.second.id).update(paystack_reference=payment.reference)
+        self.second.paystack_reference = payment.reference
+        self.assertFalse(confirm(self.second, payment))
+        self.assertEqual(confirm_many([(self.second, payment)]), [])
+        self.assertFalse(Order.objects.get(id=self.second.id).paid)
+
+    def test_confirm_many_pays_each_reference_once(self):
+        Order.objects.filter(id=self.second.id).update(paystack_reference=self.first.paystack_reference)
+        self.second.paystack_reference = self.first.paystack_reference
+        payment = payment_of(self.first, order_id='')
+        self.assertEqual(confirm_many([(self.first, payment), (self.second, payment)]), [self.first.id])
+        self.assertEqual(Order.objects.filter(paid=True).count(), 1)
+
+
+@override_settings(PAYSTACK_SECRET_KEY='webhook-test-secret',
+                   EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class WebhookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product, = make_products(1)
+        self.customer = User.objects.create(username='webhook-customer', email='webhook@example.com')
+
+    def deliver(self, payload):
+        body = json.dumps(payload).encode()
+        webhooks.record(body, webhooks.signature(body))
+
+    def make_due(self):
+        WebhookEvent.objects.update(next_attempt_at=timezone.now())
+
+    def test_replayed_delivery_is_stored_once(self):
+        payload = charge_success('ref-replay')
+        self.deliver(payload)
+        self.deliver(payload)
+        self.assertEqual(WebhookEvent.objects.get().event_id, f"charge.success:{payload['data']['id']}")
+
+    def test_events_without_ids_are_keyed_by_their_body(self):
+        self.deliver({'event': 'transfer.success', 'data': {'amount': 100}})
+        self.deliver({'event': 'transfer.success', 'data': {'amount': 200}})
+        self.deliver({'event': 'transfer.success', 'data': {'amount': 200}})
+        event_ids = list(WebhookEvent.objects.values_list('event_id', flat=True))
+        self.assertEqual(len(event_ids), 2)
+        self.assertNotIn('transfer.success:', event_ids)
+
+    def test_bad_signature_is_rejected(self):
+        with self.assertRaises(webhooks.InvalidWebhook):
+            webhooks.record(b'{"event": "charge.success"}', 'not-the-signature')
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_event_for_an_order_not_stored_yet_is_retried(self):
+        self.deliver(charge_success('ref-early'))
+        self.assertEqual(webhooks.drain(), {WebhookEvent.PENDING: 1})
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.PENDING, 1))
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        # Not due again until the backoff has passed
+        self.assertEqual(webhooks.drain(), {})
+
+        order = make_order([self.product], user=self.customer, paystack_reference='ref-early')
+        self.make_due()
+        self.assertEqual(webhooks.drain(), {WebhookEvent.PROCESSED: 1})
+        self.assertTrue(Order.objects.get(id=order.id).paid)
+
+    def test_event_for_a_missing_order_fails_after_max_attempts(self):
+        self.deliver(charge_success('ref-unknown'))
+        for attempt in range(1, webhooks.MAX_ATTEMPTS + 1):
+            self.make_due()
+            expected = WebhookEvent.FAILED if attempt == webhooks.MAX_ATTEMPTS else WebhookEvent.PENDING
+            self.assertEqual(webhooks.drain(), {expected: 1})
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.FAILED, webhooks.MAX_ATTEMPTS))
+
+
+class Interrupted(Exception):
+    pass
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ReconcileTests(TestCase):
+    """reconcile() against a mocked paystack.verify; answers maps reference -> Verification or exception"""
+
+    def setUp(self):
+        self.product, = make_products(1, stock=50)
+        self.customer = User.objects.create(username='reconcile-customer', email='reconcile@example.com')
+        self.answers = {}
+        self.verified = []
+        patcher = mock.patch.object(paystack, 'verify', side_effect=self.verify)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def verify(self, reference):
+        self.verified.append(reference)
+        answer = self.answers.get(reference, paystack.Verification(reference, 'not_found'))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def pending(self, reference='', age=timedelta(hours=1)):
+        order = make_order([self.product], user=self.customer, paystack_reference=reference)
+        reserve(order)
+        # Distinct, increasing created_at in the order the orders were made
+        created_at = timezone.now() - age + timedelta(microseconds=Order.objects.count())
+        Order.objects.filter(id=order.id).update(created_at=created_at)
+        return order
+
+    def paid_for(self, order, amount=None):
+        amount = int(order.total_paid * 100) if amount is None else amount
+        self.answers[order.paystack_reference] = paystack.Verification(
+            order.paystack_reference, 'success', amount, settings.PAYSTACK_CURRENCY, str(order.id)
+        )
+
+    def status(self, order):
+        return Order.objects.values_list('paid', 'status').get(id=order.id)
+
+    def reconcile(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            return reconciliation.reconcile(min_age=timedelta(0), workers=2, **options)
+
+    def test_paid_orders_are_confirmed(self):
+        order = self.pending('ref-paid')
+        self.paid_for(order)
+        report = self.reconcile()
+        self.assertEqual((report.checked, report.paid, report.expired, report.complete), (1, 1, 0, True))
+        self.assertEqual(self.status(order), (True, 'paid'))
+        self.assertEqual(order.reservations.get().status, StockReservation.CONVERTED)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_expiry_rules(self):
+        old = timedelta(days=3)
+        no_reference = self.pending(age=old)
+        abandoned = self.pending('ref-abandoned', age=old)
+        self.answers['ref-abandoned'] = paystack.Verification('ref-abandoned', 'abandoned')
+        mismatched = self.pending('ref-mismatch', age=old)
+        self.paid_for(mismatched, amount=100)
+        still_in_progress = self.pending('ref-ongoing', age=old)
+        self.answers['ref-ongoing'] = paystack.Verification('ref-ongoing', 'ongoing')
+        recent = self.pending('ref-recent')
+        self.answers['ref-recent'] = paystack.Verification('ref-recent', 'abandoned')
+
+        report = self.reconcile()
+        self.assertEqual((report.paid, report.expired), (0, 2))
+        for order in (no_reference, abandoned):
+            self.assertEqual(self.status(order), (False, 'cancelled'))
+            self.assertEqual(order.reservations.get().status, StockReservation.RELEASED)
+        # A payment that doesn't match, an unfinished one, or an order younger
+        # than expire_after are all left for later
+        for order in (mismatched, still_in_progress, recent):
+            self.assertEqual(self.status(order), (False, 'pending'))
+            self.assertEqual(order.reservations.get().status, StockReservation.HELD)
+
+    def test_orders_younger_than_min_age_are_skipped(self):
+        order = self.pending('ref-young', age=timedelta(minutes=1))
+        self.paid_for(order)
+        report = reconciliation.reconcile(workers=2)
+        self.assertEqual(report.checked, 0)
+        self.assertEqual(self.status(order), (False, 'pending'))
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        orders = [self.pending(f'ref-{i}') for i in range(5)]
+        for order in orders:
+            self.paid_for(order)
+
+        def interrupt(report):
+            if report.pages == 2:
+                raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            self.reconcile(page_size=2, progress=interrupt)
+        checkpoint = ReconciliationCheckpoint.objects.get(name=reconciliation.CHECKPOINT_NAME)
+        self.assertEqual(checkpoint.last_order_id, orders[3].id)
+
+        self.verified.clear()
+        report = self.reconcile(page_size=2)
+        self.assertEqual(self.verified, ['ref-4'])
+        self.assertEqual((report.checked, report.paid, report.complete), (1, 1, True))
+        self.assertFalse(ReconciliationCheckpoint.objects.exists())
+        self.assertFalse(Order.objects.filter(paid=False).exists())
+
+    def test_unreachable_page_is_retried_next_run(self):
+        orders = [self.pending(f'ref-{i}', age=timedelta(days=3)) for i in range(4)]
+        self.answers['ref-2'] = paystack.PaystackUnavailable('down')
+
+        report = self.reconcile(page_size=2)
+        self.assertEqual((report.pages, report.unavailable, report.expired, report.complete), (2, 1, 3, False))
+        # The first page was checkpointed; the one Paystack couldn't fully answer for
+        # wasn't, though the orders it could answer for were still applied
+        self.assertEqual(ReconciliationCheckpoint.objects.get().last_order_id, orders[1].id)
+        self.assertEqual(self.status(orders[2]), (False, 'pending'))
+
+        del self.answers['ref-2']
+        self.verified.clear()
+        report = self.reconcile(page_size=2)
+        self.assertEqual(self.verified, ['ref-2'])
+        self.assertEqual((report.expired, report.complete), (1, True))
+        self.assertFalse(Order.objects.filter(status='pending').exists())
+
+
+@override_settings(PAYSTACK_TIMEOUT=0.2, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class PaystackStubTests(TestCase):
+    """payment.paystack and payment_callback against the local Paystack stub"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = PaystackStub().__enter__()
+        cls.addClassCleanup(cls.stub.__exit__, None, None, None)
+
+    def setUp(self):
+        cache.clear()
+        self.stub.transactions.clear()
+        self.stub.failing = False
+        self.stub.latency = 0.0
+        settings_override = override_settings(PAYSTACK_BASE_URL=self.stub.base_url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        paystack.reset_client()
+        self.addCleanup(paystack.reset_client)
+        breaker = mock.patch.object(paystack, 'breaker', paystack.CircuitBreaker(failure_threshold=2, reset_timeout=30))
+        self.breaker = breaker.start()
+        self.addCleanup(breaker.stop)
+
+        self.product, = make_products(1)
+        self.customer = User.objects.create(username='stub-customer', email='stub@example.com')
+
+    def order(self, reference):
+        return make_order([self.product], user=self.customer, paystack_reference=reference)
+
+    def requests(self):
+        return self.stub.requests
+
+    def callback(self, order, reference):
+        session = self.client.session
+        session['order_id'] = str(order.id)
+        session.save()
+        return self.client.get(reverse('payment:callback'), {'reference': reference})
+
+    def test_verify_success_is_cached(self):
+        order = self.order('ref-success')
+        self.stub.add('ref-success', amount=2000, order_id=order.id)
+        verification = paystack.verify('ref-success')
+        self.assertTrue(verification.covers(order))
+        before = self.requests()
+        self.assertEqual(paystack.verify('ref-success'), verification)
+        self.assertEqual(self.requests(), before)
+
+    def test_unknown_reference_is_not_found(self):
+        self.assertEqual(paystack.verify('ref-unknown').status, 'not_found')
+
+    def test_timeout_is_unavailable(self):
+        self.stub.add('ref-slow', amount=2000)
+        self.stub.latency = 0.5
+        with self.assertRaises(paystack.PaystackUnavailable):
+            paystack.verify('ref-slow')
+        self.assertEqual(self.breaker.failures, 1)
+
+    def test_breaker_opens_fails_fast_and_half_opens(self):
+        self.stub.add('ref-breaker', amount=2000)
+        self.stub.failing = True
+        for _ in range(2):
+            with self.assertRaises(paystack.PaystackUnavailable):
+                paystack.verify('ref-breaker')
+        # Open: nothing reaches Paystack
+        before = self.requests()
+        with self.assertRaisesMessage(paystack.PaystackUnavailable, 'circuit is open'):
+            paystack.verify('ref-breaker')
+        self.assertEqual(self.requests(), before)
+
+        # Half open after reset_timeout: one trial call; a failure opens it again
+        self.breaker.opened_at -= self.breaker.reset_timeout
+        with self.assertRaises(paystack.PaystackUnavailable):
+            paystack.verify('ref-breaker')
+        self.assertEqual(self.requests(), before + 1)
+        self.assertFalse(self.breaker.allow())
+
+        # A successful trial closes it
+        self.stub.failing = False
+        self.breaker.opened_at -= self.breaker.reset_timeout
+        self.assertEqual(paystack.verify('ref-breaker').status, 'success')
+        self.assertIsNone(self.breaker.opened_at)
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_callback_marks_the_order_paid_once(self):
+        order = self.order('ref-callback')
+        self.stub.add('ref-callback', amount=2000, order_id=order.id)
+        response = self.callback(order, 'ref-callback')
+        self.assertTemplateUsed(response, 'payment/success.html')
+        self.assertTrue(Order.objects.get(id=order.id).paid)
+
+        # A replayed callback neither asks Paystack again nor confirms twice
+        before = self.requests()
+        with mock.patch('payment.views.confirm') as confirm_again:
+            response = self.callback(order, 'ref-callback')
+        self.assertTemplateUsed(response, 'payment/success.html')
+        self.assertEqual(self.requests(), before)
+        confirm_again.assert_not_called()
+
+    def test_callback_rejects_wrong_amount(self):
+        order = self.order('ref-short')
+        self.stub.add('ref-short', amount=100, order_id=order.id)
+        self.assertRedirects(self.callback(order, 'ref-short'), reverse('payment:failed'),
+                             fetch_redirect_response=False)
+        self.assertFalse(Order.objects.get(id=order.id).paid)
+
+    def test_callback_rejects_missing_reference(self):
+        order = self.order('ref-missing')
+        self.assertRedirects(self.callback(order, ''), reverse('payment:failed'), fetch_redirect_response=False)
+
+    def test_callback_while_paystack_is_down(self):
+        order = self.order('ref-down')
+        self.stub.add('ref-down', amount=2000, order_id=order.id)
+        self.stub.failing = True
+        self.assertRedirects(self.callback(order, 'ref-down'),
+                             reverse('accounts:order_detail', args=[order.id]), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.get(id=order.id).paid)
+
+    def test_replayed_reference_cannot_pay_for_another_order(self):
+        paid, other = self.order('ref-first'), self.order('ref-second')
+        # The browser can put any order id in the metadata
+        self.stub.add('ref-first', amount=2000, order_id=other.id)
+        self.assertRedirects(self.callback(paid, 'ref-first'), reverse('payment:failed'), fetch_redirect_response=False)
+        self.stub.add('ref-first', amount=2000, order_id=paid.id)
+        cache.clear()
+        self.callback(paid, 'ref-first')
+        self.assertTrue(Order.objects.get(id=paid.id).paid)
+
+        # Replaying the same charge on the second order, with the same total
+        self.assertRedirects(self.callback(other, 'ref-first'), reverse('payment:failed'),
+                             fetch_redirect_response=False)
+        self.assertFalse(Order.objects.get(id=other.id).paid)
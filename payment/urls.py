@@ -8,4 +8,5 @@ urlpatterns = [
     path('callback/', views.payment_callback, name='callback'),
     path('failed/', views.payment_failed, name='failed'),
     path('retry/<uuid:order_id>/', views.retry_payment, name='retry_payment'),
+    path('webhook/', views.paystack_webhook, name='webhook'),
 ]
\ No newline at end of file
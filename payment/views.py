@@ -2,14 +2,24 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from orders.models import Order
 from cart.cart import Cart
 
+from . import paystack, webhooks
+from .confirmation import confirm, new_reference
+
 def payment_process(request):
     order_id = request.session.get('order_id')
     order = get_object_or_404(Order, id=order_id)
     
+    if not order.paid:
+        # A fresh reference per attempt; Paystack refuses to reuse one
+        order.paystack_reference = new_reference(order)
+        Order.objects.filter(id=order.id, paid=False).update(paystack_reference=order.paystack_reference)
     amount_in_kobo = int(order.total_paid * 100)
 
     context = {
@@ -21,17 +31,24 @@ def payment_process(request):
     return render(request, 'payment/process.html', context)
 
 def payment_callback(request):
-    reference = request.GET.get('reference')
+    reference = request.GET.get('reference', '')
     order_id = request.session.get('order_id')
     order = get_object_or_404(Order, id=order_id)
     
-    order.paid = True
-    order.status = 'paid'
-    order.paystack_reference = reference
-    order.save()
-    
-    from core.email_utils import send_order_confirmation_email
-    send_order_confirmation_email(order)
+    if not order.paid:
+        if not reference:
+            return redirect('payment:failed')
+        try:
+            verification = paystack.verify(reference)
+        except paystack.PaystackUnavailable:
+            messages.info(request, "We couldn't confirm your payment with Paystack yet. "
+                                   "Your order will be updated as soon as it is confirmed.")
+            return redirect('accounts:order_detail', order_id=order.id)
+        if not confirm(order, verification):
+            # Another request may have confirmed it in the meantime
+            order.refresh_from_db(fields=['paid', 'status'])
+            if not order.paid:
+                return redirect('payment:failed')
     
     cart = Cart(request)
     cart.clear()
@@ -51,4 +68,14 @@ def retry_payment(request, order_id):
     
     request.session['order_id'] = str(order.id)
     messages.info(request, 'Redirecting to payment...')
-    return redirect('payment:process')
\ No newline at end of file
+    return redirect('payment:process')
+
+@csrf_exempt
+@require_POST
+def paystack_webhook(request):
+    """Store a signed Paystack event and acknowledge it; process_webhook_events applies it"""
+    try:
+        webhooks.record(request.body, request.headers.get('X-Paystack-Signature', ''))
+    except webhooks.InvalidWebhook:
+        return HttpResponse(status=400)
+    return HttpResponse(status=200)
@@ -0,0 +1,161 @@
+"""
+Paystack webhooks.
+
+The endpoint does as little as possible: check the HMAC-SHA512 signature
+Paystack computes over the body with our secret key, and store the event
+with an INSERT ... ON CONFLICT DO NOTHING on its unique event id, so a
+replayed delivery costs one no-op insert. It then answers 200 straight away.
+
+process_webhook_events applies stored events in the background. The
+payload is signed, so a charge.success marks the order paid through
+payment.confirmation without another round trip to Paystack, and primes the
+verification cache for the browser callback. Events are claimed the same
+way core.outbox claims emails, so several processors can run at once.
+"""
+import hashlib
+import hmac
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from orders.models import Order
+
+from . import paystack
+from .confirmation import confirm
+from .models import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+CLAIM_TIMEOUT = timedelta(minutes=5)
+RETRY_DELAY = timedelta(seconds=30)
+MAX_ATTEMPTS = 6
+
+
+class InvalidWebhook(Exception):
+    pass
+
+
+def signature(body):
+    return hmac.new(settings.PAYSTACK_SECRET_KEY.encode('utf-8'), body, hashlib.sha512).hexdigest()
+
+
+def record(body, signature_header):
+    """
+    Check and store one delivery; a replay of a stored event is dropped.
+    Raises InvalidWebhook for a bad signature or body.
+    """
+    if not signature_header or not hmac.compare_digest(signature(body), signature_header):
+        raise InvalidWebhook('Bad signature')
+    try:
+        payload = json.loads(body)
+        event_type = str(payload['event'])
+        data = payload.get('data') or {}
+        # Events that carry neither id are told apart by their exact body
+        event_key = data.get('id') or data.get('reference') or hashlib.sha256(body).hexdigest()
+        event_id = f'{event_type}:{event_key}'
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidWebhook(f'Malformed payload: {e}') from e
+
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(event_id=event_id[:100], event_type=event_type[:50], payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def _order_for(verification):
+    lookup = Q(paystack_reference=verification.reference)
+    if verification.order_id:
+        lookup |= Q(id=verification.order_id)
+    return Order.objects.filter(lookup).first()
+
+
+def handle(event):
+    """
+    Apply one event. Returns the status to record; PENDING means the order
+    isn't there yet and the event should be retried.
+    """
+    if event.event_type != 'charge.success':
+        return WebhookEvent.IGNORED
+    verification = paystack.parse_transaction(event.payload.get('data') or {})
+    try:
+        order = _order_for(verification)
+    except (ValidationError, ValueError, TypeError):
+        # metadata.order_id isn't a UUID
+        order = None
+    if order is None:
+        # The webhook can beat the checkout that stores the reference; try again later
+        logger.warning(f'Webhook {event.event_id}: no order yet for reference {verification.reference}')
+        return WebhookEvent.PENDING
+    if verification.status in paystack.FINAL_STATUSES:
+        cache.set(paystack._cache_key(verification.reference), verification, paystack.RESULT_CACHE_TIMEOUT)
+    if not order.paid and not confirm(order, verification):
+        return WebhookEvent.FAILED
+    return WebhookEvent.PROCESSED
+
+
+def claim(batch_size=BATCH_SIZE, now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=WebhookEvent.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        WebhookEvent.objects.filter(id__in=ids).update(next_attempt_at=now + CLAIM_TIMEOUT)
+    return list(WebhookEvent.objects.filter(id__in=ids).order_by('id'))
+
+
+def _retry_later(event, error):
+    """Record a failed attempt; the event is due again after a doubling delay, or failed after MAX_ATTEMPTS"""
+    attempts = event.attempts + 1
+    status = WebhookEvent.FAILED if attempts >= MAX_ATTEMPTS else WebhookEvent.PENDING
+    if status == WebhookEvent.FAILED:
+        logger.error(f'Giving up on webhook {event.event_id} after {attempts} attempts: {error}')
+    WebhookEvent.objects.filter(id=event.id).update(
+        status=status, attempts=attempts, last_error=str(error),
+        next_attempt_at=timezone.now() + RETRY_DELAY * 2 ** (attempts - 1),
+    )
+    return status
+
+
+def process(events):
+    """Apply claimed events. Returns {status: count}"""
+    counts = {}
+    for event in events:
+        try:
+            status = handle(event)
+        except Exception as e:
+            logger.exception(f'Webhook {event.event_id} failed (attempt {event.attempts + 1})')
+            status = _retry_later(event, e)
+        else:
+            if status == WebhookEvent.PENDING:
+                status = _retry_later(event, 'Order not found')
+            else:
+                WebhookEvent.objects.filter(id=event.id).update(
+                    status=status, attempts=event.attempts + 1, processed_at=timezone.now()
+                )
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Process every event that is due now. Returns {status: count}"""
+    totals = {}
+    started = timezone.now()
+    while True:
+        events = claim(batch_size, now=started)
+        if not events:
+            return totals
+        for status, count in process(events).items():
+            totals[status] = totals.get(status, 0) + count
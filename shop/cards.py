@@ -0,0 +1,86 @@
+"""
+Fragment cache for components/product_card.html.
+
+Each product has a version key that shop.signals drops whenever the product,
+its vendor's name or its reviews change. The next read picks a fresh version, so
+older fragments are simply never used again. A grid reads every version and
+fragment it needs in a single get_many. The per-request CSRF token is kept
+out of the cached HTML as a placeholder that is swapped in at render time.
+"""
+import time
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'components/product_card.html'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+CSRF_PLACEHOLDER = 'CARDCSRFTOKENPLACEHOLDER'
+HITS_KEY = 'shop:cards:hits'
+MISSES_KEY = 'shop:cards:misses'
+
+
+def _version_key(product_id):
+    return f'shop:card-version:{product_id}'
+
+
+def _card_key(product_id):
+    return f'shop:card:{product_id}'
+
+
+def bump_versions(product_ids):
+    """Invalidate the cached cards of product_ids"""
+    cache.delete_many([_version_key(pk) for pk in product_ids])
+
+
+def _count(key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': counts.get(HITS_KEY, 0), 'misses': counts.get(MISSES_KEY, 0)}
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def render_cards(products, csrf_token=''):
+    """Card HTML for each of products, in order"""
+    products = list(products)
+    keys = []
+    for product in products:
+        keys += [_version_key(product.pk), _card_key(product.pk)]
+    found = cache.get_many(keys)
+
+    new_versions = {}
+    new_cards = {}
+    fragments = []
+    for product in products:
+        version = found.get(_version_key(product.pk))
+        cached = found.get(_card_key(product.pk))
+        if version is not None and cached is not None and cached[0] == version:
+            fragments.append(cached[1])
+            continue
+        if version is None:
+            version = new_versions[_version_key(product.pk)] = time.time_ns()
+        html = render_to_string(CARD_TEMPLATE, {'product': product, 'csrf_token': CSRF_PLACEHOLDER})
+        new_cards[_card_key(product.pk)] = (version, html)
+        fragments.append(html)
+
+    if new_versions:
+        cache.set_many(new_versions, None)
+    if new_cards:
+        cache.set_many(new_cards, CARD_CACHE_TIMEOUT)
+    _count(HITS_KEY, len(products) - len(new_cards))
+    _count(MISSES_KEY, len(new_cards))
+
+    token = str(csrf_token or '')
+    return [mark_safe(html.replace(CSRF_PLACEHOLDER, token)) for html in fragments]
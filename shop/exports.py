@@ -0,0 +1,127 @@
+"""
+Streaming exports of a vendor's order items and products, as CSV or JSON Lines.
+
+Rows are read with .iterator(chunk_size=...), which uses a server-side cursor
+on Postgres, and are encoded and handed on a buffer at a time. Only one chunk
+of rows and one buffer are ever in memory, however many rows the vendor has.
+The first line is sent on its own: the CSV header before the query even
+runs, the first JSON Lines row as soon as the first chunk is read.
+
+Text cells in CSV that a spreadsheet would read as a formula (starting with
+=, +, -, @, a tab or a carriage return) are prefixed with a quote.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+from orders.models import OrderItem
+
+from .models import Product
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Column name -> lookup, in output order
+ORDER_ITEM_COLUMNS = {
+    'order_id': 'order_id',
+    'order_date': 'order__created_at',
+    'order_status': 'order__status',
+    'product_id': 'product_id',
+    'product_name': 'product__name',
+    'quantity': 'quantity',
+    'unit_price': 'price',
+    'total': 'total',
+    'city': 'order__city',
+}
+PRODUCT_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'category': 'category__name',
+    'price': 'price',
+    'stock_quantity': 'stock_quantity',
+    'is_featured': 'is_featured',
+    'rating_avg': 'rating_avg',
+    'rating_count': 'rating_count',
+    'created_at': 'created_at',
+}
+
+
+def order_items(vendor):
+    """The vendor's sold order items, paid orders only, oldest first"""
+    return (
+        OrderItem.objects.filter(product__vendor=vendor, order__paid=True)
+        .annotate(total=ExpressionWrapper(
+            F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)
+        ))
+        .order_by('id')
+        .values_list(*ORDER_ITEM_COLUMNS.values())
+    )
+
+
+def products(vendor):
+    return Product.objects.filter(vendor=vendor).order_by('id').values_list(*PRODUCT_COLUMNS.values())
+
+
+DATASETS = {
+    'orders': (order_items, ORDER_ITEM_COLUMNS),
+    'products': (products, PRODUCT_COLUMNS),
+}
+
+
+class _Line:
+    """A file-like object csv.writer writes one line into, for the caller to take"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def _jsonl_lines(columns, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def _buffered(lines, size):
+    lines = iter(lines)
+    # The first line goes out on its own, so the response starts before the rows are read
+    for line in lines:
+        yield line
+        break
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream(vendor, dataset, fmt, chunk_size=CHUNK_SIZE, buffer_size=BUFFER_SIZE):
+    """Yield the export of dataset ('orders' or 'products') for vendor as fmt, in strings of about buffer_size"""
+    queryset, columns = DATASETS[dataset]
+    rows = queryset(vendor).iterator(chunk_size=chunk_size)
+    lines = (_csv_lines if fmt == 'csv' else _jsonl_lines)(list(columns), rows)
+    return _buffered(lines, buffer_size)
@@ -0,0 +1,171 @@
+"""
+Sidebar facet counts for the shop page.
+
+One GROUP BY over (category, vendor, price bucket) of the search results
+gives every count the sidebar needs: each facet is summed in Python from the
+rows that match the other facets' selections. The grouped rows are cached
+per search string under a generation counter that shop.signals bumps
+whenever the catalog changes, so stale entries are simply never read again.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Value, When
+
+from .models import Category, Vendor
+
+# (key, label, lower bound, upper bound)
+PRICE_BUCKETS = (
+    ('0-100', 'Under GH₵ 100', 0, 100),
+    ('100-500', 'GH₵ 100 – 500', 100, 500),
+    ('500-1000', 'GH₵ 500 – 1,000', 500, 1000),
+    ('1000-5000', 'GH₵ 1,000 – 5,000', 1000, 5000),
+    ('5000+', 'Over GH₵ 5,000', 5000, None),
+)
+
+GENERATION_KEY = 'shop:facets:generation'
+FACET_CACHE_TIMEOUT = 600
+MAX_VENDORS = 10
+
+
+def _fresh_generation():
+    # Time based, so a counter lost to eviction never restarts at a value
+    # that older cache entries were written under
+    return int(time.time() * 1000)
+
+
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _fresh_generation(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, _fresh_generation(), None)
+
+
+def price_bucket_filter(key):
+    """Filter kwargs for a price bucket key, or None if key is unknown"""
+    for bucket_key, _, low, high in PRICE_BUCKETS:
+        if bucket_key == key:
+            lookups = {'price__gte': low}
+            if high is not None:
+                lookups['price__lt'] = high
+            return lookups
+    return None
+
+
+def _price_bucket_expression():
+    whens = [When(then=Value(key), **price_bucket_filter(key)) for key, _, _, _ in PRICE_BUCKETS]
+    return Case(*whens, output_field=CharField())
+
+
+def facet_data(queryset, signature):
+    """
+    Grouped counts of queryset plus the names needed to render them.
+    signature must identify every filter already applied to queryset.
+    """
+    digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+    key = f'shop:facets:{current_generation()}:{digest}'
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    rows = list(
+        queryset.order_by()
+        .annotate(price_bucket=_price_bucket_expression())
+        .values('category_id', 'vendor_id', 'price_bucket')
+        .annotate(count=Count('id'))
+        .values_list('category_id', 'vendor_id', 'price_bucket', 'count')
+    )
+    vendor_ids = {vendor_id for _, vendor_id, _, _ in rows}
+    data = {
+        'rows': rows,
+        'categories': list(Category.objects.order_by('name').values_list('id', 'slug', 'name')),
+        'vendors': dict(Vendor.objects.filter(id__in=vendor_ids).values_list('id', 'shop_name')),
+    }
+    cache.set(key, data, FACET_CACHE_TIMEOUT)
+    return data
+
+
+def build_facets(data, filters):
+    """
+    Sidebar facets for the current selection.
+
+    filters holds the active shop_view query parameters; 'category',
+    'vendor' and 'price' select facet values and the rest (q, sort) are
+    carried over into every facet link.
+    """
+    slug_to_id = {slug: category_id for category_id, slug, _ in data['categories']}
+    category_slug = filters.get('category')
+    # An unknown slug selects nothing rather than everything
+    category_id = slug_to_id.get(category_slug, 0) if category_slug else None
+    vendor_id = filters.get('vendor')
+    price = filters.get('price')
+
+    category_counts, vendor_counts, price_counts = {}, {}, {}
+    total = 0
+    for row_category, row_vendor, row_price, count in data['rows']:
+        in_category = category_id is None or row_category == category_id
+        in_vendor = vendor_id is None or row_vendor == vendor_id
+        in_price = price is None or row_price == price
+        if in_vendor and in_price:
+            category_counts[row_category] = category_counts.get(row_category, 0) + count
+        if in_category and in_price:
+            vendor_counts[row_vendor] = vendor_counts.get(row_vendor, 0) + count
+        if in_category and in_vendor:
+            price_counts[row_price] = price_counts.get(row_price, 0) + count
+        if in_category and in_vendor and in_price:
+            total += count
+
+    def link(name, value):
+        params = {k: v for k, v in filters.items() if k != name and v is not None}
+        if value is not None:
+            params[name] = value
+        return urlencode(params)
+
+    top_vendors = sorted(vendor_counts.items(), key=lambda item: (-item[1], item[0]))[:MAX_VENDORS]
+    if vendor_id is not None and vendor_id not in dict(top_vendors):
+        top_vendors.append((vendor_id, vendor_counts.get(vendor_id, 0)))
+    return {
+        'total': total,
+        'all_categories_count': sum(category_counts.values()),
+        'all_categories_query': link('category', None),
+        'categories': [
+            {
+                'slug': slug,
+                'name': name,
+                'count': category_counts.get(pk, 0),
+                'selected': pk == category_id,
+                'query': link('category', slug),
+            }
+            for pk, slug, name in data['categories']
+        ],
+        'vendors': [
+            {
+                'id': pk,
+                'name': data['vendors'].get(pk, ''),
+                'count': count,
+                'selected': pk == vendor_id,
+                'query': link('vendor', None if pk == vendor_id else pk),
+            }
+            for pk, count in top_vendors
+        ],
+        'prices': [
+            {
+                'key': key,
+                'label': label,
+                'count': price_counts.get(key, 0),
+                'selected': key == price,
+                'query': link('price', None if key == price else key),
+            }
+            for key, label, _, _ in PRICE_BUCKETS
+        ],
+    }
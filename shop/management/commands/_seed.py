@@ -0,0 +1,31 @@
+"""Synthetic catalog data shared by the benchmark commands"""
+from shop.models import Product
+
+WORDS = [
+    'wireless', 'bluetooth', 'charger', 'laptop', 'phone', 'case', 'screen',
+    'protector', 'speaker', 'headphones', 'earbuds', 'cable', 'usb', 'adapter',
+    'keyboard', 'mouse', 'gaming', 'controller', 'smart', 'watch', 'camera',
+    'tripod', 'power', 'bank', 'router', 'tablet', 'stand', 'monitor', 'fast',
+    'portable', 'noise', 'cancelling', 'mechanical', 'ultra', 'slim', 'pro',
+]
+
+
+def seed_products(vendors, categories, rng, start, stop, batch_size=5000):
+    """bulk_create products numbered start..stop-1 and return their ids"""
+    new_ids = []
+    for batch_start in range(start, stop, batch_size):
+        batch = []
+        for i in range(batch_start, min(batch_start + batch_size, stop)):
+            batch.append(Product(
+                vendor=rng.choice(vendors),
+                category=rng.choice(categories),
+                name=' '.join(rng.sample(WORDS, 3)).title(),
+                slug=f'seed-product-{i}',
+                description=' '.join(rng.choices(WORDS, k=20)),
+                price=rng.randint(10, 5000),
+                stock_quantity=rng.randint(0, 50),
+                is_featured=rng.random() < 0.05,
+                image='',
+            ))
+        new_ids.extend(p.pk for p in Product.objects.bulk_create(batch))
+    return new_ids
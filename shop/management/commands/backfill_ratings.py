@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from shop.models import Product, Review
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating_avg/rating_count of every product from its reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of products to update per statement',
+            default=5000
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        rating_count = Subquery(reviews.annotate(count=Count('id')).values('count'))
+        rating_avg = Subquery(reviews.annotate(avg=Avg('rating')).values('avg'))
+
+        self.stdout.write('Backfilling product ratings...')
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            updated += Product.objects.filter(id__gte=ids[0], id__lte=ids[-1]).update(
+                rating_count=Coalesce(rating_count, Value(0)),
+                rating_avg=Coalesce(rating_avg, Value(0.0)),
+            )
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'✓ Updated ratings for {updated} products'))
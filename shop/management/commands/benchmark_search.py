@@ -0,0 +1,66 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from shop import search
+from shop.models import Category, Product, Vendor
+from ._seed import seed_products
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text search with the legacy icontains query on a seeded catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help='Catalog sizes to benchmark')
+        parser.add_argument('--queries', nargs='+', default=['wireless', 'gaming mouse', 'usb cab'],
+                            help='Search strings to time')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per query (best run is reported)')
+
+    def handle(self, *args, **options):
+        # Everything is seeded inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        user = User.objects.create(username='search-benchmark')
+        vendor = Vendor.objects.create(user=user, shop_name='Search Benchmark Store')
+        category = Category.objects.create(name='Search Benchmark')
+        rng = random.Random(42)
+        seeded = 0
+
+        self.stdout.write(f"{'products':>10} {'query':<16} {'icontains ms':>13} {'index ms':>10} {'matches':>9}")
+        for size in sorted(options['sizes']):
+            new_ids = seed_products([vendor], [category], rng, seeded, size)
+            search.index_products(new_ids)
+            seeded = size
+
+            for query in options['queries']:
+                base = Product.objects.select_related('vendor', 'category').filter(category=category)
+                legacy = base.filter(
+                    Q(name__icontains=query) |
+                    Q(description__icontains=query) |
+                    Q(vendor__shop_name__icontains=query)
+                )
+                indexed = search.search_products(base, query).order_by('-search_rank')
+                legacy_ms = self.time(legacy, options['repeat'])
+                indexed_ms = self.time(indexed, options['repeat'])
+                self.stdout.write(
+                    f'{size:>10} {query:<16} {legacy_ms:>13.2f} {indexed_ms:>10.2f} {indexed.count():>9}'
+                )
+
+    def time(self, queryset, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset.count()
+            list(queryset[:12])
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,84 @@
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from orders.models import Order, OrderItem
+from shop.models import Category, Vendor
+from ._seed import seed_products
+
+
+class Command(BaseCommand):
+    help = "Stream a seeded vendor's sales export at growing sizes and report time to first byte and peak memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 100000, 1000000],
+                            help='Sold order items to export')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv',
+                            help='Export format')
+
+    def handle(self, *args, **options):
+        # Everything is seeded inside a transaction that is rolled back at the end
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        user = User.objects.create(username='export-benchmark')
+        vendor = Vendor.objects.create(user=user, shop_name='Export Benchmark Store')
+        category = Category.objects.create(name='Export Benchmark')
+        rng = random.Random(25)
+        product_ids = seed_products([vendor], [category], rng, 0, 200)
+        client = Client()
+        client.force_login(user)
+        url = reverse('shop:vendor_export', args=['orders', options['format']])
+        seeded = 0
+
+        self.stdout.write(f"{'rows':>10} {'first byte ms':>14} {'total s':>8} {'MB sent':>8} {'peak MB':>8}")
+        for size in sorted(options['sizes']):
+            self.seed(user, product_ids, rng, seeded, size)
+            seeded = size
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            response = client.get(url)
+            chunks = iter(response.streaming_content)
+            sent = len(next(chunks))
+            first_byte = time.perf_counter() - started
+            lines = 0
+            for chunk in chunks:
+                sent += len(chunk)
+                lines += chunk.count(b'\n')
+            total = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            if options['format'] == 'jsonl':
+                lines += 1
+            if lines != size:
+                raise CommandError(f'Exported {lines} rows, expected {size}')
+            self.stdout.write(
+                f'{size:>10} {first_byte * 1000:>14.1f} {total:>8.2f} {sent / 2 ** 20:>8.1f} {peak / 2 ** 20:>8.2f}'
+            )
+        self.stdout.write(self.style.SUCCESS('✓ Export benchmark complete'))
+
+    def seed(self, user, product_ids, rng, start, stop, items_per_order=5, batch_size=5000):
+        for batch_start in range(start, stop, batch_size):
+            batch_stop = min(batch_start + batch_size, stop)
+            orders = Order.objects.bulk_create([
+                Order(user=user, full_name='Benchmark', email='benchmark@example.com', phone='0200000000',
+                      address='1 Benchmark St', city='Accra', total_paid=Decimal('100.00'), paid=True, status='paid')
+                for _ in range(0, batch_stop - batch_start, items_per_order)
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=orders[(i - batch_start) // items_per_order], product_id=rng.choice(product_ids),
+                          price=Decimal(rng.randint(100, 500000)) / 100, quantity=rng.randint(1, 3))
+                for i in range(batch_start, batch_stop)
+            ])
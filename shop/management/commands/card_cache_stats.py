@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from shop import cards
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the product card fragment cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after printing them'
+        )
+
+    def handle(self, *args, **options):
+        counts = cards.stats()
+        lookups = counts['hits'] + counts['misses']
+        ratio = counts['hits'] / lookups * 100 if lookups else 0
+        self.stdout.write(f"Hits: {counts['hits']}")
+        self.stdout.write(f"Misses: {counts['misses']}")
+        self.stdout.write(self.style.SUCCESS(f'✓ Hit ratio: {ratio:.1f}%'))
+        if options['reset']:
+            cards.reset_stats()
+            self.stdout.write('Counters reset')
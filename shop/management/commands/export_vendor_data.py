@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import exports
+from shop.models import Vendor
+
+
+class Command(BaseCommand):
+    help = "Stream a vendor's sold order items or products as CSV or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('vendor_id', type=int, help='Vendor to export')
+        parser.add_argument('dataset', choices=list(exports.DATASETS), help='What to export')
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv',
+                            help='Output format')
+        parser.add_argument('--output', help='File to write to (default: standard output)')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE,
+                            help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        try:
+            vendor = Vendor.objects.get(id=options['vendor_id'])
+        except Vendor.DoesNotExist:
+            raise CommandError(f"Vendor {options['vendor_id']} does not exist")
+        chunks = exports.stream(vendor, options['dataset'], options['format'], chunk_size=options['chunk_size'])
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Exported {options['dataset']} of {vendor.shop_name} to {options['output']}"
+        ))
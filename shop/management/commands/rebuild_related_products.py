@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shop import related
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed related-products list of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of rows to insert per batch',
+            default=5000
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding related products...')
+        with transaction.atomic():
+            total = related.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt related products for {total} products'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from shop import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of products to index per batch',
+            default=5000
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING(
+                f"Full-text search is not available on this '{connection.vendor}' database; "
+                "searches fall back to icontains."
+            ))
+            return
+
+        self.stdout.write('Rebuilding product search index...')
+        with transaction.atomic():
+            total = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexed {total} products'))
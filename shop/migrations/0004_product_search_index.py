@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE shop_product_search USING fts5("
+            "name, description, shop_name, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO shop_product_search (rowid, name, description, shop_name) "
+            "SELECT p.id, p.name, p.description, v.shop_name "
+            "FROM shop_product p JOIN shop_vendor v ON v.id = p.vendor_id"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE shop_product_search ("
+            "product_id bigint PRIMARY KEY REFERENCES shop_product(id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX shop_product_search_document_idx "
+            "ON shop_product_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO shop_product_search (product_id, document) "
+            "SELECT p.id, "
+            "setweight(to_tsvector('english', p.name), 'A') || "
+            "setweight(to_tsvector('english', coalesce(v.shop_name, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(p.description, '')), 'C') "
+            "FROM shop_product p JOIN shop_vendor v ON v.id = p.vendor_id"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS shop_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_vendor_address_vendor_banner_image_vendor_location_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
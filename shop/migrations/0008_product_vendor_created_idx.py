@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['vendor', 'created_at', 'id'], name='product_vendor_created_idx'),
+        ),
+    ]
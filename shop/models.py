@@ -2,7 +2,6 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Avg
 
 class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -45,9 +44,25 @@ class Product(models.Model):
     image = models.ImageField(upload_to='product_images/')
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from Review, kept in sync by shop.signals
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ('-created_at',)
+        # One index per catalog access path; each ends on id so the keyset
+        # pagination tiebreaker is served by the index as well.
+        indexes = [
+            models.Index(fields=['is_featured', 'created_at', 'id'], name='product_featured_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+            models.Index(fields=['category', 'is_featured', 'created_at', 'id'], name='product_cat_featured_idx'),
+            models.Index(fields=['vendor', 'is_featured', 'created_at', 'id'], name='product_vendor_featured_idx'),
+            models.Index(fields=['vendor', 'created_at', 'id'], name='product_vendor_created_idx'),
+            models.Index(fields=['vendor', 'price', 'id'], name='product_vendor_price_idx'),
+            models.Index(fields=['vendor', 'stock_quantity'], name='product_vendor_stock_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -60,7 +75,7 @@ class Product(models.Model):
         return self.name
     
     def average_rating(self):
-        return self.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+        return self.rating_avg
 
     def __str__(self):
         return self.name
@@ -77,4 +92,17 @@ class Review(models.Model):
         ordering = ('-created_at',)
 
     def __str__(self):
-        return f'Review by {self.user.username} for {self.product.name}'
\ No newline at end of file
+        return f'Review by {self.user.username} for {self.product.name}'
+
+class RelatedProduct(models.Model):
+    """Precomputed "you might also like" list, rebuilt by shop.related"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ('product', 'position')
+        unique_together = ('product', 'position')
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id}'
@@ -0,0 +1,158 @@
+"""
+Keyset (cursor) pagination for product listings.
+
+Each page is fetched with a WHERE clause on the last row's sort key plus its
+id, so deep pages cost the same as the first one and no COUNT(*) is needed.
+Cursors are signed, opaque tokens passed around as ?after=.
+"""
+import json
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import Q
+
+# Every ordering ends on id so rows with equal sort values have a stable order
+PRODUCT_SORTS = {
+    'featured': ('-is_featured', '-created_at', '-id'),
+    'newest': ('-created_at', '-id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'name': ('name', 'id'),
+}
+
+CURSOR_SALT = 'shop.pagination.cursor'
+APPROXIMATE_COUNT_CAP = 1000
+
+
+def approximate_count(queryset, cap=APPROXIMATE_COUNT_CAP):
+    """
+    Cheap stand-in for queryset.count(). Returns (count, is_estimate).
+
+    Small result sets are counted exactly. Beyond cap, PostgreSQL reports the
+    planner's row estimate and other databases report the cap itself.
+    """
+    queryset = queryset.order_by()
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate > cap:
+            return estimate, True
+
+    count = queryset[:cap + 1].count()
+    if count > cap:
+        return cap, True
+    return count, False
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, has_previous):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate queryset by ordering using ?after= cursors.
+
+    Orderings on model fields use keyset filtering. Orderings that include
+    annotations (such as the search rank) can't be expressed as a WHERE
+    clause, so their cursors carry an offset instead.
+    """
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = self._model_fields(queryset.model, self.ordering)
+
+    @staticmethod
+    def _model_fields(model, ordering):
+        try:
+            return [model._meta.get_field(name.lstrip('-')) for name in ordering]
+        except FieldDoesNotExist:
+            return None
+
+    def page_queryset(self, cursor=None):
+        """The query page(cursor) runs"""
+        return self._rows(self.decode(cursor))
+
+    def _rows(self, position):
+        # One row more than a page, to tell whether there is a next one
+        queryset = self.queryset
+        offset = 0
+        if isinstance(position, int):
+            offset = position
+        elif position is not None:
+            queryset = queryset.filter(self._after(position))
+        return queryset[offset:offset + self.per_page + 1]
+
+    def page(self, cursor=None):
+        position = self.decode(cursor)
+        offset = position if isinstance(position, int) else 0
+        rows = list(self._rows(position))
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode(rows[-1], offset + self.per_page)
+        return CursorPage(rows, next_cursor, has_previous=position is not None)
+
+    def _after(self, values):
+        """Rows strictly after values in (ordering) order"""
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{name.lstrip("-")}__{lookup}': values[index]})
+            for previous, value in zip(self.ordering[:index], values[:index]):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def encode(self, obj, offset):
+        if self.fields is None:
+            payload = {'o': offset}
+        else:
+            payload = {'k': [field.value_to_string(obj) for field in self.fields]}
+        payload['s'] = list(self.ordering)
+        return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+    def decode(self, cursor):
+        """Key values or offset for cursor, or None when it is absent or invalid"""
+        if not cursor:
+            return None
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        if not isinstance(payload, dict) or payload.get('s') != list(self.ordering):
+            return None
+
+        if self.fields is None:
+            offset = payload.get('o')
+            return offset if isinstance(offset, int) and offset >= 0 else None
+
+        values = payload.get('k')
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            return None
+        try:
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            return None
@@ -0,0 +1,41 @@
+"""
+The main querysets behind the catalog pages.
+
+Views build their listings here, and CatalogQueryPlanTests in shop.tests
+EXPLAINs these same functions, so a change to a view's query is checked
+against the indexes without having to be copied into the test.
+"""
+from orders.models import OrderItem
+
+from .models import Product
+
+HOME_PRODUCTS = 4
+SHOP_PAGE_SIZE = 12
+STOREFRONT_PAGE_SIZE = 16
+RECENT_ORDERS = 10
+
+
+def featured_products():
+    return Product.objects.select_related('vendor').filter(is_featured=True).order_by('-created_at')[:HOME_PRODUCTS]
+
+
+def new_arrivals():
+    return Product.objects.select_related('vendor').order_by('-created_at')[:HOME_PRODUCTS]
+
+
+def catalog_products():
+    """Products with what the product cards show"""
+    return Product.objects.select_related('vendor', 'category')
+
+
+def storefront_products(vendor):
+    return catalog_products().filter(vendor=vendor)
+
+
+def sold_items(vendor):
+    """Paid order lines for vendor's products"""
+    return OrderItem.objects.filter(product__vendor=vendor, order__paid=True)
+
+
+def recent_sold_items(vendor):
+    return sold_items(vendor).select_related('order', 'product').order_by('-order__created_at')[:RECENT_ORDERS]
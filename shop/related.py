@@ -0,0 +1,101 @@
+"""
+Precomputed related products.
+
+Each product stores RELATED_LIMIT other products from its category in
+RelatedProduct, so product_detail reads them with one indexed lookup instead
+of sorting the whole category with ORDER BY RANDOM(). Lists are rebuilt in
+bulk by the rebuild_related_products command and refreshed for individual
+products from shop.signals.
+"""
+import random
+from collections import defaultdict
+
+from django.db.models import Max, Min
+
+from .models import Product, RelatedProduct
+
+RELATED_LIMIT = 4
+
+
+def sample_related_ids(product_id, category_id, limit=RELATED_LIMIT, exclude=()):
+    """
+    Cheap random sample of ids from a category: start at a random point of
+    the category's id range and take the next rows in id order, wrapping
+    around to the start when the tail is too short.
+    """
+    candidates = Product.objects.filter(category_id=category_id).exclude(id=product_id)
+    if exclude:
+        candidates = candidates.exclude(id__in=exclude)
+    bounds = candidates.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+
+    pivot = random.randint(bounds['low'], bounds['high'])
+    ids = list(candidates.filter(id__gte=pivot).order_by('id').values_list('id', flat=True)[:limit])
+    if len(ids) < limit:
+        ids += candidates.filter(id__lt=pivot).order_by('id').values_list('id', flat=True)[:limit - len(ids)]
+    return ids
+
+
+def related_products(product, limit=RELATED_LIMIT):
+    entries = (
+        RelatedProduct.objects.filter(product=product)
+        .select_related('related__vendor', 'related__category')[:limit]
+    )
+    products = [entry.related for entry in entries]
+    if len(products) < limit:
+        # Not built yet, or thinned out by deletes: top up with a cheap sample
+        extra_ids = sample_related_ids(
+            product.id, product.category_id, limit - len(products), exclude=[p.id for p in products]
+        )
+        extra = Product.objects.select_related('vendor', 'category').in_bulk(extra_ids)
+        products += [extra[pk] for pk in extra_ids if pk in extra]
+    return products
+
+
+def refresh_related(product_ids):
+    """Rebuild the lists of a handful of products, e.g. after a catalog change"""
+    product_ids = list(product_ids)
+    RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+    entries = []
+    for product_id, category_id in Product.objects.filter(id__in=product_ids).values_list('id', 'category_id'):
+        related_ids = sample_related_ids(product_id, category_id)
+        entries += [
+            RelatedProduct(product_id=product_id, related_id=related_id, position=position)
+            for position, related_id in enumerate(related_ids)
+        ]
+    RelatedProduct.objects.bulk_create(entries)
+
+
+def rebuild(batch_size=5000, rng=None):
+    """Rebuild every product's list, one category at a time. Returns the number of products."""
+    rng = rng or random.Random()
+    RelatedProduct.objects.all().delete()
+
+    by_category = defaultdict(list)
+    for product_id, category_id in Product.objects.order_by('id').values_list('id', 'category_id').iterator(chunk_size=batch_size):
+        by_category[category_id].append(product_id)
+
+    total = 0
+    entries = []
+    for ids in by_category.values():
+        for product_id in ids:
+            if len(ids) <= RELATED_LIMIT + 1:
+                related_ids = [pk for pk in ids if pk != product_id]
+                rng.shuffle(related_ids)
+            else:
+                related_ids = []
+                while len(related_ids) < RELATED_LIMIT:
+                    pk = rng.choice(ids)
+                    if pk != product_id and pk not in related_ids:
+                        related_ids.append(pk)
+            entries += [
+                RelatedProduct(product_id=product_id, related_id=related_id, position=position)
+                for position, related_id in enumerate(related_ids)
+            ]
+            total += 1
+            if len(entries) >= batch_size:
+                RelatedProduct.objects.bulk_create(entries)
+                entries = []
+    RelatedProduct.objects.bulk_create(entries)
+    return total
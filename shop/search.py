@@ -0,0 +1,180 @@
+"""
+Full-text search index for the product catalog.
+
+SQLite uses an FTS5 virtual table keyed by product id (rowid). PostgreSQL
+uses a side table holding a weighted tsvector with a GIN index. Any other
+database, or one where the table is missing (e.g. SQLite built without
+FTS5), falls back to the plain icontains lookup.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q, FloatField, Value
+
+from .models import Product, Vendor
+
+SEARCH_TABLE = 'shop_product_search'
+SEARCH_CONFIG = 'english'
+MAX_TERMS = 8
+BATCH_SIZE = 500
+
+TERM_RE = re.compile(r'[^\W_]+', re.UNICODE)
+NO_RANK = Value(0.0, output_field=FloatField())
+
+# Whether SEARCH_TABLE exists, per database alias; looked up once per process
+_table_exists = {}
+
+
+def is_supported():
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return False
+    if connection.alias not in _table_exists:
+        _table_exists[connection.alias] = SEARCH_TABLE in connection.introspection.table_names()
+    return _table_exists[connection.alias]
+
+
+def _terms(query):
+    return TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def _match_expression(terms):
+    """Build a prefix query so partially typed words still match"""
+    if connection.vendor == 'postgresql':
+        return ' & '.join(f'{term}:*' for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_products(queryset, query):
+    """
+    Restrict queryset to products matching query and annotate each row
+    with search_rank (higher is more relevant).
+    """
+    terms = _terms(query or '')
+    if not terms:
+        return queryset.annotate(search_rank=NO_RANK).none()
+
+    if not is_supported():
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(vendor__shop_name__icontains=query)
+        ).annotate(search_rank=NO_RANK)
+
+    match = _match_expression(terms)
+    product_table = Product._meta.db_table
+
+    # Join the index table so the database drives the query from the index
+    # and computes the rank once per match, instead of per candidate row.
+    if connection.vendor == 'postgresql':
+        tsquery = 'to_tsquery(%s, %s)'
+        params = [SEARCH_CONFIG, match]
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{SEARCH_TABLE}.product_id = {product_table}.id',
+                f'{SEARCH_TABLE}.document @@ {tsquery}',
+            ],
+            params=params,
+            select={'search_rank': f'ts_rank({SEARCH_TABLE}.document, {tsquery})'},
+            select_params=params,
+        )
+
+    # bm25() is lower-is-better; column weights are name, description, shop_name.
+    # The unary + keeps SQLite from probing FTS5 by rowid once per product row
+    # (which re-runs the MATCH each time) and forces the index to drive the join.
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[
+            f'+{SEARCH_TABLE}.rowid = {product_table}.id',
+            f'{SEARCH_TABLE} MATCH %s',
+        ],
+        params=[match],
+        select={'search_rank': f'-bm25({SEARCH_TABLE}, 10.0, 1.0, 5.0)'},
+    )
+
+
+def _chunks(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def index_products(product_ids):
+    """(Re)index the given products from their current database rows"""
+    if not is_supported():
+        return
+
+    product_table = Product._meta.db_table
+    vendor_table = Vendor._meta.db_table
+
+    with connection.cursor() as cursor:
+        for chunk in _chunks(product_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"""
+                    INSERT INTO {SEARCH_TABLE} (product_id, document)
+                    SELECT p.id,
+                           setweight(to_tsvector(%s, p.name), 'A') ||
+                           setweight(to_tsvector(%s, coalesce(v.shop_name, '')), 'B') ||
+                           setweight(to_tsvector(%s, coalesce(p.description, '')), 'C')
+                    FROM {product_table} p
+                    JOIN {vendor_table} v ON v.id = p.vendor_id
+                    WHERE p.id IN ({placeholders})
+                    ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document
+                    """,
+                    [SEARCH_CONFIG] * 3 + chunk,
+                )
+            else:
+                cursor.execute(
+                    f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})',
+                    chunk,
+                )
+                cursor.execute(
+                    f"""
+                    INSERT INTO {SEARCH_TABLE} (rowid, name, description, shop_name)
+                    SELECT p.id, p.name, p.description, v.shop_name
+                    FROM {product_table} p
+                    JOIN {vendor_table} v ON v.id = p.vendor_id
+                    WHERE p.id IN ({placeholders})
+                    """,
+                    chunk,
+                )
+
+
+def remove_products(product_ids):
+    if not is_supported():
+        return
+
+    key = 'product_id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        for chunk in _chunks(product_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({placeholders})',
+                chunk,
+            )
+
+
+def rebuild(batch_size=5000):
+    """Drop every index entry and re-index the whole catalog in batches"""
+    if not is_supported():
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Product.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        index_products(ids)
+        total += len(ids)
+        last_id = ids[-1]
+    return total
@@ -0,0 +1,101 @@
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Category, Product, RelatedProduct, Vendor, Review
+from core import page_cache
+from . import cards, facets, related, search
+
+@receiver(pre_save, sender=Product)
+def remember_previous_category(sender, instance, raw=False, **kwargs):
+    instance._previous_category_id = None
+    if instance.pk and not raw:
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_products([instance.pk])
+    facets.bump_generation()
+    cards.bump_versions([instance.pk])
+    page_cache.bump_generation()
+
+    previous_category_id = getattr(instance, '_previous_category_id', None)
+    if created or previous_category_id is None:
+        related.refresh_related([instance.pk])
+    elif previous_category_id != instance.category_id:
+        # Products in the old category must stop pointing at this one
+        referencing = RelatedProduct.objects.filter(related=instance).values_list('product_id', flat=True)
+        related.refresh_related([instance.pk, *referencing])
+
+@receiver(pre_delete, sender=Product)
+def remember_referencing_products(sender, instance, **kwargs):
+    instance._referencing_ids = list(
+        RelatedProduct.objects.filter(related=instance).values_list('product_id', flat=True)
+    )
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    facets.bump_generation()
+    cards.bump_versions([instance.pk])
+    page_cache.bump_generation()
+    related.refresh_related(getattr(instance, '_referencing_ids', []))
+
+@receiver(post_save, sender=Vendor)
+def vendor_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Only the shop name is used by the search index, the facets and the cards
+    if raw or created or (update_fields and 'shop_name' not in update_fields):
+        return
+    product_ids = list(instance.products.values_list('id', flat=True))
+    search.index_products(product_ids)
+    facets.bump_generation()
+    cards.bump_versions(product_ids)
+    page_cache.bump_generation()
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.bump_generation()
+        page_cache.bump_generation()
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+        )
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    products = Product.objects.filter(pk=instance.product_id)
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        products.update(
+            rating_avg=(F('rating_avg') * F('rating_count') + instance.rating) / (F('rating_count') + 1),
+            rating_count=F('rating_count') + 1,
+        )
+    elif previous != instance.rating:
+        products.filter(rating_count__gt=0).update(
+            rating_avg=F('rating_avg') + Value(float(instance.rating - previous)) / F('rating_count'),
+        )
+    cards.bump_versions([instance.product_id])
+    page_cache.bump_generation()
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id, rating_count__gt=0).update(
+        rating_avg=Case(
+            When(rating_count=1, then=Value(0.0)),
+            default=(F('rating_avg') * F('rating_count') - instance.rating) / (F('rating_count') - 1),
+        ),
+        rating_count=F('rating_count') - 1,
+    )
+    cards.bump_versions([instance.product_id])
+    page_cache.bump_generation()
@@ -0,0 +1,9 @@
+from django import template
+from shop import cards
+
+register = template.Library()
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
+    """Rendered product cards for products, served from the fragment cache"""
+    return cards.render_cards(products, context.get('csrf_token'))
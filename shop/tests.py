@@ -1,3 +1,624 @@
+import csv
+import io
+import json
+import random
+import re
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection, models
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.views import ORDERS_PER_PAGE
+from orders import loading
+from orders.models import Order, OrderItem
+from orders.tests import make_order, make_products
+from . import cards, exports, facets, queries, related, search
+from .models import Category, Product, RelatedProduct, Review, Vendor
+from .pagination import CURSOR_SALT, PRODUCT_SORTS, CursorPaginator
+
+# Plan lines that walk a whole table. On SQLite an index walk (SCAN ... USING
+# INDEX) only counts as indexed access when the query is LIMITed and the
+# index delivers rows already in ORDER BY order.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?P<table>\w+)(?P<index> USING (?:COVERING )?INDEX \w+)?'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+# Plan lines that sort every matching row before LIMIT can apply
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+    'postgresql': re.compile(r'(?<!Incremental )\bSort  \('),
+}
+CHECKED_TABLES = {
+    Product._meta.db_table,
+    Order._meta.db_table,
+    OrderItem._meta.db_table,
+}
+
+
+def first_page(queryset, ordering, per_page):
+    return CursorPaginator(queryset, ordering, per_page).page_queryset()
+
+
+def seed_products(vendors, categories, count, rng):
+    """bulk_create count products spread over vendors and categories; returns their ids"""
+    products = Product.objects.bulk_create([
+        Product(vendor=rng.choice(vendors), category=rng.choice(categories), name=f'Seeded {i}',
+                slug=f'seeded-{i}-{rng.random():.12f}', description='-', price=rng.randint(10, 5000),
+                stock_quantity=rng.randint(0, 50), is_featured=rng.random() < 0.05, image='')
+        for i in range(count)
+    ])
+    return [product.pk for product in products]
+
+
+class CatalogQueryPlanTests(TestCase):
+    """EXPLAIN each catalog view's main query on a seeded catalog; none may scan a whole table"""
+    # Small, but several times the size at which SQLite's planner starts to
+    # prefer a scan over the indexes (below about 50 products)
+    size = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        users = [User.objects.create(username=f'plan-check-{i}') for i in range(50)]
+        vendors = [Vendor.objects.create(user=user, shop_name=f'Plan Check {i}') for i, user in enumerate(users)]
+        categories = [Category.objects.create(name=f'Plan Check {i}') for i in range(20)]
+        product_ids = seed_products(vendors, categories, cls.size, rng)
+
+        cls.customer = User.objects.create(username='plan-check-customer')
+        orders = Order.objects.bulk_create([
+            Order(user=rng.choice(users + [cls.customer]), full_name='Plan Check', email='plan@example.com',
+                  phone='0000000000', address='-', city='-', total_paid=100, paid=rng.random() < 0.7)
+            for _ in range(cls.size // 10)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=rng.choice(product_ids), price=50, quantity=2)
+            for order in orders
+            for _ in range(2)
+        ])
+        cls.vendor, cls.category = vendors[0], categories[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor not in FULL_SCAN_PATTERNS:
+            self.skipTest(f"Query plans can't be checked on '{connection.vendor}'")
+
+    def queries(self):
+        """(label, queryset, ordered) for each view's main query, built by the
+        same functions the views call; ordered queries are listing pages that
+        must be read in index order"""
+        vendor, category = self.vendor, self.category
+        yield 'index featured', queries.featured_products(), True
+        yield 'index new arrivals', queries.new_arrivals(), True
+        for sort_by, ordering in PRODUCT_SORTS.items():
+            yield f'shop_view sort={sort_by}', first_page(queries.catalog_products(), ordering, queries.SHOP_PAGE_SIZE), True
+        yield 'shop_view category', first_page(
+            queries.catalog_products().filter(category__slug=category.slug), PRODUCT_SORTS['featured'], queries.SHOP_PAGE_SIZE
+        ), True
+        for sort_by in ('featured', 'newest', 'price_low', 'price_high'):
+            yield f'vendor_storefront sort={sort_by}', (
+                first_page(queries.storefront_products(vendor), PRODUCT_SORTS[sort_by], queries.STOREFRONT_PAGE_SIZE)
+            ), True
+        yield 'vendor_dashboard recent orders', queries.recent_sold_items(vendor), False
+        yield 'customer_profile orders', first_page(
+            loading.history(self.customer), loading.HISTORY_ORDERING, ORDERS_PER_PAGE
+        ), True
+
+    def full_scans(self, plan, limited):
+        tables = set()
+        for match in FULL_SCAN_PATTERNS[connection.vendor].finditer(plan):
+            if match.group('table') not in CHECKED_TABLES:
+                continue
+            ordered_walk = (
+                match.groupdict().get('index') and limited
+                and not SORT_PATTERNS[connection.vendor].search(plan)
+            )
+            if not ordered_walk:
+                tables.add(match.group('table'))
+        return tables
+
+    def test_catalog_queries_use_indexes(self):
+        for label, queryset, ordered in self.queries():
+            with self.subTest(label):
+                plan = queryset.explain()
+                self.assertEqual(self.full_scans(plan, queryset.query.high_mark is not None), set(), plan)
+                if ordered:
+                    self.assertNotRegex(plan, SORT_PATTERNS[connection.vendor])
+
+    def test_storefront_newest_uses_vendor_created_index(self):
+        queryset = first_page(queries.storefront_products(self.vendor), PRODUCT_SORTS['newest'], queries.STOREFRONT_PAGE_SIZE)
+        self.assertIn('product_vendor_created_idx', queryset.explain())
+
+
+class CatalogViewQueryTests(TestCase):
+    def test_storefront_queries_do_not_grow_with_the_catalog(self):
+        user = User.objects.create(username='storefront-owner')
+        vendor = Vendor.objects.create(user=user, shop_name='Storefront')
+        category = Category.objects.create(name='Storefront')
+        rng = random.Random(4)
+        url = reverse('shop:vendor_storefront', args=[vendor.id]) + '?sort=newest'
+        for count in (5, 55):
+            seed_products([vendor], [category], count, rng)
+            with self.assertNumQueries(3):
+                self.client.get(url)
+
+
+class VendorExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='export-vendor')
+        cls.vendor = Vendor.objects.create(user=cls.user, shop_name='Export Store')
+        other = Vendor.objects.create(user=User.objects.create(username='export-other'), shop_name='Other Store')
+        category = Category.objects.create(name='Export Category')
+        cls.formula, cls.plain = [
+            Product.objects.create(vendor=cls.vendor, category=category, name=name, description='-',
+                                   price=Decimal('12.50'), stock_quantity=3, image='product_images/test.jpg')
+            for name in ('=HYPERLINK("http://example.com")', 'Plain Product')
+        ]
+        elsewhere = Product.objects.create(vendor=other, category=category, name='Elsewhere', description='-',
+                                           price=Decimal('5.00'), stock_quantity=3, image='product_images/test.jpg')
+        for paid, city in ((True, '@Accra'), (False, 'Tema')):
+            order = Order.objects.create(full_name='Export Customer', email='export@example.com', phone='0',
+                                         address='-', city=city, total_paid=Decimal('30.00'), paid=paid)
+            for product in (cls.formula, cls.plain, elsewhere):
+                OrderItem.objects.create(order=order, product=product, price=product.price, quantity=2)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, dataset, fmt):
+        return self.client.get(reverse('shop:vendor_export', args=[dataset, fmt]))
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_routes_every_dataset_and_format(self):
+        for dataset in exports.DATASETS:
+            for fmt, content_type in exports.FORMATS.items():
+                with self.subTest(dataset=dataset, fmt=fmt):
+                    response = self.get(dataset, fmt)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response['Content-Type'], content_type)
+                    self.assertRegex(response['Content-Disposition'],
+                                     rf'^attachment; filename="{self.vendor.id}-{dataset}-\d{{8}}\.{fmt}"$')
+                    self.assertEqual(response['X-Accel-Buffering'], 'no')
+
+    def test_unknown_dataset_or_format_is_not_found(self):
+        url = reverse('shop:vendor_export', args=['orders', 'csv'])
+        for path in (url.replace('orders.csv', 'customers.csv'), url.replace('orders.csv', 'orders.xlsx')):
+            with self.subTest(path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_orders_csv(self):
+        rows = list(csv.reader(io.StringIO(self.content(self.get('orders', 'csv')))))
+        self.assertEqual(rows[0], list(exports.ORDER_ITEM_COLUMNS))
+        # Paid orders and this vendor's products only
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[4] for row in rows[1:]}, {"'" + self.formula.name, self.plain.name})
+        self.assertEqual({(row[5], Decimal(row[7]), row[8]) for row in rows[1:]}, {('2', Decimal('25.00'), "'@Accra")})
+
+    def test_products_jsonl(self):
+        lines = self.content(self.get('products', 'jsonl')).splitlines()
+        products = [json.loads(line) for line in lines]
+        self.assertEqual([product['name'] for product in products], [self.formula.name, self.plain.name])
+        self.assertEqual(products[0]['price'], '12.50')
+        self.assertEqual(set(products[0]), set(exports.PRODUCT_COLUMNS))
+
+    def test_small_chunks_and_buffers_stream_the_same_bytes(self):
+        for fmt in exports.FORMATS:
+            with self.subTest(fmt):
+                whole = ''.join(exports.stream(self.vendor, 'orders', fmt))
+                pieces = list(exports.stream(self.vendor, 'orders', fmt, chunk_size=1, buffer_size=1))
+                self.assertEqual(''.join(pieces), whole)
+                self.assertEqual(len(pieces), whole.count('\n'))
+
+
+def make_catalog(count, prefix='Catalog'):
+    vendor = Vendor.objects.create(user=User.objects.create(username=f'{prefix.lower()}-vendor'),
+                                   shop_name=f'{prefix} Store')
+    category = Category.objects.create(name=f'{prefix} Category')
+    return [
+        Product.objects.create(vendor=vendor, category=category, name=f'{prefix} Product {i}', description='-',
+                               price=Decimal('10.00') + i, stock_quantity=5, image='product_images/test.jpg')
+        for i in range(count)
+    ]
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.product, = make_catalog(1, 'Rating')
+        self.reviewers = [User.objects.create(username=f'reviewer-{i}') for i in range(3)]
+
+    def rating(self):
+        product = Product.objects.get(id=self.product.id)
+        return round(product.rating_avg, 6), product.rating_count
+
+    def review(self, reviewer, rating):
+        return Review.objects.create(product=self.product, user=reviewer, rating=rating, comment='-')
+
+    def test_counters_follow_reviews(self):
+        first = self.review(self.reviewers[0], 5)
+        second = self.review(self.reviewers[1], 2)
+        self.review(self.reviewers[2], 2)
+        self.assertEqual(self.rating(), (3.0, 3))
+
+        second.rating = 5
+        second.save()
+        self.assertEqual(self.rating(), (4.0, 3))
+        # Saving without changing the rating leaves the average alone
+        second.comment = 'Edited'
+        second.save()
+        self.assertEqual(self.rating(), (4.0, 3))
+
+        first.delete()
+        self.assertEqual(self.rating(), (3.5, 2))
+        Review.objects.filter(product=self.product).delete()
+        self.assertEqual(self.rating(), (0.0, 0))
+
+    def test_counters_match_a_fresh_aggregate(self):
+        for reviewer, rating in zip(self.reviewers, (1, 4, 4)):
+            self.review(reviewer, rating)
+        average, count = self.rating()
+        reviews = Review.objects.filter(product=self.product)
+        self.assertEqual(count, reviews.count())
+        self.assertAlmostEqual(average, sum(r.rating for r in reviews) / count)
+
+
+class ShopListingQueryTests(TestCase):
+    def test_listing_does_not_aggregate_reviews_per_product(self):
+        products = make_catalog(12, 'Listing')
+        reviewer = User.objects.create(username='listing-reviewer')
+        for product in products:
+            Review.objects.create(product=product, user=reviewer, rating=4, comment='-')
+
+        review_table = f'"{Review._meta.db_table}"'
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:shop_view'))
+        self.assertEqual(len(response.context['products']), 12)
+        self.assertFalse([q['sql'] for q in queries.captured_queries if review_table in q['sql']])
+
+        # The same page with fewer products costs the same number of queries
+        Product.objects.exclude(id__in=[p.id for p in products[:2]]).delete()
+        cache.clear()
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(reverse('shop:shop_view'))
+        self.assertEqual(len(response.context['products']), 2)
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        products = make_catalog(11, 'Cursor')
+        # Three runs of equal prices and a single shared timestamp, so every
+        # page boundary falls inside a run of tied sort keys
+        for index, product in enumerate(products):
+            product.price = Decimal('5.00') * (1 + index % 3)
+        Product.objects.bulk_update(products, ['price'])
+        Product.objects.update(created_at=products[0].created_at)
+
+    def walk(self, ordering, per_page=3):
+        paginator = CursorPaginator(Product.objects.all(), ordering, per_page)
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_tied_rows_once_in_order(self):
+        for sort, ordering in PRODUCT_SORTS.items():
+            with self.subTest(sort=sort):
+                pages = self.walk(ordering)
+                ids = [product.id for page in pages for product in page]
+                self.assertEqual(ids, list(Product.objects.order_by(*ordering).values_list('id', flat=True)))
+                self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+                self.assertEqual([page.has_previous() for page in pages], [False, True, True, True])
+                self.assertEqual([page.has_next() for page in pages], [True, True, True, False])
+
+    def test_offset_cursors_for_annotated_orderings(self):
+        queryset = Product.objects.annotate(doubled=models.F('price') * 2)
+        paginator = CursorPaginator(queryset, ('-doubled', 'id'), per_page=4)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        self.assertEqual(len(second), 4)
+        self.assertTrue(second.has_previous())
+        self.assertFalse({p.id for p in first} & {p.id for p in second})
+
+    def test_invalid_cursors_fall_back_to_the_first_page(self):
+        ordering = PRODUCT_SORTS['newest']
+        paginator = CursorPaginator(Product.objects.all(), ordering, per_page=3)
+        first = [p.id for p in paginator.page()]
+        valid = paginator.page().next_cursor
+        cursors = {
+            'garbage': 'not-a-cursor',
+            'tampered': valid[:-2] + ('aa' if not valid.endswith('aa') else 'bb'),
+            'other salt': signing.dumps({'k': ['2020-01-01T00:00:00Z', '1'], 's': list(ordering)}),
+            'other sort': CursorPaginator(Product.objects.all(), PRODUCT_SORTS['name'], 3).page().next_cursor,
+            'not a dict': signing.dumps(['x'], salt=CURSOR_SALT),
+            'wrong length': signing.dumps({'k': ['1'], 's': list(ordering)}, salt=CURSOR_SALT),
+            'bad values': signing.dumps({'k': [['x'], {'y': 1}], 's': list(ordering)}, salt=CURSOR_SALT),
+            'bad offset': signing.dumps({'o': -3, 's': list(ordering)}, salt=CURSOR_SALT),
+        }
+        for name, cursor in cursors.items():
+            with self.subTest(cursor=name):
+                page = paginator.page(cursor)
+                self.assertEqual([p.id for p in page], first)
+                self.assertFalse(page.has_previous())
+
+    def test_shop_view_ignores_bad_cursors(self):
+        bad = signing.dumps({'k': [['x'], 1], 's': list(PRODUCT_SORTS['newest'])}, salt=CURSOR_SALT)
+        for cursor in ('garbage', bad):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('shop:shop_view'), {'sort': 'newest', 'after': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.context['products'].has_previous())
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.phones = make_catalog(3, 'Phones')
+        self.cables = make_catalog(2, 'Cables')
+
+    def test_counts_are_cached_until_the_generation_changes(self):
+        products = Product.objects.all()
+        with self.assertNumQueries(3):
+            data = facets.facet_data(products, signature='')
+        with self.assertNumQueries(0):
+            self.assertEqual(facets.facet_data(products, signature=''), data)
+        # Another search is counted separately
+        with self.assertNumQueries(3):
+            facets.facet_data(products.filter(name__icontains='phones'), signature='phones')
+
+        facets.bump_generation()
+        with self.assertNumQueries(3):
+            facets.facet_data(products, signature='')
+
+    def test_catalog_changes_invalidate_the_counts(self):
+        before = facets.current_generation()
+        self.phones[0].price = Decimal('750.00')
+        self.phones[0].save()
+        self.assertNotEqual(facets.current_generation(), before)
+
+        counts = facets.build_facets(facets.facet_data(Product.objects.all(), signature=''), {})
+        self.assertEqual({p['key']: p['count'] for p in counts['prices']}['500-1000'], 1)
+        self.assertEqual(counts['total'], 5)
+
+    def test_each_facet_ignores_its_own_selection(self):
+        data = facets.facet_data(Product.objects.all(), signature='')
+        phones = self.phones[0].category
+        counts = facets.build_facets(data, {'category': phones.slug, 'vendor': None, 'price': None})
+        self.assertEqual(counts['total'], 3)
+        self.assertEqual(counts['all_categories_count'], 5)
+        self.assertEqual({c['slug']: c['count'] for c in counts['categories']},
+                         {phones.slug: 3, self.cables[0].category.slug: 2})
+        self.assertEqual([v['count'] for v in counts['vendors']], [3])
+        # An unknown category selects nothing
+        self.assertEqual(facets.build_facets(data, {'category': 'missing'})['total'], 0)
+
+    def test_shop_view_reads_cached_counts(self):
+        url = reverse('shop:shop_view')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries_run:
+            response = self.client.get(url)
+        self.assertEqual(response.context['facets']['total'], 5)
+        self.assertFalse([q['sql'] for q in queries_run.captured_queries if 'GROUP BY' in q['sql']])
+
+
+class RelatedProductTests(TestCase):
+    def setUp(self):
+        self.phones = make_catalog(7, 'Phones')
+        self.cables = make_catalog(3, 'Cables')
+        # Products created first found no others to list when they were saved
+        related.rebuild(rng=random.Random(6))
+
+    def related_ids(self, product):
+        return list(RelatedProduct.objects.filter(product=product).order_by('position')
+                    .values_list('related_id', flat=True))
+
+    def test_rebuild_command(self):
+        RelatedProduct.objects.all().delete()
+        out = io.StringIO()
+        call_command('rebuild_related_products', batch_size=4, stdout=out)
+        self.assertIn('✓ Rebuilt related products for 10 products', out.getvalue())
+
+        for group in (self.phones, self.cables):
+            group_ids = {product.id for product in group}
+            for product in group:
+                with self.subTest(product=product.name):
+                    ids = self.related_ids(product)
+                    self.assertEqual(len(ids), min(related.RELATED_LIMIT, len(group) - 1))
+                    self.assertEqual(len(set(ids)), len(ids))
+                    self.assertLessEqual(set(ids), group_ids - {product.id})
+
+    def test_detail_page_reads_the_precomputed_list(self):
+        product = self.phones[0]
+        with CaptureQueriesContext(connection) as queries_run:
+            response = self.client.get(reverse('shop:product_detail', args=[product.slug]))
+        self.assertFalse([q['sql'] for q in queries_run.captured_queries if 'RANDOM()' in q['sql'].upper()])
+        self.assertEqual([p.id for p in response.context['related_products']], self.related_ids(product))
+
+    def test_missing_lists_are_topped_up_from_the_category(self):
+        product = self.phones[0]
+        RelatedProduct.objects.filter(product=product).delete()
+        with CaptureQueriesContext(connection) as queries_run:
+            products = related.related_products(product)
+        self.assertFalse([q['sql'] for q in queries_run.captured_queries if 'RANDOM()' in q['sql'].upper()])
+        self.assertEqual(len(products), related.RELATED_LIMIT)
+        self.assertLessEqual({p.id for p in products}, {p.id for p in self.phones[1:]})
+
+    def test_deleting_a_product_refreshes_lists_that_showed_it(self):
+        product = self.cables[0]
+        removed = self.cables[1]
+        self.assertIn(removed.id, self.related_ids(product))
+        removed.delete()
+        self.assertEqual(self.related_ids(product), [self.cables[2].id])
+
+
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_catalog(2, 'Card')
+
+    def render(self, token='token-one'):
+        products = Product.objects.select_related('vendor').filter(id__in=[p.id for p in self.products]).order_by('id')
+        return cards.render_cards(products, token)
+
+    def test_cards_are_rendered_once(self):
+        first = self.render()
+        self.assertEqual(cards.stats(), {'hits': 0, 'misses': 2})
+        self.assertEqual(self.render(), first)
+        self.assertEqual(cards.stats(), {'hits': 2, 'misses': 2})
+
+    def test_bumping_a_version_renders_that_card_again(self):
+        self.render()
+        cards.bump_versions([self.products[0].id])
+        self.render()
+        self.assertEqual(cards.stats(), {'hits': 1, 'misses': 3})
+
+    def test_changes_show_up_in_the_cards(self):
+        self.render()
+        product = self.products[0]
+        product.name = 'Renamed Card Product'
+        product.save()
+        self.assertIn('Renamed Card Product', self.render()[0])
+
+        product.vendor.shop_name = 'Renamed Store'
+        product.vendor.save()
+        self.assertTrue(all('Renamed Store' in card for card in self.render()))
+
+        Review.objects.create(product=product, user=User.objects.create(username='card-reviewer'), rating=5, comment='-')
+        self.assertIn('1 review', self.render()[0])
+
+    def test_each_request_gets_its_own_csrf_token(self):
+        first = self.render('token-one')
+        second = self.render('token-two')
+        for card in first + second:
+            self.assertNotIn(cards.CSRF_PLACEHOLDER, card)
+        self.assertIn('value="token-one"', first[0])
+        self.assertIn('value="token-two"', second[0])
+        self.assertNotIn('token-one', second[0])
+
+    def test_pages_never_show_the_placeholder(self):
+        for _ in range(2):
+            response = self.client.get(reverse('shop:shop_view'))
+            self.assertContains(response, 'name="csrfmiddlewaretoken"')
+            self.assertNotContains(response, cards.CSRF_PLACEHOLDER)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.in_name, self.in_description, self.in_shop_name, self.unrelated = make_catalog(4, 'Search')
+        self.in_name.name = 'Wireless Charger'
+        self.in_description.description = 'Comes with a wireless remote'
+        self.in_shop_name.vendor.shop_name = 'Wireless World'
+        self.in_shop_name.vendor.save()
+        for product in (self.in_name, self.in_description):
+            product.save()
+        # The shop name is shared by all four; give the others their own vendor
+        other = Vendor.objects.create(user=User.objects.create(username='search-other'), shop_name='Other Store')
+        Product.objects.exclude(id=self.in_shop_name.id).update(vendor=other)
+        search.index_products(Product.objects.values_list('id', flat=True))
+
+    def results(self, query):
+        return list(search.search_products(Product.objects.all(), query).order_by('-search_rank', 'id'))
+
+    def test_matches_are_ranked_by_field(self):
+        if not search.is_supported():
+            self.skipTest(f"No full-text search table on '{connection.vendor}'")
+        self.assertEqual(self.results('wireless'), [self.in_name, self.in_shop_name, self.in_description])
+        # Partly typed words match as prefixes, and every word must match
+        self.assertEqual(self.results('wirel charg'), [self.in_name])
+        self.assertEqual(self.results('wireless nothing'), [])
+        self.assertEqual(self.results('  ...  '), [])
+
+    def test_index_follows_product_changes(self):
+        self.unrelated.name = 'Wireless Mouse'
+        self.unrelated.save()
+        self.assertIn(self.unrelated, self.results('mouse'))
+        self.in_name.delete()
+        self.assertEqual(self.results('charger'), [])
+
+    def test_falls_back_to_icontains_without_the_search_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {search.SEARCH_TABLE}')
+        search._table_exists.clear()
+        self.addCleanup(search._table_exists.clear)
+
+        self.assertFalse(search.is_supported())
+        self.assertEqual({p.id for p in self.results('wireless')},
+                         {self.in_name.id, self.in_description.id, self.in_shop_name.id})
+        # Catalog changes no longer try to write to the index
+        self.unrelated.name = 'Wireless Mouse'
+        self.unrelated.save()
+        response = self.client.get(reverse('shop:shop_view'), {'q': 'wireless'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 4)
+
+
+class VendorDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phone, cls.case, cls.cable = make_products(3, prefix='Dashboard')
+        for product, price, stock in ((cls.phone, '400.00', 2), (cls.case, '25.50', 5), (cls.cable, '10.00', 40)):
+            product.price, product.stock_quantity = Decimal(price), stock
+            product.save()
+        cls.vendor = cls.phone.vendor
+        other, = make_products(1, price=Decimal('999.00'), prefix='Elsewhere')
+
+        cls.paid = [
+            cls.pay(make_order([cls.phone, cls.case], quantity=2)),  # 851.00
+            cls.pay(make_order([cls.cable], quantity=3)),            # 30.00
+            cls.pay(make_order([cls.case, other], quantity=1)),      # 25.50 of ours
+        ]
+        # Neither an unpaid order nor another vendor's sales count
+        make_order([cls.phone], quantity=5)
+        cls.pay(make_order([other], quantity=4))
+
+    @staticmethod
+    def pay(order):
+        # Paid after its items exist, as checkout does, so the sales rollup counts it
+        order.paid, order.status = True, 'paid'
+        order.save()
+        return order
+
+    def dashboard(self, **params):
+        self.client.force_login(self.vendor.user)
+        return self.client.get(reverse('shop:vendor_dashboard'), params)
+
+    def test_totals_match_the_fixture(self):
+        context = self.dashboard().context
+        self.assertEqual(context['total_products'], 3)
+        self.assertEqual(context['low_stock_products'], 2)
+        self.assertEqual(context['total_sales'], 4)
+        self.assertEqual(context['total_revenue'], Decimal('906.50'))
+        self.assertEqual(context['period_units'], 8)
+        self.assertEqual(context['period_revenue'], Decimal('906.50'))
+        self.assertEqual(
+            [(p.id, p.total_sold) for p in context['top_products']],
+            [(self.case.id, 3), (self.cable.id, 3), (self.phone.id, 2)],
+        )
+
+    def test_recent_orders_are_the_vendors_paid_items(self):
+        recent = list(self.dashboard().context['recent_orders'])
+        self.assertEqual(len(recent), 4)
+        self.assertTrue(all(item.product.vendor_id == self.vendor.id and item.order.paid for item in recent))
+        self.assertEqual(recent[0].order, self.paid[-1])
 
-# Create your tests here.
+    def test_cancelled_orders_leave_the_totals(self):
+        order = Order.objects.get(id=self.paid[1].id)
+        order.status = 'cancelled'
+        order.save()
+        context = self.dashboard().context
+        self.assertEqual(context['period_units'], 5)
+        self.assertEqual(context['period_revenue'], Decimal('876.50'))
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'shop'
@@ -12,4 +12,5 @@ urlpatterns = [
     path('dashboard/delete-product/<int:product_id>/', views.delete_product, name='delete_product'),
     path('vendor/<int:vendor_id>/', views.vendor_storefront, name='vendor_storefront'),
     path('dashboard/edit/', views.edit_vendor_info, name='edit_vendor_info'),
+    re_path(r'^dashboard/export/(?P<dataset>orders|products)\.(?P<fmt>csv|jsonl)$', views.vendor_export, name='vendor_export'),
 ]
\ No newline at end of file
@@ -1,12 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Sum
-from django.db import models
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from decimal import Decimal
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib import messages
+from urllib.parse import urlencode
 
-from .models import Product, Category, Review, Vendor
+from .models import Product, Review, Vendor
 from .forms import ProductForm, ReviewForm, VendorEditForm
+from .search import search_products
+from .pagination import PRODUCT_SORTS, CursorPaginator, approximate_count
+from .facets import build_facets, facet_data, price_bucket_filter
+from . import exports, queries, related
+from orders import recommendations, sales
 from orders.models import OrderItem
 
 def vendor_required(function):
@@ -19,23 +27,23 @@ def vendor_required(function):
 
 def vendor_storefront(request, vendor_id):
     vendor = get_object_or_404(Vendor, id=vendor_id)
-    products = Product.objects.filter(vendor=vendor).order_by('-created_at')
+    products_list = queries.storefront_products(vendor)
     
     # Filter and sort options
     sort_by = request.GET.get('sort', 'featured')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    else:  # featured or default
-        products = products.order_by('-is_featured', '-created_at')
+    ordering = PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS['featured'])
+
+    paginator = CursorPaginator(products_list, ordering, per_page=queries.STOREFRONT_PAGE_SIZE)
+    products = paginator.page(request.GET.get('after'))
+    total_products, total_is_estimate = approximate_count(products_list)
     
     context = {
         'vendor': vendor,
         'products': products,
         'sort_by': sort_by,
+        'total_products': total_products,
+        'total_is_estimate': total_is_estimate,
+        'filter_query': urlencode({'sort': sort_by}),
     }
     return render(request, 'shop/vendor_storefront.html', context)
 
@@ -43,47 +51,53 @@ def vendor_storefront(request, vendor_id):
 @vendor_required
 def vendor_dashboard(request):
     vendor = request.user.vendor
-    order_items = OrderItem.objects.filter(product__vendor=vendor).order_by('-order__created_at')
-    products = vendor.products.all()
+    products = vendor.products.select_related('category')
+    sold = queries.sold_items(vendor)
     
-    # Calculate dashboard statistics
-    total_products = products.count()
-    total_sales = order_items.filter(order__paid=True).count()
-    total_revenue = sum(item.get_total_price() for item in order_items.filter(order__paid=True))
-    low_stock_products = products.filter(stock_quantity__lte=5).count()
+    # Dashboard statistics, counted and summed by the database in two queries
+    stats = products.aggregate(
+        total_products=Count('id'),
+        low_stock_products=Count('id', filter=Q(stock_quantity__lte=5)),
+    )
+    stats.update(sold.aggregate(
+        total_sales=Count('id'),
+        total_revenue=Coalesce(
+            Sum(F('price') * F('quantity')), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    ))
     
     # Recent orders (last 10)
-    recent_orders = order_items.filter(order__paid=True)[:10]
+    recent_orders = queries.recent_sold_items(vendor)
     
-    # Top selling products
-    top_products = products.annotate(
-        total_sold=Sum('order_items__quantity', filter=models.Q(order_items__order__paid=True))
-    ).filter(total_sold__isnull=False).order_by('-total_sold')[:5]
+    # Sales chart and top sellers for the chosen period, read from the daily rollup
+    days = request.GET.get('days', '')
+    days = int(days) if days.isdigit() and int(days) in sales.CHART_PERIODS else sales.CHART_PERIODS[0]
+    chart = sales.chart(vendor, days)
+    top_products = sales.top_products(vendor, days)
 
     context = {
         'vendor': vendor,
-        'order_items': order_items,
         'products': products,
-        'total_products': total_products,
-        'total_sales': total_sales,
-        'total_revenue': total_revenue,
-        'low_stock_products': low_stock_products,
         'recent_orders': recent_orders,
         'top_products': top_products,
+        'chart': chart,
+        'chart_days': days,
+        'chart_periods': sales.CHART_PERIODS,
+        'period_units': sum(bar['units'] for bar in chart),
+        'period_revenue': sum((bar['revenue'] for bar in chart), 0),
+        **stats,
     }
     return render(request, 'shop/vendor_dashboard.html', context)
 
 def product_detail(request, slug):
     product = get_object_or_404(Product, slug=slug)
-    reviews = product.reviews.all()
+    reviews = product.reviews.select_related('user')
     new_review = None
     user_can_review = False
     
-    related_products = Product.objects.filter(
-        category=product.category
-    ).exclude(
-        Q(id=product.id)
-    ).order_by('?')[:4]
+    related_products = related.related_products(product)
+    also_bought = recommendations.for_product(product)
     
     
     if request.user.is_authenticated:
@@ -109,7 +123,8 @@ def product_detail(request, slug):
         'reviews': reviews,
         'review_form': review_form,
         'user_can_review': user_can_review,
-        'related_products': related_products,        
+        'related_products': related_products,
+        'also_bought': also_bought,
     }
     return render(request, 'shop/product_detail.html', context)
 
@@ -150,55 +165,60 @@ def delete_product(request, product_id):
     return render(request, 'shop/delete_confirm.html', {'product': product})
 
 def shop_view(request):
-    products_list = Product.objects.select_related('vendor', 'category').all()
-    categories = Category.objects.all()
+    products_list = queries.catalog_products()
     selected_category_slug = request.GET.get('category')
     query = request.GET.get('q')
-    sort_by = request.GET.get('sort', 'featured')
+    sort_by = request.GET.get('sort', 'relevance' if query else 'featured')
+    price = request.GET.get('price')
+    price_filter = price_bucket_filter(price)
+    try:
+        selected_vendor_id = int(request.GET['vendor'])
+    except (KeyError, ValueError):
+        selected_vendor_id = None
+
+    if query:
+        products_list = search_products(products_list, query)
+
+    filters = {
+        'sort': sort_by,
+        'q': query or None,
+        'category': selected_category_slug or None,
+        'vendor': selected_vendor_id,
+        'price': price if price_filter else None,
+    }
+    # Facets are counted over the search results only; category, vendor and
+    # price selections are applied to the cached counts in Python
+    facets = build_facets(facet_data(products_list, signature=query or ''), filters)
 
     if selected_category_slug:
         products_list = products_list.filter(category__slug=selected_category_slug)
-    
-    if query:
-        products_list = products_list.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(vendor__shop_name__icontains=query)
-        )
+    if selected_vendor_id is not None:
+        products_list = products_list.filter(vendor_id=selected_vendor_id)
+    if price_filter:
+        products_list = products_list.filter(**price_filter)
 
     # Apply sorting
-    if sort_by == 'price_low':
-        products_list = products_list.order_by('price')
-    elif sort_by == 'price_high':
-        products_list = products_list.order_by('-price')
-    elif sort_by == 'newest':
-        products_list = products_list.order_by('-created_at')
-    elif sort_by == 'name':
-        products_list = products_list.order_by('name')
-    else:  # featured or default
-        products_list = products_list.order_by('-is_featured', '-created_at')
+    if sort_by == 'relevance' and query:
+        ordering = ('-search_rank', '-created_at', '-id')
+    else:
+        ordering = PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS['featured'])
+
+    paginator = CursorPaginator(products_list, ordering, per_page=queries.SHOP_PAGE_SIZE)
+    products = paginator.page(request.GET.get('after'))
 
     # Calculate statistics
-    total_products = products_list.count()
-    featured_products = products_list.filter(is_featured=True)[:4]
-    
-    paginator = Paginator(products_list, 12)  # Increased from 8 to 12
-    page_number = request.GET.get('page')
-    try:
-        products = paginator.page(page_number)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages)
+    total_products = facets['total']
+    featured_products = products_list.filter(is_featured=True).order_by(*PRODUCT_SORTS['featured'])[:4]
 
     context = {
         'products': products,
-        'categories': categories,
+        'facets': facets,
         'selected_category_slug': selected_category_slug,
         'query': query,
         'sort_by': sort_by,
         'total_products': total_products,
         'featured_products': featured_products,
+        'filter_query': urlencode({k: v for k, v in filters.items() if v is not None}),
     }
     return render(request, 'shop/shop_view.html', context)
 
@@ -216,4 +236,15 @@ def edit_vendor_info(request):
     else:
         form = VendorEditForm(instance=vendor)
 
-    return render(request, 'shop/vendor_info_edit.html', {'form': form})
\ No newline at end of file
+    return render(request, 'shop/vendor_info_edit.html', {'form': form})
+
+@login_required
+@vendor_required
+def vendor_export(request, dataset, fmt):
+    vendor = request.user.vendor
+    response = StreamingHttpResponse(exports.stream(vendor, dataset, fmt), content_type=exports.FORMATS[fmt])
+    filename = f'{vendor.id}-{dataset}-{timezone.localdate():%Y%m%d}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Don't let a proxy hold the stream back until it has the whole file
+    response['X-Accel-Buffering'] = 'no'
+    return response
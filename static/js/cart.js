@@ -0,0 +1,61 @@
+// Submit cart forms (add / update / remove) in the background and patch the
+// page from the JSON reply instead of following the redirect and re-rendering.
+(function () {
+  const TOAST_STYLES = {
+    success: 'bg-green-50 border border-green-200 text-green-800',
+    info: 'bg-blue-50 border border-blue-200 text-blue-800',
+    warning: 'bg-yellow-50 border border-yellow-200 text-yellow-800',
+    error: 'bg-red-50 border border-red-200 text-red-800',
+  };
+
+  function showMessage(level, message) {
+    if (!message) return;
+    const toast = document.createElement('div');
+    toast.className = 'fixed top-20 right-4 z-50 w-80 shadow-lg rounded-lg p-4 text-sm font-medium ' +
+      (TOAST_STYLES[level] || TOAST_STYLES.info);
+    toast.textContent = message;
+    document.body.appendChild(toast);
+    setTimeout(() => toast.remove(), 5000);
+  }
+
+  function applyState(form, data) {
+    document.querySelectorAll('[data-cart-badge]').forEach((el) => { el.innerHTML = data.badge; });
+    document.querySelectorAll('[data-cart-total]').forEach((el) => { el.textContent = data.total; });
+
+    const line = form.closest('[data-cart-line]');
+    if (!line) return;
+    if (!data.line) {
+      line.remove();
+      if (data.count === 0) window.location.reload();
+      return;
+    }
+    line.querySelectorAll('[data-line-total]').forEach((el) => { el.textContent = data.line.total_price; });
+  }
+
+  document.addEventListener('submit', async (event) => {
+    const form = event.target.closest('form[data-cart-form]');
+    if (!form) return;
+    event.preventDefault();
+
+    let response;
+    try {
+      response = await fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        credentials: 'same-origin',
+        headers: { 'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
+      });
+    } catch (error) {
+      form.submit();
+      return;
+    }
+    if (!(response.headers.get('Content-Type') || '').includes('application/json')) {
+      form.submit();
+      return;
+    }
+
+    const data = await response.json();
+    if (data.badge !== undefined) applyState(form, data);
+    showMessage(data.level, data.message);
+  });
+})();